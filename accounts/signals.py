@@ -1,5 +1,6 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from hospital_project.images import build_image_variants
 from .models import User
 from doctors.models import DoctorProfile
 from patients.models import PatientProfile
@@ -24,3 +25,6 @@ def save_user_profile(sender, instance, **kwargs):
     elif instance.role == User.Role.PATIENT:
         if hasattr(instance, 'patient_profile'):
             instance.patient_profile.save()
+
+
+post_save.connect(build_image_variants, sender=User)
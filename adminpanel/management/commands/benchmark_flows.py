@@ -0,0 +1,361 @@
+import json
+import math
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+import billing.views
+from accounts.models import User
+from billing.gateway import make_client
+from billing.razorpay_standin import RazorpayStandIn
+from doctors.models import DoctorProfile
+from pharmacy.models import Medicine
+
+
+FLOWS = ['booking', 'checkout']
+ORDER_ID = re.compile(r'order_[0-9a-zA-Z]{14}')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(latencies, duration):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'rps': round(len(latencies) / duration, 2) if duration else None,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class FlowFailed(Exception):
+    pass
+
+
+class Recorder:
+    """Thread-safe collection of per-request and per-flow measurements."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.steps = defaultdict(lambda: {'latencies': [], 'queries': [], 'errors': 0})
+        self.flows = defaultdict(lambda: {'latencies': [], 'failures': defaultdict(int)})
+
+    def request(self, step, elapsed, queries, ok):
+        with self.lock:
+            record = self.steps[step]
+            record['latencies'].append(elapsed)
+            record['queries'].append(queries)
+            record['errors'] += not ok
+
+    def flow(self, name, elapsed, failure=None):
+        with self.lock:
+            if failure:
+                self.flows[name]['failures'][failure] += 1
+            else:
+                self.flows[name]['latencies'].append(elapsed)
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries one request runs on this thread."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class VirtualUser:
+    """One patient driving the flows through the Django test client."""
+
+    def __init__(self, user, password, host, recorder, standin, doctors, medicine_ids, rng):
+        self.user = user
+        self.password = password
+        self.host = host
+        self.recorder = recorder
+        self.standin = standin
+        self.doctors = doctors
+        self.medicine_ids = medicine_ids
+        self.rng = rng
+        self.client = Client(HTTP_HOST=host)
+
+    def request(self, step, method, url, data=None, expect=(200, 302)):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = getattr(self.client, method)(url, data or {})
+        elapsed = time.perf_counter() - started
+        ok = response.status_code in expect
+        self.recorder.request(step, elapsed, counter.count, ok)
+        if not ok:
+            raise FlowFailed(f'{step} returned {response.status_code}')
+        return response
+
+    def redirect_target(self, response):
+        if response.status_code != 302:
+            return None
+        return resolve(response['Location'].split('?')[0])
+
+    def login(self, flow):
+        self.client = Client(HTTP_HOST=self.host)
+        self.request(f'{flow}.login_form', 'get', reverse('accounts:login'))
+        response = self.request(f'{flow}.login', 'post', reverse('accounts:login'), {
+            'username': self.user.username,
+            'password': self.password,
+        })
+        if response.status_code != 302:
+            raise FlowFailed('login rejected')
+
+    def pay(self, flow, order_type, order_id):
+        response = self.request(
+            f'{flow}.payment', 'get',
+            reverse('billing:payment', kwargs={'order_type': order_type, 'order_id': order_id})
+        )
+        match = ORDER_ID.search(response.content.decode())
+        if response.status_code != 200 or not match:
+            raise FlowFailed('no gateway order')
+        payment_id, signature = self.standin.pay(match.group())
+        response = self.request(f'{flow}.verify', 'post', reverse('billing:verify_payment'), {
+            'razorpay_order_id': match.group(),
+            'razorpay_payment_id': payment_id,
+            'razorpay_signature': signature,
+        })
+        target = self.redirect_target(response)
+        if not target or target.view_name != 'billing:payment_success':
+            raise FlowFailed('payment not verified')
+
+    def booking(self):
+        """login -> book a free slot -> pay."""
+        self.login('booking')
+        self.request('booking.form', 'get', reverse('patients:book_appointment'))
+
+        doctor_id, department_id = self.rng.choice(self.doctors)
+        start = timezone.localdate() + timedelta(days=1)
+        response = self.request('booking.free_slots', 'get', reverse('appointments:free_slots'), {
+            'doctor_id': doctor_id,
+            'start': start.isoformat(),
+            'days': 14,
+        })
+        free = [
+            (day, slot)
+            for doctor in json.loads(response.content)['doctors']
+            for day, slots in doctor['slots'].items()
+            for slot in slots
+        ]
+        if not free:
+            raise FlowFailed('no free slot')
+        day, slot = self.rng.choice(free)
+
+        response = self.request('booking.book', 'post', reverse('patients:book_appointment'), {
+            'department': department_id,
+            'doctor': doctor_id,
+            'scheduled_date': day,
+            'scheduled_time': slot,
+            'reason': 'Benchmark visit',
+        })
+        target = self.redirect_target(response)
+        if not target or target.view_name != 'patients:appointment_detail':
+            raise FlowFailed('slot taken')
+        self.pay('booking', 'appointment', target.kwargs['pk'])
+
+    def checkout(self):
+        """browse -> add to cart -> checkout -> pay."""
+        if '_auth_user_id' not in self.client.session:
+            self.login('checkout')
+        self.request('checkout.browse', 'get', reverse('pharmacy:medicine_list'))
+        for medicine_id in self.rng.sample(self.medicine_ids, min(len(self.medicine_ids), self.rng.randint(1, 3))):
+            self.request('checkout.detail', 'get', reverse('pharmacy:medicine_detail', args=[medicine_id]))
+            self.request('checkout.add_to_cart', 'post', reverse('pharmacy:add_to_cart', args=[medicine_id]), {
+                'quantity': 1,
+            })
+        self.request('checkout.cart', 'get', reverse('pharmacy:view_cart'))
+        self.request('checkout.form', 'get', reverse('pharmacy:checkout'))
+        response = self.request('checkout.place_order', 'post', reverse('pharmacy:checkout'), {
+            'shipping_address': '1 Benchmark Street',
+            'notes': '',
+        })
+        target = self.redirect_target(response)
+        if not target or target.view_name != 'billing:payment':
+            raise FlowFailed('order not placed')
+        self.pay('checkout', 'pharmacy', target.kwargs['order_id'])
+
+    def run(self, flows, iterations):
+        try:
+            for _ in range(iterations):
+                for name in flows:
+                    started = time.perf_counter()
+                    try:
+                        getattr(self, name)()
+                    except FlowFailed as e:
+                        self.recorder.flow(name, None, str(e))
+                    except Exception as e:
+                        self.recorder.flow(name, None, type(e).__name__)
+                    else:
+                        self.recorder.flow(name, time.perf_counter() - started)
+        finally:
+            connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent virtual patients through login -> book -> pay and "
+        "browse -> cart -> checkout -> pay against seeded data (see "
+        "seed_scale), with a local Razorpay stand-in, and report latency "
+        "percentiles, throughput and queries per request as JSON. Writes to "
+        "the configured database, so point it at a scratch copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users')
+        parser.add_argument('--iterations', type=int, default=5, help='Runs of each flow per user')
+        parser.add_argument('--flows', default=','.join(FLOWS), help='Comma-separated subset of: ' + ', '.join(FLOWS))
+        parser.add_argument('--prefix', default='seed', help='Username prefix used by seed_scale')
+        parser.add_argument('--password', default='carepoint123')
+        parser.add_argument('--gateway-latency', type=float, default=0.0, help='Seconds the stand-in waits per API call')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown against --baseline')
+
+    def handle(self, *args, **options):
+        flows = [name.strip() for name in options['flows'].split(',') if name.strip()]
+        unknown = set(flows) - set(FLOWS)
+        if unknown:
+            raise CommandError(f"Unknown flows: {', '.join(sorted(unknown))}")
+
+        users = list(User.objects.filter(
+            role=User.Role.PATIENT,
+            username__startswith=f"{options['prefix']}-patient-",
+            is_active=True
+        ).select_related('patient_profile').order_by('pk')[:options['users']])
+        if len(users) < options['users']:
+            raise CommandError(f"Need {options['users']} '{options['prefix']}-patient-*' accounts; run seed_scale first.")
+        doctors = list(DoctorProfile.objects.filter(
+            user__is_approved=True, user__is_active=True, department__isnull=False
+        ).values_list('pk', 'department_id'))
+        medicine_ids = list(Medicine.objects.filter(is_active=True, stock__gte=100).values_list('pk', flat=True)[:500])
+        if not doctors or not medicine_ids:
+            raise CommandError("Need approved doctors and stocked medicines; run seed_scale first.")
+
+        key_id = settings.RAZORPAY_KEY_ID or 'rzp_test_benchmark'
+        key_secret = settings.RAZORPAY_KEY_SECRET or 'benchmark-secret'
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        recorder = Recorder()
+
+        live_client = billing.views.razorpay_client
+        with RazorpayStandIn(key_secret, latency=options['gateway_latency']) as standin:
+            billing.views.razorpay_client = make_client(base_url=standin.url, auth=(key_id, key_secret))
+            try:
+                virtual_users = [
+                    VirtualUser(
+                        user, options['password'], host, recorder, standin,
+                        doctors, medicine_ids, random.Random(options['seed'] * 1000 + i)
+                    )
+                    for i, user in enumerate(users)
+                ]
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=len(virtual_users)) as pool:
+                    for future in [pool.submit(vu.run, flows, options['iterations']) for vu in virtual_users]:
+                        future.result()
+                duration = time.perf_counter() - started
+            finally:
+                billing.views.razorpay_client = live_client
+
+        report = self.report(recorder, duration, options, flows)
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stdout.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['tolerance'])
+
+    def report(self, recorder, duration, options, flows):
+        steps = {}
+        for step, record in sorted(recorder.steps.items()):
+            queries = record['queries']
+            steps[step] = {
+                **summarize(record['latencies'], duration),
+                'errors': record['errors'],
+                'queries_mean': round(sum(queries) / len(queries), 2),
+                'queries_max': max(queries),
+            }
+        total_requests = sum(step['count'] for step in steps.values())
+        return {
+            'commit': self.commit(),
+            'database': connection.vendor,
+            'config': {
+                'users': options['users'],
+                'iterations': options['iterations'],
+                'flows': flows,
+                'gateway_latency': options['gateway_latency'],
+                'seed': options['seed'],
+            },
+            'duration_s': round(duration, 2),
+            'requests': total_requests,
+            'rps': round(total_requests / duration, 2),
+            'flows': {
+                name: {
+                    **summarize(record['latencies'], duration),
+                    'failures': dict(record['failures']),
+                }
+                for name, record in sorted(recorder.flows.items())
+            },
+            'steps': steps,
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, report, baseline_path, tolerance):
+        with open(baseline_path) as handle:
+            baseline = json.load(handle)
+
+        regressions = []
+        for step, current in report['steps'].items():
+            previous = baseline.get('steps', {}).get(step)
+            if not previous:
+                continue
+            if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{step}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+            if current['queries_mean'] > previous['queries_mean'] + 0.5:
+                regressions.append(f"{step}: queries {previous['queries_mean']} -> {current['queries_mean']}")
+
+        if regressions:
+            raise CommandError(
+                f"Regressions against {baseline.get('commit') or baseline_path}:\n" + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline.get('commit') or baseline_path}."))
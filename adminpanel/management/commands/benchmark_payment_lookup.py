@@ -0,0 +1,156 @@
+import json
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+import billing.views
+from appointments.models import Appointment
+from billing.gateway import make_client
+from billing.models import Invoice
+from billing.razorpay_standin import checkout_signature
+from patients.models import PatientProfile
+from .benchmark_flows import summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Grow the invoice table through the given sizes (e.g. up to 1000000) and "
+        "time payment verification, the webhook's invoice lookup and the "
+        "patient invoice list at each size, to show whether they stay flat. "
+        "Adds filler invoices to the configured database, so point it at a "
+        "scratch copy with seed_scale data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated invoice counts')
+        parser.add_argument('--samples', type=int, default=100, help='Timed requests per step and size')
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        self.rng = random.Random(options['seed'])
+        appointment = Appointment.objects.select_related('patient__user').filter(patient__user__is_active=True).first()
+        patient_ids = list(PatientProfile.objects.values_list('pk', flat=True))
+        if appointment is None:
+            raise CommandError("Need at least one appointment; run seed_scale first.")
+
+        key_id = settings.RAZORPAY_KEY_ID or 'rzp_test_benchmark'
+        key_secret = settings.RAZORPAY_KEY_SECRET or 'benchmark-secret'
+        client = Client()
+        client.force_login(appointment.patient.user)
+        # Heavy invoice history for the patient whose list is timed
+        heavy_patient = appointment.patient_id
+
+        live_client = billing.views.razorpay_client
+        billing.views.razorpay_client = make_client(auth=(key_id, key_secret))
+        results = []
+        try:
+            for size in sizes:
+                added = self.fill(size, patient_ids, heavy_patient, options['batch_size'])
+                self.stdout.write(f"{size} invoices (+{added})")
+                results.append({
+                    'invoices': Invoice.objects.count(),
+                    'verify_payment': self.time_verify(client, appointment, key_secret, options['samples']),
+                    'webhook_lookup': self.time_lookup(options['samples']),
+                    'invoice_list': self.time_list(client, options['samples']),
+                    'lookup_plan': self.plan(),
+                })
+        finally:
+            billing.views.razorpay_client = live_client
+
+        output = json.dumps({'database': connection.vendor, 'sizes': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stdout.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def fill(self, size, patient_ids, heavy_patient, batch_size):
+        """Add paid filler invoices until the table holds ``size`` rows."""
+        missing = size - Invoice.objects.count()
+        now = timezone.now()
+        added = 0
+        while added < missing:
+            count = min(batch_size, missing - added)
+            with transaction.atomic():
+                Invoice.objects.bulk_create([
+                    Invoice(
+                        # One in a hundred lands on the patient whose list is timed
+                        patient_id=heavy_patient if self.rng.random() < 0.01 else self.rng.choice(patient_ids),
+                        invoice_type=Invoice.InvoiceType.PHARMACY,
+                        amount=self.rng.randint(100, 5000),
+                        status=Invoice.Status.PAID,
+                        # Not from the seeded rng: the ids are unique across runs and seed_scale
+                        razorpay_order_id=f'order_{uuid.uuid4().hex[:14]}',
+                        razorpay_payment_id=f'pay_{uuid.uuid4().hex[:14]}',
+                        paid_at=now - timedelta(minutes=self.rng.randint(0, 525600)),
+                    )
+                    for _ in range(count)
+                ])
+            added += count
+        return max(added, 0)
+
+    def time_verify(self, client, appointment, key_secret, samples):
+        invoices = Invoice.objects.bulk_create([
+            Invoice(
+                patient_id=appointment.patient_id,
+                invoice_type=Invoice.InvoiceType.APPOINTMENT,
+                appointment=appointment,
+                amount=100,
+                razorpay_order_id=f'order_{uuid.uuid4().hex[:14]}',
+            )
+            for _ in range(samples)
+        ])
+        latencies = []
+        for invoice in invoices:
+            payment_id = f'pay_{uuid.uuid4().hex[:14]}'
+            started = time.perf_counter()
+            response = client.post('/billing/verify/', {
+                'razorpay_order_id': invoice.razorpay_order_id,
+                'razorpay_payment_id': payment_id,
+                'razorpay_signature': checkout_signature(invoice.razorpay_order_id, payment_id, key_secret),
+            })
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 302 or 'success' not in response['Location']:
+                raise CommandError(f"Verification failed for {invoice.razorpay_order_id}: {response.status_code}")
+        return self.summary(latencies)
+
+    def time_lookup(self, samples):
+        order_ids = list(
+            Invoice.objects.filter(razorpay_order_id__isnull=False)
+            .order_by('?').values_list('razorpay_order_id', flat=True)[:samples]
+        )
+        latencies = []
+        for order_id in order_ids:
+            started = time.perf_counter()
+            with transaction.atomic():
+                Invoice.objects.select_for_update().filter(razorpay_order_id=order_id).first()
+            latencies.append(time.perf_counter() - started)
+        return self.summary(latencies)
+
+    def time_list(self, client, samples):
+        latencies = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            client.get('/billing/invoices/')
+            latencies.append(time.perf_counter() - started)
+        return self.summary(latencies)
+
+    def summary(self, latencies):
+        summary = summarize(latencies, None)
+        del summary['rps']
+        return summary
+
+    def plan(self):
+        queryset = Invoice.objects.filter(razorpay_order_id='order_plan')
+        return queryset.explain()
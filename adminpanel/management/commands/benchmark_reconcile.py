@@ -0,0 +1,146 @@
+import json
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from billing.gateway import make_client
+from billing.models import Invoice
+from billing.razorpay_standin import RazorpayStandIn
+from billing.reconcile import reconcile
+from patients.models import PatientProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Run reconcile_payments over a day of invoices against the local "
+        "Razorpay stand-in: most captures recorded, some missed, some paid on "
+        "a replaced order, some with the wrong amount or no invoice at all. "
+        "Checks the outcome and reports how long the run took. Adds invoices "
+        "to the configured database, so point it at a scratch copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=100000)
+        parser.add_argument('--missed', type=float, default=0.05, help='Share of captures never recorded')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        patient_ids = list(PatientProfile.objects.values_list('pk', flat=True))
+        if not patient_ids:
+            raise CommandError("Need patients; run seed_scale first.")
+
+        key_id, key_secret = 'rzp_test_benchmark', 'benchmark-secret'
+        until = timezone.now()
+        since = until - timedelta(days=1)
+        # Paid invoices already in the window (e.g. from seed_scale) have no gateway payment
+        unmatched = Invoice.objects.filter(
+            status=Invoice.Status.PAID, paid_at__gte=since, paid_at__lt=until, razorpay_payment_id__isnull=False
+        ).count()
+        with RazorpayStandIn(key_secret) as standin:
+            started = time.perf_counter()
+            expected = self.populate(standin, rng, patient_ids, since, options)
+            expected['kinds']['not_captured'] += unmatched
+            populate_seconds = time.perf_counter() - started
+
+            client = make_client(base_url=standin.url, auth=(key_id, key_secret))
+            calls = standin.calls
+            started = time.perf_counter()
+            report = reconcile(client, since, until)
+            seconds = time.perf_counter() - started
+            calls = standin.calls - calls
+            # A second run finds nothing left to fix
+            rerun = reconcile(client, since, until)
+
+        kinds = Counter(issue['kind'] for issue in report['discrepancies'])
+        fixed = {issue['invoice_id'] for issue in report['discrepancies'] if issue['fixed']}
+        problems = []
+        if kinds != expected['kinds']:
+            problems.append(f"expected {dict(expected['kinds'])}, found {dict(kinds)}")
+        if fixed != expected['fixed']:
+            problems.append(f"{len(fixed ^ expected['fixed'])} invoices fixed wrongly or not at all")
+        if Invoice.objects.filter(pk__in=expected['fixed']).exclude(status=Invoice.Status.PAID).exists():
+            problems.append("a fixed invoice is not paid")
+        if rerun['fixed']:
+            problems.append(f"second run fixed {rerun['fixed']} more")
+
+        output = json.dumps({
+            'database': connection.vendor,
+            'invoices': options['invoices'],
+            'captured': report['captured'],
+            'fixed': report['fixed'],
+            'discrepancies': dict(kinds),
+            'api_calls': calls,
+            'populate_seconds': round(populate_seconds, 2),
+            'reconcile_seconds': round(seconds, 2),
+            'problems': problems,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stdout.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(output)
+        if problems:
+            raise CommandError('; '.join(problems))
+
+    def populate(self, standin, rng, patient_ids, since, options):
+        """Create the invoices and gateway payments; returns what reconcile should find."""
+        count = options['invoices']
+        span = int(timezone.now().timestamp() - since.timestamp()) - 60
+        kinds = Counter()
+        fixed_orders = set()
+        invoices = []
+        for _ in range(count):
+            amount = rng.randint(100, 5000)
+            order = standin.create_order({'amount': amount * 100, 'notes': {}})
+            paid_at = since + timedelta(seconds=rng.randint(60, span))
+            invoice = Invoice(
+                patient_id=rng.choice(patient_ids),
+                invoice_type=Invoice.InvoiceType.PHARMACY,
+                amount=amount,
+                razorpay_order_id=order['id'],
+                razorpay_order_amount=order['amount'],
+            )
+            payment_id, signature = standin.pay(order['id'], created_at=int(paid_at.timestamp()) - 5)
+            roll = rng.random()
+            if roll < options['missed']:
+                kinds['missed_capture'] += 1
+                fixed_orders.add(order['id'])
+            elif roll < options['missed'] + 0.002:
+                # Paid on an order the invoice has since replaced
+                order['notes'] = {'invoice_id': None}
+                invoice.razorpay_order_id = standin.create_order({'amount': amount * 100})['id']
+                kinds['replaced_order'] += 1
+                fixed_orders.add(order['id'])
+            elif roll < options['missed'] + 0.003:
+                invoice.amount = amount + 1
+                kinds['amount_mismatch'] += 1
+            elif roll < options['missed'] + 0.004:
+                invoice.razorpay_order_id = None
+                kinds['unknown_order'] += 1
+            else:
+                invoice.status = Invoice.Status.PAID
+                invoice.razorpay_payment_id = payment_id
+                invoice.razorpay_signature = signature
+                invoice.paid_at = paid_at
+            invoices.append((invoice, order))
+
+        for start in range(0, count, options['batch_size']):
+            batch = invoices[start:start + options['batch_size']]
+            with transaction.atomic():
+                Invoice.objects.bulk_create([invoice for invoice, order in batch])
+            for invoice, order in batch:
+                if 'invoice_id' in order['notes']:
+                    order['notes']['invoice_id'] = invoice.pk
+        fixed = {
+            invoice.pk for invoice, order in invoices if order['id'] in fixed_orders
+        }
+        return {'kinds': +kinds, 'fixed': fixed}
@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hospital_project.images import (
+    get_pool, has_derivatives, image_fields, read_original, render_derivatives, store_derivatives
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the resized WebP/JPEG variants of every uploaded medicine, "
+        "department and profile image that does not have them yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that already exist')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, field in image_fields():
+            names.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True)
+            )
+        if not options['force']:
+            names = {name for name in names if not has_derivatives(name)}
+
+        started = time.perf_counter()
+        self.built = self.failed = 0
+        # Bounded so only a few originals are held in memory at once
+        in_flight = {}
+        limit = max(settings.IMAGE_WORKERS, 1) * 2
+        for name in sorted(names):
+            try:
+                data = read_original(name)
+            except OSError as e:
+                self.report_failure(name, e)
+                continue
+            if not settings.IMAGE_WORKERS:
+                self.store(name, lambda: render_derivatives(data))
+                continue
+            in_flight[get_pool().submit(render_derivatives, data)] = name
+            if len(in_flight) >= limit:
+                self.collect(in_flight, FIRST_COMPLETED)
+        self.collect(in_flight)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built variants for {self.built} images ({self.failed} failed) "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def collect(self, in_flight, return_when='ALL_COMPLETED'):
+        done, _ = wait(in_flight, return_when=return_when)
+        for future in done:
+            self.store(in_flight.pop(future), future.result)
+
+    def store(self, name, render):
+        try:
+            store_derivatives(name, render())
+            self.built += 1
+        except Exception as e:
+            self.report_failure(name, e)
+
+    def report_failure(self, name, error):
+        self.stderr.write(f"{name}: {error}")
+        self.failed += 1
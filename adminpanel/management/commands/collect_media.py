@@ -0,0 +1,129 @@
+import posixpath
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from hospital_project.images import derived_storage, image_fields
+from hospital_project.storage import BLOB_DIR, is_blob
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete media blobs, and their resized variants, that no user, "
+        "medicine or department references any more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--adopt', action='store_true',
+            help='First move files saved before content-addressed storage into blobs, '
+                 'then collect the old upload folders too'
+        )
+        parser.add_argument(
+            '--grace', type=int, default=3600,
+            help='Keep unreferenced files younger than this many seconds (default 3600), '
+                 'so uploads whose rows are not committed yet survive'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report without changing anything')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        started = time.perf_counter()
+        if options['adopt']:
+            self.adopt()
+
+        referenced = self.referenced()
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        folders = [BLOB_DIR]
+        if options['adopt']:
+            folders += sorted({
+                model._meta.get_field(field).upload_to.rstrip('/')
+                for model, field in image_fields()
+            })
+
+        removed = freed = 0
+        for folder in folders:
+            for name in self.walk(default_storage, folder):
+                # Includes uploads a crashed process left half-written
+                if name not in referenced:
+                    size = self.remove(default_storage, name, cutoff)
+                    if size is not None:
+                        removed += 1
+                        freed += size
+
+        # Variants live under derived/<original without extension>/
+        stems = {posixpath.splitext(name)[0] for name in referenced}
+        storage = derived_storage()
+        for name in self.walk(storage, 'derived'):
+            if posixpath.dirname(name)[len('derived/'):] not in stems:
+                size = self.remove(storage, name, cutoff)
+                if size is not None:
+                    removed += 1
+                    freed += size
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would remove' if self.dry_run else 'Removed'} {removed} files "
+            f"({freed / 1024:.0f} KB) in {time.perf_counter() - started:.1f}s; "
+            f"{len(referenced)} files are referenced."
+        ))
+
+    def referenced(self):
+        names = set()
+        for model, field in image_fields():
+            names.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True)
+            )
+        return names
+
+    def adopt(self):
+        """Store every pre-existing upload as a blob and repoint its rows."""
+        rows = defaultdict(list)
+        for model, field in image_fields():
+            for name in model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}) \
+                    .values_list(field, flat=True).distinct():
+                if not is_blob(name):
+                    rows[name].append((model, field))
+
+        adopted = 0
+        for name, fields in sorted(rows.items()):
+            if not default_storage.exists(name):
+                self.stderr.write(f"{name}: missing, left as it is")
+                continue
+            if self.dry_run:
+                adopted += 1
+                continue
+            with default_storage.open(name, 'rb') as original:
+                blob = default_storage.save(name, original)
+            for model, field in fields:
+                # update() rather than save(): nothing else about the rows changes
+                model.objects.filter(**{field: name}).update(**{field: blob})
+            adopted += 1
+        self.stdout.write(f"{'Would adopt' if self.dry_run else 'Adopted'} {adopted} files into {BLOB_DIR}/.")
+        if adopted and not self.dry_run:
+            self.stdout.write("Run build_image_derivatives to create their resized variants.")
+
+    def walk(self, storage, folder):
+        if not storage.exists(folder):
+            return
+        directories, files = storage.listdir(folder)
+        for name in files:
+            yield f'{folder}/{name}'
+        for directory in directories:
+            yield from self.walk(storage, f'{folder}/{directory}')
+
+    def remove(self, storage, name, cutoff):
+        """Delete ``name`` if it is older than ``cutoff``; returns its size."""
+        if storage.get_modified_time(name) > cutoff:
+            return None
+        size = storage.size(name)
+        if not self.dry_run:
+            if hasattr(storage, 'purge'):
+                storage.purge(name)
+            else:
+                storage.delete(name)
+        return size
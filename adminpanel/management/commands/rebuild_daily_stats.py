@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from adminpanel.rollups import local_date, rebuild
+from appointments.models import Appointment
+from billing.models import Invoice
+from pharmacy.models import PharmacyOrder
+
+
+class Command(BaseCommand):
+    help = "Recompute DailyStats rollups for a date range (default: all history)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day, YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        start = options['start'] or self.earliest_day()
+        end = options['end'] or timezone.localdate()
+        if start is None:
+            self.stdout.write("Nothing to rebuild.")
+            return
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+
+        # Appointments can be booked ahead, so cover them when no end is given
+        if not options['end']:
+            latest = Appointment.objects.order_by('-scheduled_datetime').values_list(
+                'scheduled_datetime', flat=True
+            ).first()
+            if latest and local_date(latest) > end:
+                end = local_date(latest)
+
+        for chunk_start, chunk_end, buckets in rebuild(start, end):
+            self.stdout.write(f"{chunk_start} .. {chunk_end}: {buckets} buckets")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt daily stats from {start} to {end}."))
+
+    def earliest_day(self):
+        candidates = [
+            Appointment.objects.aggregate(first=Min('scheduled_datetime'))['first'],
+            Invoice.objects.filter(status=Invoice.Status.PAID).aggregate(first=Min('paid_at'))['first'],
+            PharmacyOrder.objects.aggregate(first=Min('created_at'))['first'],
+        ]
+        candidates = [local_date(value) for value in candidates if value]
+        return min(candidates) if candidates else None
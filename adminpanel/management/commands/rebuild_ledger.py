@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from billing import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Post the ledger entries missing for settled invoices (e.g. ones "
+        "written in bulk) and recompute every LedgerBalance from the entries. "
+        "Run it when the site is quiet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--balances-only', action='store_true',
+            help='Only recompute the balances; post no entries'
+        )
+
+    def handle(self, *args, **options):
+        if not options['balances_only']:
+            self.stdout.write(f"Posted {ledger.post_missing()} missing entries.")
+        balances = ledger.rebuild_balances()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {balances} ledger balances."))
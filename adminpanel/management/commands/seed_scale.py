@@ -0,0 +1,385 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from accounts.models import User
+from adminpanel.rollups import rebuild
+from adminpanel.stats import invalidate_dashboard
+from appointments.models import Appointment, SlotReservation
+from appointments.slots import ACTIVE_STATUSES, slot_starts
+from billing import ledger
+from billing.models import Invoice
+from departments.models import Department
+from doctors.models import DoctorProfile, Prescription, PrescriptionItem
+from patients.models import PatientProfile
+from pharmacy.models import Cart, CartItem, Medicine, OrderItem, PharmacyOrder
+
+
+DEPARTMENTS = [
+    'Cardiology', 'Dermatology', 'ENT', 'Gastroenterology', 'General Medicine',
+    'Gynecology', 'Nephrology', 'Neurology', 'Oncology', 'Ophthalmology',
+    'Orthopedics', 'Pediatrics', 'Psychiatry', 'Pulmonology', 'Urology',
+]
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Arjun', 'Ananya', 'Diya', 'Ishaan', 'Kabir', 'Kavya',
+    'Meera', 'Nikhil', 'Priya', 'Rahul', 'Riya', 'Rohan', 'Saanvi', 'Vikram',
+]
+LAST_NAMES = [
+    'Agarwal', 'Bose', 'Das', 'Gupta', 'Iyer', 'Khan', 'Menon', 'Nair',
+    'Patel', 'Rao', 'Reddy', 'Shah', 'Sharma', 'Singh', 'Verma', 'Zaheer',
+]
+MEDICINES = [
+    'Paracetamol', 'Amoxicillin', 'Azithromycin', 'Cetirizine', 'Metformin',
+    'Atorvastatin', 'Amlodipine', 'Omeprazole', 'Pantoprazole', 'Ibuprofen',
+    'Losartan', 'Montelukast', 'Levothyroxine', 'Vitamin D3', 'Dolo',
+]
+MANUFACTURERS = ['Cipla', 'Sun Pharma', 'Lupin', "Dr. Reddy's", 'Mankind', 'Zydus']
+UNITS = ['strip', 'bottle', 'tube', 'box']
+DIAGNOSES = ['Viral fever', 'Hypertension', 'Type 2 diabetes', 'Migraine', 'Gastritis', 'Allergic rhinitis']
+
+# Appointment grid: 30-minute slots from 9:00 to 17:00
+DAY_OPENS = 9
+SLOTS_PER_DAY = 16
+
+PAID_ORDER_STATUSES = ['paid', 'processing', 'packed', 'shipped', 'completed']
+
+
+@contextmanager
+def keep_created_at(*models):
+    """Let bulk_create store the generated created_at values instead of now()."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic, realistically shaped data set for "
+        "performance work (e.g. --appointments 1000000). Rows are written "
+        "with bulk_create, so the per-row profile and slot signals do not "
+        "run; reservations, DailyStats and the revenue ledger are built in "
+        "bulk afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--appointments', type=int, default=100000)
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=20000)
+        parser.add_argument('--departments', type=int, default=len(DEPARTMENTS))
+        parser.add_argument('--medicines', type=int, default=2000)
+        parser.add_argument('--orders', type=int, help='Pharmacy orders (default: a fifth of --appointments)')
+        parser.add_argument('--carts', type=int, help='Patients with a non-empty cart (default: a tenth of --patients)')
+        parser.add_argument('--years', type=int, default=3, help='Years of appointment history')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed', help='Username prefix for generated accounts')
+        parser.add_argument('--password', default='carepoint123', help='Password for every generated account')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        # Anchored to local midnight so the same seed gives the same rows all day
+        self.today = timezone.localdate()
+        self.now = timezone.make_aware(datetime.combine(self.today, datetime.min.time()))
+        self.first_day = self.today - timedelta(days=365 * options['years'])
+        self.last_day = self.today + timedelta(days=60)
+
+        if options['doctors'] < 1 or options['patients'] < 1:
+            raise CommandError("Need at least one doctor and one patient.")
+        days = (self.last_day - self.first_day).days + 1
+        per_doctor = -(-options['appointments'] // options['doctors'])
+        if per_doctor > days * SLOTS_PER_DAY:
+            raise CommandError(
+                f"{per_doctor} appointments per doctor do not fit in {days} days; "
+                f"raise --doctors or --years."
+            )
+        if User.objects.filter(username__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f"Accounts with the '{self.prefix}-' prefix already exist; pick another --prefix.")
+
+        started = time.perf_counter()
+        self.password = make_password(options['password'])
+
+        with keep_created_at(User, Appointment, Prescription, Invoice, PharmacyOrder):
+            departments = self.step("departments", self.create_departments, options['departments'])
+            doctors = self.step("doctors", self.create_doctors, options['doctors'], departments)
+            patients = self.step("patients", self.create_patients, options['patients'])
+            medicines = self.step("medicines", self.create_medicines, options['medicines'])
+            self.step(
+                "appointments", self.create_appointments,
+                options['appointments'], doctors, patients, medicines
+            )
+            orders = options['orders'] if options['orders'] is not None else options['appointments'] // 5
+            self.step("pharmacy orders", self.create_orders, orders, patients, medicines)
+            carts = options['carts'] if options['carts'] is not None else options['patients'] // 10
+            self.step("carts", self.create_carts, carts, patients, medicines)
+
+        self.step("daily stats", lambda: sum(rows for _, _, rows in rebuild(self.first_day, self.last_day)))
+        self.step("ledger entries", ledger.post_missing)
+        self.step("ledger balances", ledger.rebuild_balances)
+        invalidate_dashboard()
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s."))
+
+    def step(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(f"{label}: {count} in {time.perf_counter() - started:.1f}s")
+        return result
+
+    def bulk_create(self, model, objs):
+        with transaction.atomic():
+            return model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def chunks(self, total):
+        for offset in range(0, total, self.batch_size):
+            yield offset, min(self.batch_size, total - offset)
+
+    def past(self, days):
+        """A random moment in the last ``days`` days."""
+        return self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+
+    def create_users(self, role, start, count, history_days):
+        users = []
+        for i in range(start, start + count):
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            username = f'{self.prefix}-{role}-{i}'
+            joined = self.past(history_days)
+            users.append(User(
+                username=username,
+                password=self.password,
+                first_name=first,
+                last_name=last,
+                email=f'{username}@example.com',
+                phone=f'9{self.rng.randint(100000000, 999999999)}',
+                role=role,
+                is_approved=role != User.Role.DOCTOR or self.rng.random() < 0.95,
+                date_joined=joined,
+                created_at=joined,
+            ))
+        return self.bulk_create(User, users)
+
+    def create_departments(self, count):
+        names = [
+            DEPARTMENTS[i] if i < len(DEPARTMENTS) else f'{DEPARTMENTS[i % len(DEPARTMENTS)]} {i // len(DEPARTMENTS) + 1}'
+            for i in range(count)
+        ]
+        Department.objects.bulk_create(
+            [Department(name=name, slug=slugify(name), description=f'{name} department') for name in names],
+            ignore_conflicts=True
+        )
+        return list(Department.objects.filter(name__in=names).values_list('pk', flat=True))
+
+    def create_doctors(self, count, department_ids):
+        doctors = []
+        for offset, size in self.chunks(count):
+            users = self.create_users(User.Role.DOCTOR, offset, size, 365 * 5)
+            profiles = self.bulk_create(DoctorProfile, [
+                DoctorProfile(
+                    user_id=user.pk,
+                    department_id=department_ids[(offset + i) % len(department_ids)],
+                    qualifications='MBBS, MD',
+                    specialization='Consultant',
+                    experience_years=self.rng.randint(1, 30),
+                    consultation_fee=Decimal(self.rng.choice([300, 400, 500, 600, 800, 1000])),
+                    available_from=datetime.min.time().replace(hour=DAY_OPENS),
+                    available_to=datetime.min.time().replace(hour=DAY_OPENS + SLOTS_PER_DAY // 2),
+                )
+                for i, user in enumerate(users)
+            ])
+            doctors.extend(profiles)
+        return doctors
+
+    def create_patients(self, count):
+        patient_ids = []
+        genders = PatientProfile.Gender.values
+        blood_groups = PatientProfile.BloodGroup.values
+        for offset, size in self.chunks(count):
+            users = self.create_users(User.Role.PATIENT, offset, size, 365 * 5)
+            profiles = self.bulk_create(PatientProfile, [
+                PatientProfile(
+                    user_id=user.pk,
+                    date_of_birth=self.today - timedelta(days=self.rng.randint(365, 365 * 90)),
+                    gender=self.rng.choice(genders),
+                    blood_group=self.rng.choice(blood_groups),
+                    address=f'{self.rng.randint(1, 999)} Main Road',
+                    emergency_contact_name=self.rng.choice(FIRST_NAMES),
+                    emergency_contact_phone=f'9{self.rng.randint(100000000, 999999999)}',
+                )
+                for user in users
+            ])
+            patient_ids.extend(profile.pk for profile in profiles)
+        return patient_ids
+
+    def create_medicines(self, count):
+        medicines = self.bulk_create(Medicine, [
+            Medicine(
+                name=f'{MEDICINES[i % len(MEDICINES)]} {(i // len(MEDICINES) + 1) * 50}mg',
+                generic_name=MEDICINES[i % len(MEDICINES)].lower(),
+                manufacturer=self.rng.choice(MANUFACTURERS),
+                description='Generated for scale testing',
+                price=Decimal(self.rng.randint(1000, 90000)) / 100,
+                stock=self.rng.randint(0, 500),
+                unit=self.rng.choice(UNITS),
+                prescription_required=self.rng.random() < 0.4,
+            )
+            for i in range(count)
+        ])
+        return [(medicine.pk, medicine.name, medicine.price) for medicine in medicines]
+
+    def create_appointments(self, total, doctors, patient_ids, medicines):
+        """Spread ``total`` non-overlapping appointments across the doctors' grids."""
+        days = (self.last_day - self.first_day).days + 1
+        base = timezone.make_aware(datetime.combine(self.first_day, datetime.min.time().replace(hour=DAY_OPENS)))
+        created = 0
+        batch = []
+        for index, doctor in enumerate(doctors):
+            share = total // len(doctors) + (1 if index < total % len(doctors) else 0)
+            for slot in sorted(self.rng.sample(range(days * SLOTS_PER_DAY), share)):
+                day, position = divmod(slot, SLOTS_PER_DAY)
+                scheduled = base + timedelta(days=day, minutes=30 * position)
+                batch.append(self.build_appointment(doctor, scheduled, patient_ids))
+                if len(batch) >= self.batch_size:
+                    created += self.save_appointments(batch, doctors, medicines)
+                    batch = []
+        if batch:
+            created += self.save_appointments(batch, doctors, medicines)
+        return created
+
+    def build_appointment(self, doctor, scheduled, patient_ids):
+        roll = self.rng.random()
+        if scheduled < self.now:
+            status = 'completed' if roll < 0.7 else 'cancelled' if roll < 0.85 else 'no_show' if roll < 0.95 else 'confirmed'
+            paid = status == 'completed' and self.rng.random() < 0.9
+        else:
+            status = 'pending' if roll < 0.6 else 'confirmed' if roll < 0.9 else 'cancelled'
+            paid = status == 'confirmed' and self.rng.random() < 0.5
+        booked = min(scheduled - timedelta(hours=self.rng.randint(1, 24 * 30)), self.now)
+        return Appointment(
+            patient_id=self.rng.choice(patient_ids),
+            doctor_id=doctor.pk,
+            department_id=doctor.department_id,
+            scheduled_datetime=scheduled,
+            scheduled_end=Appointment.compute_end(scheduled, 30),
+            status=status,
+            payment_status='paid' if paid else 'unpaid',
+            reason='Consultation',
+            created_at=booked,
+        )
+
+    def save_appointments(self, batch, doctors, medicines):
+        fees = {doctor.pk: doctor.consultation_fee for doctor in doctors}
+        with transaction.atomic():
+            appointments = Appointment.objects.bulk_create(batch, batch_size=self.batch_size)
+
+            SlotReservation.objects.bulk_create([
+                SlotReservation(doctor_id=appointment.doctor_id, appointment_id=appointment.pk, slot_start=slot_start)
+                for appointment in appointments if appointment.status in ACTIVE_STATUSES
+                for slot_start in slot_starts(appointment.scheduled_datetime, appointment.duration_minutes)
+            ], batch_size=self.batch_size)
+
+            Invoice.objects.bulk_create([
+                self.build_invoice(
+                    appointment.patient_id, Invoice.InvoiceType.APPOINTMENT, fees[appointment.doctor_id],
+                    appointment.created_at, appointment=appointment
+                )
+                for appointment in appointments if appointment.payment_status == 'paid'
+            ], batch_size=self.batch_size)
+
+            completed = [appointment for appointment in appointments if appointment.status == 'completed']
+            prescriptions = Prescription.objects.bulk_create([
+                Prescription(
+                    appointment_id=appointment.pk,
+                    diagnosis=self.rng.choice(DIAGNOSES),
+                    created_at=appointment.scheduled_end,
+                )
+                for appointment in completed if self.rng.random() < 0.6
+            ], batch_size=self.batch_size)
+            PrescriptionItem.objects.bulk_create([
+                PrescriptionItem(
+                    prescription_id=prescription.pk,
+                    medicine_name=name,
+                    dosage='1 tablet',
+                    frequency=self.rng.choice(['Once a day', 'Twice a day', 'Three times a day']),
+                    duration=f'{self.rng.choice([3, 5, 7, 14, 30])} days',
+                )
+                for prescription in prescriptions
+                for _, name, _ in self.rng.sample(medicines, min(len(medicines), self.rng.randint(1, 4)))
+            ], batch_size=self.batch_size)
+        return len(appointments)
+
+    def build_invoice(self, patient_id, invoice_type, amount, created_at, **link):
+        online = self.rng.random() < 0.7
+        return Invoice(
+            patient_id=patient_id,
+            invoice_type=invoice_type,
+            amount=amount,
+            status=Invoice.Status.PAID,
+            razorpay_order_id=f'order_{self.rng.getrandbits(56):014x}' if online else None,
+            razorpay_payment_id=f'pay_{self.rng.getrandbits(56):014x}' if online else None,
+            paid_at=min(created_at + timedelta(minutes=self.rng.randint(1, 120)), self.now),
+            created_at=created_at,
+            **link
+        )
+
+    def create_orders(self, total, patient_ids, medicines):
+        if not medicines:
+            return 0
+        history_days = (self.today - self.first_day).days
+        for _, size in self.chunks(total):
+            carts = []
+            for _ in range(size):
+                lines = [
+                    (medicine_id, price, self.rng.randint(1, 3))
+                    for medicine_id, _, price in self.rng.sample(medicines, min(len(medicines), self.rng.randint(1, 4)))
+                ]
+                status = self.rng.choices(PharmacyOrder.Status.values, weights=[5, 10, 5, 5, 10, 60, 5])[0]
+                order = PharmacyOrder(
+                    patient_id=self.rng.choice(patient_ids),
+                    status=status,
+                    total_amount=sum(price * quantity for _, price, quantity in lines),
+                    shipping_address='Generated address',
+                    created_at=self.past(history_days),
+                )
+                carts.append((order, lines))
+
+            with transaction.atomic():
+                orders = PharmacyOrder.objects.bulk_create([order for order, _ in carts], batch_size=self.batch_size)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order_id=order.pk, medicine_id=medicine_id, quantity=quantity, price=price)
+                    for order, (_, lines) in zip(orders, carts)
+                    for medicine_id, price, quantity in lines
+                ], batch_size=self.batch_size)
+                Invoice.objects.bulk_create([
+                    self.build_invoice(
+                        order.patient_id, Invoice.InvoiceType.PHARMACY, order.total_amount,
+                        order.created_at, pharmacy_order=order
+                    )
+                    for order in orders if order.status in PAID_ORDER_STATUSES
+                ], batch_size=self.batch_size)
+        return total
+
+    def create_carts(self, count, patient_ids, medicines):
+        if not medicines:
+            return 0
+        owners = self.rng.sample(patient_ids, min(count, len(patient_ids)))
+        carts = self.bulk_create(Cart, [Cart(patient_id=patient_id) for patient_id in owners])
+        self.bulk_create(CartItem, [
+            CartItem(cart_id=cart.pk, medicine_id=medicine_id, quantity=self.rng.randint(1, 3))
+            for cart in carts
+            for medicine_id, _, _ in self.rng.sample(medicines, min(len(medicines), self.rng.randint(1, 3)))
+        ])
+        return len(carts)
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('departments', '0001_initial'),
+        ('doctors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('appointments_pending', models.PositiveIntegerField(default=0)),
+                ('appointments_confirmed', models.PositiveIntegerField(default=0)),
+                ('appointments_cancelled', models.PositiveIntegerField(default=0)),
+                ('appointments_completed', models.PositiveIntegerField(default=0)),
+                ('appointments_no_show', models.PositiveIntegerField(default=0)),
+                ('appointment_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pharmacy_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pharmacy_orders', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='departments.department')),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='doctors.doctorprofile')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily stats',
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'department', 'doctor'), name='dailystats_unique_bucket'), models.UniqueConstraint(condition=models.Q(('department__isnull', True)), fields=('date', 'doctor'), name='dailystats_unique_no_department'), models.UniqueConstraint(condition=models.Q(('department__isnull', True), ('doctor__isnull', True)), fields=('date',), name='dailystats_unique_hospital')],
+            },
+        ),
+    ]
@@ -1,3 +1,77 @@
 from django.db import models
 
-# Create your models here.
+
+class DailyStats(models.Model):
+    """Per-day rollup of appointment and revenue metrics.
+
+    Clinical rows are keyed by (date, department, doctor): appointment
+    counts use the scheduled date and appointment revenue the paid date.
+    Pharmacy revenue and order counts live in the hospital-wide row that
+    has no department and no doctor. Maintained by ``adminpanel.rollups``.
+    """
+    
+    date = models.DateField()
+    department = models.ForeignKey(
+        'departments.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='daily_stats'
+    )
+    doctor = models.ForeignKey(
+        'doctors.DoctorProfile',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='daily_stats'
+    )
+    
+    # Appointment counts by status
+    appointments_pending = models.PositiveIntegerField(default=0)
+    appointments_confirmed = models.PositiveIntegerField(default=0)
+    appointments_cancelled = models.PositiveIntegerField(default=0)
+    appointments_completed = models.PositiveIntegerField(default=0)
+    appointments_no_show = models.PositiveIntegerField(default=0)
+    
+    # Paid revenue by invoice type
+    appointment_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pharmacy_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    pharmacy_orders = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name_plural = 'Daily stats'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'department', 'doctor'],
+                name='dailystats_unique_bucket'
+            ),
+            # NULLs never collide in a plain unique key, so cover them explicitly
+            models.UniqueConstraint(
+                fields=['date', 'doctor'],
+                condition=models.Q(department__isnull=True),
+                name='dailystats_unique_no_department'
+            ),
+            models.UniqueConstraint(
+                fields=['date'],
+                condition=models.Q(department__isnull=True, doctor__isnull=True),
+                name='dailystats_unique_hospital'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Stats for {self.date}"
+    
+    @property
+    def total_appointments(self):
+        return (
+            self.appointments_pending + self.appointments_confirmed +
+            self.appointments_cancelled + self.appointments_completed +
+            self.appointments_no_show
+        )
+    
+    @property
+    def total_revenue(self):
+        return self.appointment_revenue + self.pharmacy_revenue
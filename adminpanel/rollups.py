@@ -0,0 +1,127 @@
+"""
+Incremental maintenance of the DailyStats rollup.
+
+Each change to an Appointment, Invoice or PharmacyOrder recomputes only the
+bucket it belongs to, using indexed range queries over one day. Recomputing
+rather than applying deltas keeps buckets idempotent, so a missed or
+repeated refresh is corrected by the next one or by ``rebuild``.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from appointments.booking import run_with_retries
+from appointments.dates import day_range
+from appointments.models import Appointment
+from billing.models import Invoice
+from pharmacy.models import PharmacyOrder
+from .models import DailyStats
+from .stats import invalidate_dashboard
+
+
+STATUS_FIELDS = {status: f'appointments_{status}' for status in Appointment.Status.values}
+REVENUE_FIELDS = {invoice_type: f'{invoice_type}_revenue' for invoice_type in Invoice.InvoiceType.values}
+METRIC_FIELDS = [*STATUS_FIELDS.values(), *REVENUE_FIELDS.values(), 'pharmacy_orders']
+
+# The bucket for metrics that belong to no doctor
+HOSPITAL = (None, None)
+
+
+def collect(first_day, last_day, bucket=None):
+    """
+    Compute metrics for every bucket in ``[first_day, last_day]``.
+
+    Returns ``{(date, department_id, doctor_id): {field: value}}``. Passing
+    ``bucket=(department_id, doctor_id)`` restricts the work to that bucket.
+    """
+    start = day_range(first_day)[0]
+    end = day_range(last_day)[1]
+
+    appointments = Appointment.objects.filter(scheduled_datetime__gte=start, scheduled_datetime__lt=end)
+    invoices = Invoice.objects.filter(status=Invoice.Status.PAID, paid_at__gte=start, paid_at__lt=end)
+    orders = PharmacyOrder.objects.filter(created_at__gte=start, created_at__lt=end)
+
+    if bucket == HOSPITAL:
+        appointments = appointments.none()
+        invoices = invoices.filter(appointment__isnull=True)
+    elif bucket is not None:
+        department_id, doctor_id = bucket
+        appointments = appointments.filter(department_id=department_id, doctor_id=doctor_id)
+        invoices = invoices.filter(
+            appointment__department_id=department_id,
+            appointment__doctor_id=doctor_id
+        )
+        orders = orders.none()
+
+    rows = defaultdict(dict)
+
+    for row in appointments.annotate(day=TruncDate('scheduled_datetime')).values(
+        'day', 'department_id', 'doctor_id', 'status'
+    ).annotate(count=Count('pk')).order_by():
+        key = (row['day'], row['department_id'], row['doctor_id'])
+        rows[key][STATUS_FIELDS[row['status']]] = row['count']
+
+    for row in invoices.annotate(day=TruncDate('paid_at')).values(
+        'day', 'invoice_type', 'appointment__department_id', 'appointment__doctor_id'
+    ).annotate(total=Sum('amount')).order_by():
+        key = (row['day'], row['appointment__department_id'], row['appointment__doctor_id'])
+        field = REVENUE_FIELDS[row['invoice_type']]
+        rows[key][field] = rows[key].get(field, Decimal('0')) + row['total']
+
+    for row in orders.annotate(day=TruncDate('created_at')).values('day').annotate(
+        count=Count('pk')
+    ).order_by():
+        rows[(row['day'], *HOSPITAL)]['pharmacy_orders'] = row['count']
+
+    return rows
+
+
+def refresh_bucket(day, department_id, doctor_id):
+    """Recompute one (date, department, doctor) row from the source tables."""
+    values = collect(day, day, (department_id, doctor_id)).get((day, department_id, doctor_id))
+    lookup = {'date': day, 'department_id': department_id, 'doctor_id': doctor_id}
+
+    if not values:
+        DailyStats.objects.filter(**lookup).delete()
+        return
+
+    defaults = {field: values.get(field, 0) for field in METRIC_FIELDS}
+    DailyStats.objects.update_or_create(**lookup, defaults=defaults)
+
+
+def schedule_refresh(day, bucket):
+    """Refresh one DailyStats bucket once the current transaction commits."""
+    def refresh():
+        run_with_retries(lambda: refresh_bucket(day, *bucket))
+        invalidate_dashboard()
+    transaction.on_commit(refresh, robust=True)
+
+
+def rebuild(first_day, last_day, chunk_days=31):
+    """Replace every DailyStats row in the range with freshly computed ones."""
+    day = first_day
+    while day <= last_day:
+        chunk_end = min(day + timedelta(days=chunk_days - 1), last_day)
+        rows = collect(day, chunk_end)
+        with transaction.atomic():
+            DailyStats.objects.filter(date__gte=day, date__lte=chunk_end).delete()
+            DailyStats.objects.bulk_create([
+                DailyStats(
+                    date=date,
+                    department_id=department_id,
+                    doctor_id=doctor_id,
+                    **{field: values.get(field, 0) for field in METRIC_FIELDS}
+                )
+                for (date, department_id, doctor_id), values in rows.items()
+            ], batch_size=1000)
+        yield day, chunk_end, len(rows)
+        day = chunk_end + timedelta(days=1)
+
+
+def local_date(value):
+    return timezone.localtime(value).date()
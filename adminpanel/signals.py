@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from accounts.models import User
+from appointments.models import Appointment
+from billing.models import Invoice
+from pharmacy.models import PharmacyOrder
+from .rollups import HOSPITAL, local_date, schedule_refresh
+from .stats import invalidate_dashboard
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_dashboard_snapshot(sender, update_fields=None, **kwargs):
+    """Retire the admin dashboard snapshot when its source rows change."""
+    # Logins only touch last_login, which the dashboard never shows
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # After commit, or a request could rebuild it from the old rows under the new generation
+    transaction.on_commit(invalidate_dashboard, robust=True)
+
+
+# Where an appointment counts: its day and (department, doctor) bucket
+BUCKET_FIELDS = ('scheduled_datetime', 'department_id', 'doctor_id')
+
+
+def paid_days(appointment_id):
+    """The local days the appointment's invoices were paid on."""
+    return {
+        local_date(paid_at) for paid_at in Invoice.objects.filter(
+            appointment_id=appointment_id, paid_at__isnull=False
+        ).values_list('paid_at', flat=True)
+    }
+
+
+def invoice_bucket(appointment_id):
+    """The bucket an invoice's revenue counts towards."""
+    if not appointment_id:
+        return HOSPITAL
+    return tuple(Appointment.objects.filter(pk=appointment_id).values_list(
+        'department_id', 'doctor_id'
+    ).first() or HOSPITAL)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_bucket(sender, instance, update_fields=None, **kwargs):
+    """Note the stored day and bucket, so a move refreshes the ones it left."""
+    instance._stored_bucket = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {
+        'scheduled_datetime', 'department', 'department_id', 'doctor', 'doctor_id'
+    } & set(update_fields):
+        return
+    instance._stored_bucket = Appointment.objects.filter(pk=instance.pk).values_list(*BUCKET_FIELDS).first()
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_appointment_stats(sender, instance, **kwargs):
+    current = tuple(getattr(instance, field) for field in BUCKET_FIELDS)
+    stored = getattr(instance, '_stored_bucket', None) or current
+    refreshes = {(local_date(current[0]), current[1:]), (local_date(stored[0]), stored[1:])}
+    if stored[1:] != current[1:]:
+        # Its paid invoices' revenue moves to the new bucket too
+        for day in paid_days(instance.pk):
+            refreshes |= {(day, stored[1:]), (day, current[1:])}
+    for day, bucket in refreshes:
+        schedule_refresh(day, bucket)
+
+
+@receiver(pre_delete, sender=Appointment)
+def remember_paid_days(sender, instance, **kwargs):
+    # Deleting clears the invoices' appointment, without signals
+    instance._paid_days = paid_days(instance.pk)
+
+
+@receiver(post_delete, sender=Appointment)
+def refresh_deleted_appointment_stats(sender, instance, **kwargs):
+    bucket = (instance.department_id, instance.doctor_id)
+    refreshes = {(local_date(instance.scheduled_datetime), bucket)}
+    # Their revenue now counts towards the hospital only
+    for day in getattr(instance, '_paid_days', ()):
+        refreshes |= {(day, bucket), (day, HOSPITAL)}
+    for day, bucket in refreshes:
+        schedule_refresh(day, bucket)
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_bucket(sender, instance, update_fields=None, **kwargs):
+    """Note when and for which appointment the invoice was stored as paid."""
+    instance._stored_payment = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {'paid_at', 'appointment', 'appointment_id'} & set(update_fields):
+        return
+    instance._stored_payment = Invoice.objects.filter(pk=instance.pk).values_list(
+        'paid_at', 'appointment_id'
+    ).first()
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def refresh_invoice_stats(sender, instance, **kwargs):
+    payments = {(instance.paid_at, instance.appointment_id)}
+    stored = getattr(instance, '_stored_payment', None)
+    if stored:
+        payments.add(stored)
+    for paid_at, appointment_id in payments:
+        if paid_at:
+            schedule_refresh(local_date(paid_at), invoice_bucket(appointment_id))
+
+
+@receiver(post_save, sender=PharmacyOrder)
+@receiver(post_delete, sender=PharmacyOrder)
+def refresh_order_stats(sender, instance, created=False, **kwargs):
+    # Only creation and deletion change the order count
+    if created or kwargs['signal'] is post_delete:
+        schedule_refresh(local_date(instance.created_at), HOSPITAL)
+
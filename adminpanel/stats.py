@@ -0,0 +1,119 @@
+"""
+Cached admin dashboard snapshot.
+
+All dashboard counts are computed with conditional aggregates (one query per
+table, revenue from two ledger balances) and kept in the cache for
+SNAPSHOT_TTL seconds. Signals bump a generation number to invalidate the
+snapshot, and only one request at a time rebuilds it; the others are served
+the previous snapshot meanwhile.
+"""
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.dates import today_range
+from appointments.models import Appointment
+from billing.ledger import balance
+
+
+SNAPSHOT_TTL = 60
+STALE_TTL = 600
+LOCK_TTL = 30
+
+GENERATION_KEY = 'adminpanel:dashboard:generation'
+SNAPSHOT_KEY = 'adminpanel:dashboard:{generation}'
+STALE_KEY = 'adminpanel:dashboard:stale'
+LOCK_KEY = 'adminpanel:dashboard:lock'
+
+
+def compute_dashboard_stats():
+    """Build the dashboard context straight from the database."""
+    today_start, today_end = today_range()
+    today = timezone.localdate()
+    month_start = today.replace(day=1)
+
+    users = User.objects.aggregate(
+        total_doctors=Count('pk', filter=Q(role=User.Role.DOCTOR)),
+        pending_doctors=Count('pk', filter=Q(role=User.Role.DOCTOR, is_approved=False)),
+        total_patients=Count('pk', filter=Q(role=User.Role.PATIENT)),
+    )
+    appointments = Appointment.objects.aggregate(
+        total_appointments=Count('pk'),
+        today_appointments=Count('pk', filter=Q(
+            scheduled_datetime__gte=today_start,
+            scheduled_datetime__lt=today_end
+        )),
+    )
+    # Running ledger balances instead of a sum over every paid invoice
+    total_revenue = balance(today)
+    monthly_revenue = total_revenue - balance(month_start - timedelta(days=1))
+
+    return {
+        **users,
+        **appointments,
+        'total_revenue': total_revenue,
+        'monthly_revenue': monthly_revenue,
+        'recent_appointments': list(
+            Appointment.objects.select_related('patient__user', 'doctor__user')
+            .order_by('-created_at')[:5]
+        ),
+        'pending_doctor_approvals': list(
+            User.objects.select_related('doctor_profile').filter(
+                role=User.Role.DOCTOR,
+                is_approved=False
+            ).order_by('-date_joined')[:5]
+        ),
+    }
+
+
+def get_dashboard_stats():
+    """Return the cached snapshot, rebuilding it at most once at a time."""
+    generation = _generation()
+    key = SNAPSHOT_KEY.format(generation=generation)
+
+    stats = cache.get(key)
+    if stats is not None:
+        return stats
+
+    locked = cache.add(LOCK_KEY, True, LOCK_TTL)
+    if not locked:
+        # Another request is rebuilding; serve the previous snapshot if any
+        stats = cache.get(STALE_KEY)
+        if stats is not None:
+            return stats
+        for _ in range(20):
+            time.sleep(0.05)
+            stats = cache.get(key)
+            if stats is not None:
+                return stats
+
+    try:
+        stats = compute_dashboard_stats()
+        # Written under the generation read above, so a save that lands
+        # mid-rebuild leaves this snapshot orphaned instead of current
+        cache.set(key, stats, SNAPSHOT_TTL)
+        cache.set(STALE_KEY, stats, STALE_TTL)
+    finally:
+        if locked:
+            cache.delete(LOCK_KEY)
+    return stats
+
+
+def invalidate_dashboard():
+    """Retire the current snapshot."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import User
+from adminpanel import stats
+from adminpanel.models import DailyStats
+from adminpanel.rollups import METRIC_FIELDS, collect
+from appointments.models import Appointment
+from billing.models import Invoice
+from departments.models import Department
+from hospital_project import images
+from hospital_project.storage import blob_name
+from hospital_project.testing import QueryBudgetMixin, seed
+from pharmacy.models import Medicine
+from taskqueue.models import Task
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        Task.objects.bulk_create([
+            Task(name='billing.tasks.apply_webhook_events', status=status)
+            for status in Task.Status.values * 10
+        ])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def assertPagesWithinBudget(self, name, *queries):
+        for query in ('',) + queries:
+            with self.subTest(query=query):
+                response = self.assertWithinQueryBudget(reverse(name) + query)
+                self.assertEqual(response.status_code, 200)
+
+    def test_dashboard(self):
+        self.assertPagesWithinBudget('adminpanel:dashboard')
+
+    def test_reports(self):
+        self.assertPagesWithinBudget('adminpanel:reports', '?days=90')
+
+    def test_doctor_list(self):
+        self.assertPagesWithinBudget('adminpanel:doctor_list', '?status=pending', '?status=approved')
+
+    def test_patient_list(self):
+        self.assertPagesWithinBudget('adminpanel:patient_list', '?page=2')
+
+    def test_appointment_list(self):
+        self.assertPagesWithinBudget('adminpanel:appointment_list', '?status=completed', '?page=2')
+
+    def test_medicine_list(self):
+        self.assertPagesWithinBudget('adminpanel:medicine_list', '?page=2')
+
+    def test_pharmacy_order_list(self):
+        self.assertPagesWithinBudget('adminpanel:pharmacy_order_list', '?status=paid', '?page=2')
+
+    def test_task_list(self):
+        self.assertPagesWithinBudget('adminpanel:task_list', '?status=failed')
+
+
+class RollupSignalTests(TestCase):
+    """DailyStats follow appointments and invoices that move or go away."""
+
+    def setUp(self):
+        departments = [Department.objects.create(name=name) for name in ('Cardiology', 'Neurology')]
+        self.doctors = []
+        for i, department in enumerate(departments):
+            doctor = User.objects.create(username=f'doctor-{i}', role=User.Role.DOCTOR).doctor_profile
+            doctor.department = department
+            doctor.save()
+            self.doctors.append(doctor)
+        patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        self.day = timezone.localdate() - timedelta(days=3)
+        start = timezone.make_aware(datetime.combine(self.day, datetime.min.time().replace(hour=10)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment = Appointment.objects.create(
+                patient=patient, doctor=self.doctors[0], department=self.doctors[0].department,
+                scheduled_datetime=start
+            )
+            self.invoice = Invoice.objects.create(
+                patient=patient,
+                invoice_type=Invoice.InvoiceType.APPOINTMENT,
+                appointment=self.appointment,
+                amount=500,
+                status=Invoice.Status.PAID,
+                paid_at=start
+            )
+
+    def assertStatsMatchSource(self):
+        first, last = self.day - timedelta(days=2), self.day + timedelta(days=2)
+        expected = {
+            key: {field: values.get(field, 0) for field in METRIC_FIELDS}
+            for key, values in collect(first, last).items()
+        }
+        stored = {
+            (row['date'], row['department_id'], row['doctor_id']): {field: row[field] for field in METRIC_FIELDS}
+            for row in DailyStats.objects.filter(date__gte=first, date__lte=last).values()
+        }
+        self.assertEqual(stored, expected)
+
+    def test_appointment_moved_to_another_doctor_and_day(self):
+        self.assertStatsMatchSource()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.doctor = self.doctors[1]
+            self.appointment.department = self.doctors[1].department
+            self.appointment.scheduled_datetime += timedelta(days=1)
+            self.appointment.save()
+        self.assertFalse(DailyStats.objects.filter(doctor=self.doctors[0]).exists())
+        self.assertStatsMatchSource()
+
+    def test_payment_moved_to_another_day(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.paid_at -= timedelta(days=1)
+            self.invoice.save()
+        self.assertStatsMatchSource()
+
+    def test_appointment_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.delete()
+        # Its invoice's revenue now counts towards the hospital
+        self.assertTrue(DailyStats.objects.filter(
+            date=self.day, department=None, doctor=None, appointment_revenue=500
+        ).exists())
+        self.assertStatsMatchSource()
+
+    def test_dashboard_snapshot_is_retired_on_commit(self):
+        generation = stats._generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.status = Appointment.Status.CONFIRMED
+            self.appointment.save()
+            self.assertEqual(stats._generation(), generation)
+        self.assertGreater(stats._generation(), generation)
+
+
+@override_settings(IMAGE_WORKERS=0)
+class CollectMediaTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        images._known.clear()
+        self.addCleanup(images._known.clear)
+
+    def png(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (320, 200), color).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def medicine(self, data, name='Medicine'):
+        medicine = Medicine(name=name, price=10, stock=5)
+        medicine.image.save('box.png', ContentFile(data), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            medicine.save()
+        return medicine
+
+    def age(self, name, storage=default_storage, seconds=7200):
+        then = time.time() - seconds
+        os.utime(storage.path(name), (then, then))
+
+    def collect(self, *args):
+        stdout = StringIO()
+        call_command('collect_media', *args, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_identical_uploads_share_one_blob(self):
+        data = self.png('red')
+        first = self.medicine(data, 'First')
+        second = self.medicine(data, 'Second')
+        department = Department(name='Cardiology')
+        department.image.save('heart.png', ContentFile(data))
+
+        name = blob_name(hashlib.sha256(data).hexdigest(), '.png')
+        self.assertEqual({first.image.name, second.image.name, department.image.name}, {name})
+        self.assertEqual(default_storage.listdir(os.path.dirname(name))[1], [os.path.basename(name)])
+
+    def test_collects_old_unreferenced_blobs_and_their_variants(self):
+        kept = self.medicine(self.png('red')).image.name
+        old = default_storage.save('medicines/old.png', ContentFile(self.png('green')))
+        young = default_storage.save('medicines/young.png', ContentFile(self.png('blue')))
+        images.build_derivatives(old)
+        derived = images.derived_storage()
+        for name in [kept, old, *images.derivative_names(kept), *images.derivative_names(old)]:
+            self.age(name, derived if name.startswith('derived/') else default_storage)
+        old_files = [old, *images.derivative_names(old)]
+        kept_files = [kept, *images.derivative_names(kept), young]
+
+        output = self.collect('--dry-run')
+        self.assertIn(f'Would remove {len(old_files)} files', output)
+        for name in old_files + kept_files:
+            self.assertTrue(os.path.exists(default_storage.path(name)), name)
+
+        output = self.collect()
+        self.assertIn(f'Removed {len(old_files)} files', output)
+        for name in old_files:
+            self.assertFalse(os.path.exists(default_storage.path(name)), name)
+        # Referenced, or too young to tell from an upload whose row is not committed yet
+        for name in kept_files:
+            self.assertTrue(os.path.exists(default_storage.path(name)), name)
+
+    def test_adopt_moves_legacy_uploads_into_blobs(self):
+        data = self.png('red')
+        legacy = FileSystemStorage(location=self.media).save('medicines/legacy.png', ContentFile(data))
+        self.age(legacy)
+        medicine = self.medicine(self.png('blue'))
+        Medicine.objects.filter(pk=medicine.pk).update(image=legacy)
+        department = Department.objects.create(name='Cardiology')
+        Department.objects.filter(pk=department.pk).update(image=legacy)
+
+        self.collect('--adopt', '--dry-run')
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.image.name, legacy)
+
+        self.collect('--adopt')
+        blob = blob_name(hashlib.sha256(data).hexdigest(), '.png')
+        medicine.refresh_from_db()
+        department.refresh_from_db()
+        self.assertEqual(medicine.image.name, blob)
+        self.assertEqual(department.image.name, blob)
+        with default_storage.open(blob, 'rb') as stored:
+            self.assertEqual(stored.read(), data)
+        # The old upload folders are collected too
+        self.assertFalse(os.path.exists(default_storage.path(legacy)))
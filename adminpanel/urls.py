@@ -5,6 +5,7 @@ app_name = 'adminpanel'
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('reports/', views.reports, name='reports'),
     
     # Departments
     path('departments/', views.department_list, name='department_list'),
@@ -31,6 +32,7 @@ urlpatterns = [
     # Pharmacy - Medicines
     path('pharmacy/medicines/', views.medicine_list, name='medicine_list'),
     path('pharmacy/medicines/create/', views.medicine_create, name='medicine_create'),
+    path('pharmacy/medicines/import/', views.medicine_import, name='medicine_import'),
     path('pharmacy/medicines/<int:pk>/edit/', views.medicine_edit, name='medicine_edit'),
     path('pharmacy/medicines/<int:pk>/delete/', views.medicine_delete, name='medicine_delete'),
     
@@ -38,4 +40,8 @@ urlpatterns = [
     path('pharmacy/orders/', views.pharmacy_order_list, name='pharmacy_order_list'),
     path('pharmacy/orders/<int:pk>/', views.pharmacy_order_detail, name='pharmacy_order_detail'),
     path('pharmacy/orders/<int:pk>/update-status/', views.pharmacy_order_update_status, name='pharmacy_order_update_status'),
+    
+    # Background tasks
+    path('tasks/', views.task_list, name='task_list'),
+    path('tasks/<int:pk>/retry/', views.task_retry, name='task_retry'),
 ]
@@ -1,10 +1,14 @@
+import io
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Count, Sum
+from django.db.models import Count, F, Sum, Value
 from django.utils import timezone
 from datetime import timedelta
 
 from accounts.decorators import admin_required
+from hospital_project.instrumentation import query_budget
+from hospital_project.pagination import paginate
 from accounts.models import User
 from departments.models import Department
 from departments.forms import DepartmentForm
@@ -13,53 +17,83 @@ from doctors.forms import DoctorProfileForm
 from patients.models import PatientProfile
 from appointments.models import Appointment
 from pharmacy.models import Medicine, PharmacyOrder
-from pharmacy.forms import MedicineForm
+from pharmacy.forms import MedicineForm, MedicineImportForm
+from pharmacy.importer import CatalogFormatError, format_for, import_medicines
+from pharmacy.stock import release_order_stock
+from billing import ledger
 from billing.models import Invoice
+from taskqueue.models import Task
+from taskqueue.queue import retry
+from .models import DailyStats
+from .rollups import STATUS_FIELDS
+from .stats import get_dashboard_stats
 
 
+@query_budget(8)
 @admin_required
 def dashboard(request):
     """Admin dashboard with overview stats."""
-    today = timezone.now().date()
-    this_month = today.replace(day=1)
-    
-    # Stats
-    total_doctors = User.objects.filter(role=User.Role.DOCTOR).count()
-    pending_doctors = User.objects.filter(role=User.Role.DOCTOR, is_approved=False).count()
-    total_patients = User.objects.filter(role=User.Role.PATIENT).count()
-    
-    # Appointments
-    today_appointments = Appointment.objects.filter(scheduled_datetime__date=today).count()
-    total_appointments = Appointment.objects.count()
-    
-    # Revenue
-    total_revenue = Invoice.objects.filter(status='paid').aggregate(
-        total=Sum('amount')
-    )['total'] or 0
-    monthly_revenue = Invoice.objects.filter(
-        status='paid',
-        paid_at__date__gte=this_month
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    # Recent activity
-    recent_appointments = Appointment.objects.order_by('-created_at')[:5]
-    pending_doctor_approvals = User.objects.filter(
-        role=User.Role.DOCTOR,
-        is_approved=False
-    ).order_by('-date_joined')[:5]
+    context = get_dashboard_stats()
+    return render(request, 'adminpanel/dashboard.html', context)
+
+
+@query_budget(6)
+@admin_required
+def reports(request):
+    """Daily time-series charts read from the DailyStats rollups and the revenue ledger."""
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    days = max(7, min(days, 365))
+    
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    stats = DailyStats.objects.filter(date__gte=start, date__lte=end)
+    
+    appointment_total = sum((F(field) for field in STATUS_FIELDS.values()), Value(0))
+    metrics = {
+        'appointments': Sum(appointment_total),
+        'completed': Sum('appointments_completed'),
+        'cancelled': Sum('appointments_cancelled'),
+        'appointment_revenue': Sum('appointment_revenue'),
+        'pharmacy_orders': Sum('pharmacy_orders'),
+    }
+    by_date = {row['date']: row for row in stats.values('date').annotate(**metrics).order_by()}
+    # Net of refunds, from the hospital's ledger balances
+    revenue = ledger.daily(start, end)
+    
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = by_date.get(day, {})
+        series.append({
+            'date': day,
+            'appointments': row.get('appointments') or 0,
+            'completed': row.get('completed') or 0,
+            'cancelled': row.get('cancelled') or 0,
+            'revenue': revenue.get(day, 0),
+            'pharmacy_orders': row.get('pharmacy_orders') or 0,
+        })
+    
+    departments = stats.filter(department__isnull=False).values(
+        'department__name'
+    ).annotate(**metrics).order_by('department__name')
     
     context = {
-        'total_doctors': total_doctors,
-        'pending_doctors': pending_doctors,
-        'total_patients': total_patients,
-        'today_appointments': today_appointments,
-        'total_appointments': total_appointments,
-        'total_revenue': total_revenue,
-        'monthly_revenue': monthly_revenue,
-        'recent_appointments': recent_appointments,
-        'pending_doctor_approvals': pending_doctor_approvals,
+        'days': days,
+        'start': start,
+        'end': end,
+        'series': series,
+        'max_appointments': max(row['appointments'] for row in series) or 1,
+        'max_revenue': max(row['revenue'] for row in series) or 1,
+        'max_orders': max(row['pharmacy_orders'] for row in series) or 1,
+        'total_appointments': sum(row['appointments'] for row in series),
+        'total_revenue': sum(row['revenue'] for row in series),
+        'total_orders': sum(row['pharmacy_orders'] for row in series),
+        'departments': departments,
     }
-    return render(request, 'adminpanel/dashboard.html', context)
+    return render(request, 'adminpanel/reports.html', context)
 
 
 # Department Management
@@ -134,6 +168,7 @@ def department_delete(request, pk):
 
 
 # Doctor Management
+@query_budget(6)
 @admin_required
 def doctor_list(request):
     """List all doctors."""
@@ -146,10 +181,11 @@ def doctor_list(request):
     elif status_filter == 'approved':
         doctors = doctors.filter(user__is_approved=True)
     
-    doctors = doctors.order_by('-user__date_joined')
+    page = paginate(request, doctors, ('-created_at', '-id'))
     
     context = {
-        'doctors': doctors,
+        'doctors': page.object_list,
+        'page': page,
         'status_filter': status_filter,
     }
     return render(request, 'adminpanel/doctors/list.html', context)
@@ -222,6 +258,7 @@ def doctor_edit(request, pk):
 
 
 # Patient Management
+@query_budget(6)
 @admin_required
 def patient_list(request):
     """List all patients."""
@@ -230,10 +267,12 @@ def patient_list(request):
         user__role=User.Role.PATIENT,
         user__is_superuser=False,
         user__is_staff=False
-    ).order_by('-user__date_joined')
+    )
+    page = paginate(request, patients, ('-created_at', '-id'))
     
     context = {
-        'patients': patients,
+        'patients': page.object_list,
+        'page': page,
     }
     return render(request, 'adminpanel/patients/list.html', context)
 
@@ -253,26 +292,28 @@ def patient_detail(request, pk):
 
 
 # Appointment Management
+@query_budget(6)
 @admin_required
 def appointment_list(request):
     """List all appointments."""
     status_filter = request.GET.get('status', '')
     date_filter = request.GET.get('date', '')
     
-    appointments = Appointment.objects.select_related('patient', 'doctor', 'department')
+    appointments = Appointment.objects.select_related('patient__user', 'doctor__user', 'department').with_payment_summary()
     
     if status_filter:
         appointments = appointments.filter(status=status_filter)
     
     if date_filter == 'today':
-        appointments = appointments.filter(scheduled_datetime__date=timezone.now().date())
+        appointments = appointments.today()
     elif date_filter == 'upcoming':
-        appointments = appointments.filter(scheduled_datetime__date__gte=timezone.now().date())
+        appointments = appointments.upcoming()
     
-    appointments = appointments.order_by('-scheduled_datetime')[:100]
+    page = paginate(request, appointments, ('-scheduled_datetime', '-id'))
     
     context = {
-        'appointments': appointments,
+        'appointments': page.object_list,
+        'page': page,
         'status_filter': status_filter,
         'date_filter': date_filter,
     }
@@ -308,13 +349,15 @@ def appointment_cancel(request, pk):
 
 
 # Medicine Management
+@query_budget(6)
 @admin_required
 def medicine_list(request):
     """List all medicines."""
-    medicines = Medicine.objects.order_by('name')
+    page = paginate(request, Medicine.objects.all(), ('name', 'id'))
     
     context = {
-        'medicines': medicines,
+        'medicines': page.object_list,
+        'page': page,
     }
     return render(request, 'adminpanel/pharmacy/medicine_list.html', context)
 
@@ -338,6 +381,36 @@ def medicine_create(request):
     return render(request, 'adminpanel/pharmacy/medicine_form.html', context)
 
 
+@admin_required
+def medicine_import(request):
+    """Upsert medicines from an uploaded CSV or JSON Lines catalog."""
+    result = None
+    if request.method == 'POST':
+        form = MedicineImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                # Large uploads are already spooled to disk; read them as a stream
+                stream = io.TextIOWrapper(upload.open('rb'), encoding='utf-8-sig', newline='')
+                result = import_medicines(stream, format_for(upload.name))
+            except (CatalogFormatError, UnicodeDecodeError) as e:
+                form.add_error('file', str(e))
+            else:
+                messages.success(
+                    request,
+                    f'Imported {result.imported} of {result.rows} rows '
+                    f'({result.created} new, {result.updated} updated, {result.error_count} rejected).'
+                )
+    else:
+        form = MedicineImportForm()
+    
+    context = {
+        'form': form,
+        'result': result,
+    }
+    return render(request, 'adminpanel/pharmacy/medicine_import.html', context)
+
+
 @admin_required
 def medicine_edit(request, pk):
     """Edit a medicine."""
@@ -377,20 +450,22 @@ def medicine_delete(request, pk):
 
 
 # Pharmacy Orders
+@query_budget(6)
 @admin_required
 def pharmacy_order_list(request):
     """List all pharmacy orders."""
     status_filter = request.GET.get('status', '')
     
-    orders = PharmacyOrder.objects.select_related('patient')
+    orders = PharmacyOrder.objects.select_related('patient__user')
     
     if status_filter:
         orders = orders.filter(status=status_filter)
     
-    orders = orders.order_by('-created_at')[:100]
+    page = paginate(request, orders, ('-created_at', '-id'))
     
     context = {
-        'orders': orders,
+        'orders': page.object_list,
+        'page': page,
         'status_filter': status_filter,
     }
     return render(request, 'adminpanel/pharmacy/order_list.html', context)
@@ -417,6 +492,41 @@ def pharmacy_order_update_status(request, pk):
         if new_status in dict(PharmacyOrder.Status.choices):
             order.status = new_status
             order.save()
+            if new_status == PharmacyOrder.Status.CANCELLED:
+                release_order_stock(order)
             messages.success(request, f'Order status updated to {order.get_status_display()}.')
     
     return redirect('adminpanel:pharmacy_order_detail', pk=pk)
+
+
+# Background Tasks
+@query_budget(6)
+@admin_required
+def task_list(request):
+    """Queued, running and finished background tasks."""
+    status_filter = request.GET.get('status', '')
+    
+    tasks = Task.objects.all()
+    if status_filter:
+        tasks = tasks.filter(status=status_filter)
+    
+    page = paginate(request, tasks, ('-created_at', '-id'))
+    counts = dict(Task.objects.order_by().values_list('status').annotate(count=Count('id')))
+    
+    context = {
+        'tasks': page.object_list,
+        'page': page,
+        'status_filter': status_filter,
+        'statuses': [(value, label, counts.get(value, 0)) for value, label in Task.Status.choices],
+    }
+    return render(request, 'adminpanel/tasks/list.html', context)
+
+
+@admin_required
+def task_retry(request, pk):
+    """Queue a failed or stuck task again."""
+    if request.method == 'POST':
+        if retry(Task.objects.filter(pk=pk)):
+            messages.success(request, f'Task #{pk} queued again.')
+    
+    return redirect('adminpanel:task_list')
@@ -0,0 +1,82 @@
+"""
+Race-free appointment booking.
+
+Every active appointment holds one SlotReservation row per grid slot it
+covers. The appointment and its reservations are written in a single
+transaction, and the unique (doctor, slot_start) key lets the database pick
+exactly one winner when several requests race for the same slot. Bookings
+for different doctors or slots never contend for the same row.
+"""
+import random
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+
+from .models import SlotReservation
+from .slots import slot_starts
+
+
+# Retries cover lock timeouts and deadlocks, never a lost slot
+MAX_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 0.05
+
+
+class SlotUnavailable(Exception):
+    """Raised when another booking already holds the requested slot."""
+
+
+def reserve_slots(appointment):
+    """Insert the reservation rows for a saved appointment."""
+    SlotReservation.objects.bulk_create([
+        SlotReservation(
+            doctor_id=appointment.doctor_id,
+            appointment=appointment,
+            slot_start=slot_start
+        )
+        for slot_start in slot_starts(appointment.scheduled_datetime, appointment.duration_minutes)
+    ])
+
+
+def release_slots(appointment):
+    """Free every slot held by the appointment."""
+    SlotReservation.objects.filter(appointment=appointment).delete()
+
+
+def run_with_retries(func):
+    """Call ``func``, retrying lock timeouts and deadlocks with jittered backoff."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return func()
+        except OperationalError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(RETRY_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def book(appointment):
+    """
+    Save a new appointment together with its slot reservations.
+
+    Raises SlotUnavailable if any slot is already taken. Transient lock
+    errors are retried before giving up.
+    """
+    def attempt():
+        try:
+            with transaction.atomic():
+                appointment.save()
+                reserve_slots(appointment)
+        except IntegrityError:
+            _reset(appointment)
+            raise SlotUnavailable("This time slot is not available.")
+        except OperationalError:
+            _reset(appointment)
+            raise
+        return appointment
+
+    return run_with_retries(attempt)
+
+
+def _reset(appointment):
+    """Forget the primary key assigned inside a rolled-back transaction."""
+    appointment.pk = None
+    appointment._state.adding = True
@@ -0,0 +1,27 @@
+"""
+Index-friendly date filtering.
+
+``field__date=day`` casts the column on every row, so no index on the
+datetime can be used. These helpers turn local calendar days into
+timezone-aware half-open ranges ``[start, end)`` that compare the raw column.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def day_range(day):
+    """Return the aware ``(start, end)`` bounds of a local calendar day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def today_range():
+    """Bounds of the current local day."""
+    return day_range(timezone.localdate())
+
+
+def start_of_today():
+    """Aware local midnight; ``>=`` this matches the old ``__date__gte=today``."""
+    return today_range()[0]
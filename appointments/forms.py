@@ -66,8 +66,12 @@ class AppointmentBookingForm(forms.ModelForm):
             scheduled_datetime = datetime.combine(scheduled_date, scheduled_time)
             scheduled_datetime = timezone.make_aware(scheduled_datetime)
             
-            # Check availability
-            available, message = Appointment.check_availability(doctor, scheduled_datetime)
+            # Check availability for the whole visit being booked
+            available, message = Appointment.check_availability(
+                doctor,
+                scheduled_datetime,
+                duration_minutes=cleaned_data.get('duration_minutes', self.instance.duration_minutes)
+            )
             if not available:
                 raise forms.ValidationError(message)
             
@@ -0,0 +1,81 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from appointments.models import Appointment
+from doctors.models import DoctorProfile
+from patients.models import PatientProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Print query plans and timings for the dashboard/list appointment "
+        "queries, next to the old __date variants. Use --rows to top the "
+        "table up with synthetic appointments first (e.g. --rows 1000000)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=0, help='Synthetic appointments to insert before measuring')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query when timing')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['rows']:
+            self.insert_rows(options['rows'], options['seed'])
+
+        doctor = DoctorProfile.objects.order_by('pk').first()
+        patient = PatientProfile.objects.order_by('pk').first()
+        if not doctor or not patient:
+            raise CommandError("Need at least one doctor and one patient.")
+        today = timezone.localdate()
+        active = ['pending', 'confirmed']
+
+        queries = [
+            ("doctor today (range)", Appointment.objects.today().filter(doctor=doctor)),
+            ("doctor today (__date)", Appointment.objects.filter(doctor=doctor, scheduled_datetime__date=today)),
+            ("doctor upcoming (range)", Appointment.objects.upcoming().filter(doctor=doctor, status__in=active).order_by('scheduled_datetime')[:5]),
+            ("doctor upcoming (__date)", Appointment.objects.filter(doctor=doctor, scheduled_datetime__date__gte=today, status__in=active).order_by('scheduled_datetime')[:5]),
+            ("patient upcoming (range)", Appointment.objects.upcoming().filter(patient=patient, status__in=active).order_by('scheduled_datetime')[:5]),
+            ("admin today count (range)", Appointment.objects.today()),
+            ("admin today count (__date)", Appointment.objects.filter(scheduled_datetime__date=today)),
+            ("doctor overlap check", Appointment.objects.overlapping(timezone.now(), timezone.now() + timedelta(minutes=45)).filter(doctor=doctor, status__in=active)),
+            ("admin upcoming by status (range)", Appointment.objects.upcoming().filter(status='pending').order_by('-scheduled_datetime')[:100]),
+        ]
+
+        self.stdout.write(f"{Appointment.objects.count()} appointments on {connection.vendor}\n")
+        for label, queryset in queries:
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.values_list('pk', flat=True))
+            elapsed = (time.perf_counter() - started) / options['repeat'] * 1000
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{label}: {elapsed:.2f} ms"))
+            self.stdout.write(queryset.explain())
+            self.stdout.write("")
+
+    def insert_rows(self, rows, seed):
+        rng = random.Random(seed)
+        doctor_ids = list(DoctorProfile.objects.values_list('pk', flat=True))
+        patient_ids = list(PatientProfile.objects.values_list('pk', flat=True))
+        if not doctor_ids or not patient_ids:
+            raise CommandError("Need at least one doctor and one patient to generate appointments.")
+
+        statuses = [choice for choice, _ in Appointment.Status.choices]
+        now = timezone.now()
+        batch_size = 10000
+        for offset in range(0, rows, batch_size):
+            batch = []
+            for _ in range(min(batch_size, rows - offset)):
+                scheduled = now + timedelta(minutes=30 * rng.randint(-35000, 35000))
+                batch.append(Appointment(
+                    doctor_id=rng.choice(doctor_ids),
+                    patient_id=rng.choice(patient_ids),
+                    scheduled_datetime=scheduled,
+                    scheduled_end=Appointment.compute_end(scheduled, 30),
+                    status=rng.choice(statuses),
+                ))
+            Appointment.objects.bulk_create(batch)
+        self.stdout.write(f"Inserted {rows} appointments.")
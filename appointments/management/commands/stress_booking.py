@@ -0,0 +1,74 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.booking import book, SlotUnavailable
+from appointments.models import Appointment
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire parallel bookings at one doctor's slot and at many different "
+        "doctors, and fail unless exactly one same-slot booking wins and every "
+        "cross-doctor booking succeeds. Creates and removes its own users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=200, help='Parallel bookings for the contended slot')
+        parser.add_argument('--doctors', type=int, default=20, help='Doctors booked in parallel, one slot each')
+        parser.add_argument('--threads', type=int, default=50)
+
+    def handle(self, *args, **options):
+        prefix = f"stress-{uuid.uuid4().hex[:8]}"
+        users = []
+        try:
+            doctors = []
+            for i in range(max(options['doctors'], 1)):
+                user = User.objects.create(username=f"{prefix}-doc-{i}", role=User.Role.DOCTOR)
+                users.append(user)
+                doctors.append(user.doctor_profile)
+            patient_user = User.objects.create(username=f"{prefix}-patient", role=User.Role.PATIENT)
+            users.append(patient_user)
+            patient = patient_user.patient_profile
+
+            slot = timezone.make_aware(datetime.combine(
+                timezone.localdate() + timedelta(days=1),
+                datetime.min.time().replace(hour=10)
+            ))
+
+            def attempt(doctor):
+                try:
+                    book(Appointment(patient=patient, doctor=doctor, scheduled_datetime=slot))
+                    return True
+                except SlotUnavailable:
+                    return False
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                started = time.perf_counter()
+                same_slot = list(pool.map(attempt, [doctors[0]] * options['attempts']))
+                same_elapsed = time.perf_counter() - started
+
+                started = time.perf_counter()
+                spread = list(pool.map(attempt, doctors[1:]))
+                spread_elapsed = time.perf_counter() - started
+
+            winners = sum(same_slot)
+            self.stdout.write(
+                f"same slot: {winners}/{len(same_slot)} won in {same_elapsed:.2f}s; "
+                f"different doctors: {sum(spread)}/{len(spread)} won in {spread_elapsed:.2f}s"
+            )
+            if winners != 1:
+                raise CommandError(f"Expected exactly one winner for the contended slot, got {winners}.")
+            if not all(spread):
+                raise CommandError("Bookings for different doctors conflicted with each other.")
+            self.stdout.write(self.style.SUCCESS("Booking is race-free."))
+        finally:
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_initial'),
+        ('doctors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSlotMap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_maps', to='doctors.doctorprofile')),
+            ],
+            options={
+                'unique_together': {('doctor', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:05
+
+from datetime import datetime, time, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+SLOT_MINUTES = 30
+
+
+def reserve_existing(apps, schema_editor):
+    """Give upcoming active appointments their slot reservations."""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    SlotReservation = apps.get_model('appointments', 'SlotReservation')
+    step = timedelta(minutes=SLOT_MINUTES)
+
+    reservations = []
+    upcoming = Appointment.objects.filter(
+        scheduled_datetime__gte=timezone.now(),
+        status__in=['pending', 'confirmed']
+    ).order_by('created_at')
+    for appointment in upcoming.iterator():
+        local = timezone.localtime(appointment.scheduled_datetime)
+        midnight = timezone.make_aware(datetime.combine(local.date(), time.min))
+        offset = (local - midnight).total_seconds() / 60
+        slot = midnight + step * int(offset // SLOT_MINUTES)
+        end = appointment.scheduled_datetime + timedelta(minutes=appointment.duration_minutes)
+        while slot < end:
+            reservations.append(SlotReservation(
+                doctor_id=appointment.doctor_id,
+                appointment_id=appointment.pk,
+                slot_start=slot
+            ))
+            slot += step
+    # Earlier bookings keep a slot that was double-booked before this migration
+    SlotReservation.objects.bulk_create(reservations, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_doctor_slot_map'),
+        ('doctors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_start', models.DateTimeField()),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='appointments.appointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='doctors.doctorprofile')),
+            ],
+            options={
+                'unique_together': {('doctor', 'slot_start')},
+            },
+        ),
+        migrations.RunPython(reserve_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_slot_reservation'),
+        ('departments', '0001_initial'),
+        ('doctors', '0001_initial'),
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'scheduled_datetime', 'status'], name='appt_doctor_sched_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'scheduled_datetime'], name='appt_patient_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'scheduled_datetime'], name='appt_status_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['scheduled_datetime'], name='appt_sched_idx'),
+        ),
+    ]
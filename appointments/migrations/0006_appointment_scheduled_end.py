@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:11
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 5000
+
+
+def fill_scheduled_end(apps, schema_editor):
+    """Set scheduled_end on existing rows, walking the primary key in batches."""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    last_pk = 0
+    while True:
+        batch = list(
+            Appointment.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .only('pk', 'scheduled_datetime', 'duration_minutes')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        for appointment in batch:
+            appointment.scheduled_end = appointment.scheduled_datetime + timedelta(minutes=appointment.duration_minutes)
+        Appointment.objects.bulk_update(batch, ['scheduled_end'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointment_composite_indexes'),
+        ('departments', '0001_initial'),
+        ('doctors', '0001_initial'),
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='scheduled_end',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_scheduled_end, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='scheduled_end',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'scheduled_end'], name='appt_doctor_end_idx'),
+        ),
+    ]
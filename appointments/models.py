@@ -1,6 +1,47 @@
+from datetime import timedelta
+
 from django.db import models
 from django.conf import settings
 
+from .dates import day_range, start_of_today
+
+
+class AppointmentQuerySet(models.QuerySet):
+    """Date filters expressed as ranges so the composite indexes apply."""
+    
+    def on_date(self, day):
+        start, end = day_range(day)
+        return self.filter(scheduled_datetime__gte=start, scheduled_datetime__lt=end)
+    
+    def today(self):
+        from django.utils import timezone
+        return self.on_date(timezone.localdate())
+    
+    def upcoming(self):
+        """Appointments from the start of today onwards."""
+        return self.filter(scheduled_datetime__gte=start_of_today())
+    
+    def overlapping(self, start, end):
+        """Appointments whose [scheduled_datetime, scheduled_end) meets [start, end)."""
+        return self.filter(scheduled_end__gt=start, scheduled_datetime__lt=end)
+    
+    def with_payment_summary(self):
+        """Annotate ``paid_invoice_method`` so ``payment_details`` needs no query per row."""
+        from billing.models import Invoice
+        method = models.Case(
+            models.When(
+                models.Q(razorpay_payment_id__isnull=True) | models.Q(razorpay_payment_id=''),
+                then=models.Value('Offline')
+            ),
+            default=models.Value('Online')
+        )
+        # Same invoice payment_details picks with invoices.filter(status='paid').last()
+        paid_invoice = Invoice.objects.filter(
+            appointment=models.OuterRef('pk'),
+            status=Invoice.Status.PAID
+        ).order_by('created_at', 'pk').annotate(method=method).values('method')[:1]
+        return self.annotate(paid_invoice_method=models.Subquery(paid_invoice))
+
 
 class Appointment(models.Model):
     """Appointment booking model."""
@@ -35,6 +76,8 @@ class Appointment(models.Model):
     )
     scheduled_datetime = models.DateTimeField()
     duration_minutes = models.PositiveIntegerField(default=30)
+    # Denormalized scheduled_datetime + duration_minutes, kept in sync by save()
+    scheduled_end = models.DateTimeField(editable=False)
     status = models.CharField(
         max_length=20,
         choices=Status.choices,
@@ -50,12 +93,32 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AppointmentQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-scheduled_datetime']
+        indexes = [
+            models.Index(fields=['doctor', 'scheduled_datetime', 'status'], name='appt_doctor_sched_status_idx'),
+            models.Index(fields=['patient', 'scheduled_datetime'], name='appt_patient_sched_idx'),
+            models.Index(fields=['status', 'scheduled_datetime'], name='appt_status_sched_idx'),
+            models.Index(fields=['scheduled_datetime'], name='appt_sched_idx'),
+            models.Index(fields=['doctor', 'scheduled_end'], name='appt_doctor_end_idx'),
+        ]
     
     def __str__(self):
         return f"{self.patient} with {self.doctor} on {self.scheduled_datetime.strftime('%Y-%m-%d %H:%M')}"
     
+    def save(self, *args, **kwargs):
+        self.scheduled_end = self.compute_end(self.scheduled_datetime, self.duration_minutes)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'scheduled_datetime', 'duration_minutes'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'scheduled_end'}
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def compute_end(scheduled_datetime, duration_minutes):
+        return scheduled_datetime + timedelta(minutes=duration_minutes)
+    
     @property
     def is_upcoming(self):
         from django.utils import timezone
@@ -73,23 +136,23 @@ class Appointment(models.Model):
         )
     
     @classmethod
-    def check_availability(cls, doctor, datetime_slot, exclude_appointment=None):
-        """Check if the doctor is available at the given datetime."""
+    def check_availability(cls, doctor, datetime_slot, exclude_appointment=None, duration_minutes=None):
+        """Check if the doctor is free for the whole visit starting at datetime_slot."""
         from django.utils import timezone
-        from datetime import timedelta
         
         # Check if slot is in the past
         if datetime_slot < timezone.now():
             return False, "Cannot book appointments in the past."
         
-        # Check for overlapping appointments
-        start_time = datetime_slot
-        end_time = datetime_slot + timedelta(minutes=30)
+        if duration_minutes is None:
+            duration_minutes = cls._meta.get_field('duration_minutes').default
         
-        overlapping = cls.objects.filter(
+        # Check for overlapping appointments (true interval intersection)
+        overlapping = cls.objects.overlapping(
+            datetime_slot,
+            cls.compute_end(datetime_slot, duration_minutes)
+        ).filter(
             doctor=doctor,
-            scheduled_datetime__lt=end_time,
-            scheduled_datetime__gte=start_time - timedelta(minutes=30),
             status__in=[cls.Status.PENDING, cls.Status.CONFIRMED]
         )
         
@@ -105,11 +168,65 @@ class Appointment(models.Model):
     def payment_details(self):
         """Return payment method and status details."""
         if self.payment_status == self.PaymentStatus.PAID:
-            invoice = self.invoices.filter(status='paid').last()
-            if invoice:
-                if invoice.razorpay_payment_id:
-                    return {'method': 'Online', 'label': 'Online Payment', 'css': 'info'}
-                else:
-                    return {'method': 'Offline', 'label': 'Cash / Offline', 'css': 'secondary'}
+            if hasattr(self, 'paid_invoice_method'):
+                method = self.paid_invoice_method
+            else:
+                invoice = self.invoices.filter(status='paid').last()
+                method = invoice and ('Online' if invoice.razorpay_payment_id else 'Offline')
+            if method == 'Online':
+                return {'method': 'Online', 'label': 'Online Payment', 'css': 'info'}
+            if method == 'Offline':
+                return {'method': 'Offline', 'label': 'Cash / Offline', 'css': 'secondary'}
             return {'method': 'Unknown', 'label': 'Paid', 'css': 'success'}
         return {'method': 'Unpaid', 'label': 'Unpaid', 'css': 'warning'}
+
+
+class DoctorSlotMap(models.Model):
+    """Bitmap of booked slots for one doctor on one day.
+
+    Bit ``i`` covers the ``i``-th slot of the day counted from local
+    midnight (see ``appointments.slots``). Rows are rebuilt by signals
+    whenever an appointment changes, so reads never touch Appointment.
+    """
+    
+    doctor = models.ForeignKey(
+        'doctors.DoctorProfile',
+        on_delete=models.CASCADE,
+        related_name='slot_maps'
+    )
+    date = models.DateField()
+    booked = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['doctor', 'date']
+    
+    def __str__(self):
+        return f"{self.doctor} slots on {self.date}"
+
+
+class SlotReservation(models.Model):
+    """One slot held by an active appointment.
+
+    The unique (doctor, slot_start) key is what makes booking race-free:
+    two transactions reserving the same slot cannot both commit, while
+    bookings for other doctors or other slots never touch the same row.
+    """
+    
+    doctor = models.ForeignKey(
+        'doctors.DoctorProfile',
+        on_delete=models.CASCADE,
+        related_name='slot_reservations'
+    )
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name='slot_reservations'
+    )
+    slot_start = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['doctor', 'slot_start']
+    
+    def __str__(self):
+        return f"{self.doctor} at {self.slot_start.strftime('%Y-%m-%d %H:%M')}"
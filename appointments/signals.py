@@ -0,0 +1,73 @@
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Appointment, DoctorSlotMap
+from .booking import SlotUnavailable, release_slots, reserve_slots, run_with_retries
+from .slots import ACTIVE_STATUSES, refresh_day
+
+
+# The fields that decide which slots an appointment holds
+SLOT_FIELDS = ('doctor_id', 'scheduled_datetime', 'duration_minutes')
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_slots(sender, instance, update_fields=None, **kwargs):
+    """Note the stored doctor and time, so a move can free what it held."""
+    instance._stored_slots = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not {'doctor', 'doctor_id', 'scheduled_datetime', 'duration_minutes'} & set(update_fields):
+        return
+    instance._stored_slots = Appointment.objects.filter(pk=instance.pk).values_list(*SLOT_FIELDS).first()
+
+
+@receiver(post_save, sender=Appointment)
+def move_slots(sender, instance, created, **kwargs):
+    """An active appointment given another doctor or time swaps its reservations."""
+    stored = getattr(instance, '_stored_slots', None)
+    if created or not stored or instance.status not in ACTIVE_STATUSES:
+        return
+    if stored != tuple(getattr(instance, field) for field in SLOT_FIELDS):
+        # In the saving transaction, so a taken slot fails the save like a booking
+        try:
+            with transaction.atomic():
+                release_slots(instance)
+                reserve_slots(instance)
+        except IntegrityError:
+            raise SlotUnavailable("This time slot is not available.")
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_slot_map(sender, instance, **kwargs):
+    """Keep the doctor's slot bitmaps in step with their appointments."""
+    days = {(instance.doctor_id, timezone.localtime(instance.scheduled_datetime).date())}
+    stored = getattr(instance, '_stored_slots', None)
+    if stored:
+        # A moved appointment frees its old day too
+        doctor_id, scheduled_datetime, _ = stored
+        days.add((doctor_id, timezone.localtime(scheduled_datetime).date()))
+
+    def refresh():
+        for doctor_id, day in days:
+            run_with_retries(lambda: refresh_day(doctor_id, day))
+
+    # Rebuild after commit so a losing booking never touches the map, and a
+    # failed rebuild can never be mistaken for a failed booking
+    transaction.on_commit(refresh, robust=True)
+
+
+@receiver(post_save, sender=Appointment)
+def release_inactive_slots(sender, instance, created, **kwargs):
+    """Cancelled, completed and no-show appointments give their slots back."""
+    if not created and instance.status not in ACTIVE_STATUSES:
+        release_slots(instance)
+
+
+@receiver(post_delete, sender=Appointment)
+def drop_slot_map(sender, instance, **kwargs):
+    """Drop the day's bitmap; it is rebuilt on the next availability read."""
+    DoctorSlotMap.objects.filter(
+        doctor_id=instance.doctor_id,
+        date=timezone.localtime(instance.scheduled_datetime).date()
+    ).delete()
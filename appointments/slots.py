@@ -0,0 +1,166 @@
+"""
+Per-doctor slot availability.
+
+A doctor's day is cut into fixed slots of SLOT_MINUTES counted from local
+midnight. Booked slots are stored as an integer bitmap in DoctorSlotMap (one
+row per doctor per day) and refreshed from signals whenever an appointment
+changes. Working hours are applied at read time, so editing a doctor's
+availability never invalidates stored maps.
+"""
+from datetime import time, timedelta
+
+from django.utils import timezone
+
+from .dates import day_range
+from .models import Appointment, DoctorSlotMap
+
+
+SLOT_MINUTES = Appointment._meta.get_field('duration_minutes').default
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# Used when a doctor has not filled in available_from / available_to
+DEFAULT_AVAILABLE_FROM = time(9, 0)
+DEFAULT_AVAILABLE_TO = time(17, 0)
+
+ACTIVE_STATUSES = [Appointment.Status.PENDING, Appointment.Status.CONFIRMED]
+
+
+def day_start(day):
+    """Return the timezone-aware local midnight that starts ``day``."""
+    return day_range(day)[0]
+
+
+def span_mask(offset_minutes, duration_minutes):
+    """Bits covered by an interval starting ``offset_minutes`` after midnight."""
+    first = max(int(offset_minutes // SLOT_MINUTES), 0)
+    last = min(-(-int(offset_minutes + duration_minutes) // SLOT_MINUTES), SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def slot_starts(start, duration_minutes):
+    """Start times of every grid slot touched by ``[start, start + duration)``."""
+    local = timezone.localtime(start)
+    midnight = day_start(local.date())
+    step = timedelta(minutes=SLOT_MINUTES)
+    end = start + timedelta(minutes=duration_minutes)
+
+    offset = (local - midnight).total_seconds() / 60
+    slot = midnight + step * int(offset // SLOT_MINUTES)
+    starts = []
+    while slot < end:
+        starts.append(slot)
+        slot += step
+    return starts
+
+
+def working_mask(doctor):
+    """Bits for the slots that fit entirely inside the doctor's working hours."""
+    start = doctor.available_from or DEFAULT_AVAILABLE_FROM
+    end = doctor.available_to or DEFAULT_AVAILABLE_TO
+    start_minutes = start.hour * 60 + start.minute
+    end_minutes = end.hour * 60 + end.minute
+    first = -(-start_minutes // SLOT_MINUTES)
+    last = end_minutes // SLOT_MINUTES
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def compute_masks(doctor_ids, first_day, last_day):
+    """Build booked bitmaps straight from Appointment in a single query."""
+    range_start = day_start(first_day)
+    range_end = day_start(last_day + timedelta(days=1))
+
+    rows = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        scheduled_datetime__gte=range_start,
+        scheduled_datetime__lt=range_end,
+        status__in=ACTIVE_STATUSES
+    ).values_list('doctor_id', 'scheduled_datetime', 'duration_minutes')
+
+    masks = {}
+    for doctor_id, scheduled, duration in rows:
+        local = timezone.localtime(scheduled)
+        offset = (local - day_start(local.date())).total_seconds() / 60
+        key = (doctor_id, local.date())
+        masks[key] = masks.get(key, 0) | span_mask(offset, duration)
+    return masks
+
+
+def refresh_day(doctor_id, day):
+    """Recompute and store the bitmap for one doctor on one day."""
+    booked = compute_masks([doctor_id], day, day).get((doctor_id, day), 0)
+    DoctorSlotMap.objects.update_or_create(
+        doctor_id=doctor_id,
+        date=day,
+        defaults={'booked': booked}
+    )
+    return booked
+
+
+def load_masks(doctor_ids, first_day, last_day):
+    """
+    Return ``{(doctor_id, date): booked}`` for every doctor and day in range.
+
+    Stored maps are read in one query; any missing days are computed in one
+    more query and saved so the next read is served from DoctorSlotMap.
+    """
+    doctor_ids = list(doctor_ids)
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+    masks = {
+        (doctor_id, day): booked
+        for doctor_id, day, booked in DoctorSlotMap.objects.filter(
+            doctor_id__in=doctor_ids,
+            date__gte=first_day,
+            date__lte=last_day
+        ).values_list('doctor_id', 'date', 'booked')
+    }
+
+    missing = [(d, day) for d in doctor_ids for day in days if (d, day) not in masks]
+    if missing:
+        computed = compute_masks({d for d, _ in missing}, first_day, last_day)
+        new_maps = []
+        for doctor_id, day in missing:
+            masks[(doctor_id, day)] = computed.get((doctor_id, day), 0)
+            new_maps.append(DoctorSlotMap(
+                doctor_id=doctor_id,
+                date=day,
+                booked=masks[(doctor_id, day)]
+            ))
+        # A concurrent signal refresh wins over our snapshot
+        DoctorSlotMap.objects.bulk_create(new_maps, ignore_conflicts=True)
+
+    return masks
+
+
+def free_slots(doctors, first_day, last_day):
+    """
+    Return ``{doctor_pk: {date: [slot_start, ...]}}`` of bookable slots.
+
+    Slot starts are timezone-aware datetimes; slots already in the past are
+    left out.
+    """
+    doctors = list(doctors)
+    masks = load_masks([d.pk for d in doctors], first_day, last_day)
+    now = timezone.now()
+    step = timedelta(minutes=SLOT_MINUTES)
+
+    result = {}
+    for doctor in doctors:
+        hours = working_mask(doctor)
+        per_day = {}
+        day = first_day
+        while day <= last_day:
+            free = hours & ~masks.get((doctor.pk, day), 0)
+            start = day_start(day)
+            per_day[day] = [
+                start + step * i
+                for i in range(SLOTS_PER_DAY)
+                if free >> i & 1 and start + step * i >= now
+            ]
+            day += timedelta(days=1)
+        result[doctor.pk] = per_day
+    return result
@@ -1,3 +1,211 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Barrier
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.booking import SlotUnavailable, book
+from appointments.forms import AppointmentBookingForm
+from appointments.models import Appointment, DoctorSlotMap, SlotReservation
+from departments.models import Department
+from hospital_project.pagination import paginate
+
+
+THREADS = 8
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Bookings from parallel threads, each on its own connection."""
+
+    def setUp(self):
+        self.doctors = [
+            User.objects.create(username=f'doctor-{i}', role=User.Role.DOCTOR).doctor_profile
+            for i in range(THREADS)
+        ]
+        self.patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        self.slot = timezone.make_aware(datetime.combine(
+            timezone.localdate() + timedelta(days=1),
+            datetime.min.time().replace(hour=10)
+        ))
+
+    def book_in_parallel(self, doctors):
+        """Book ``self.slot`` with each doctor at once; returns who won."""
+        barrier = Barrier(len(doctors))
+
+        def attempt(doctor):
+            try:
+                barrier.wait()
+                book(Appointment(patient=self.patient, doctor=doctor, scheduled_datetime=self.slot))
+                return True
+            except SlotUnavailable:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(doctors)) as pool:
+            return list(pool.map(attempt, doctors))
+
+    def test_one_winner_per_slot(self):
+        doctor = self.doctors[0]
+        won = self.book_in_parallel([doctor] * THREADS)
+        self.assertEqual(sum(won), 1)
+        self.assertEqual(Appointment.objects.filter(doctor=doctor).count(), 1)
+        self.assertEqual(SlotReservation.objects.filter(doctor=doctor, slot_start=self.slot).count(), 1)
+
+    def test_different_doctors_do_not_conflict(self):
+        won = self.book_in_parallel(self.doctors)
+        self.assertTrue(all(won))
+        self.assertEqual(
+            SlotReservation.objects.filter(slot_start=self.slot).count(),
+            len(self.doctors)
+        )
+
+
+class MovedAppointmentTests(TestCase):
+    """Giving a booked appointment another doctor or time."""
+
+    def setUp(self):
+        self.doctor, self.other = [
+            User.objects.create(username=f'doctor-{i}', role=User.Role.DOCTOR).doctor_profile
+            for i in range(2)
+        ]
+        patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.slot = timezone.make_aware(datetime.combine(self.day, datetime.min.time().replace(hour=10)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment = book(Appointment(patient=patient, doctor=self.doctor, scheduled_datetime=self.slot))
+            self.taken = book(Appointment(
+                patient=patient, doctor=self.doctor, scheduled_datetime=self.slot + timedelta(hours=2)
+            ))
+
+    def booked(self, doctor, day):
+        return DoctorSlotMap.objects.get(doctor=doctor, date=day).booked
+
+    def test_move_to_another_day_frees_the_old_slot(self):
+        later = self.slot + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.scheduled_datetime = later
+            self.appointment.save()
+
+        self.assertEqual(
+            list(self.appointment.slot_reservations.values_list('doctor_id', 'slot_start')),
+            [(self.doctor.pk, later)]
+        )
+        # Only the appointment that stayed is left on the old day
+        # Bits count half-hour slots from midnight: 20 is 10:00, 24 is 12:00
+        self.assertEqual(self.booked(self.doctor, self.day), 1 << 24)
+        self.assertEqual(self.booked(self.doctor, later.date()), 1 << 20)
+
+    def test_move_to_another_doctor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.doctor = self.other
+            self.appointment.save()
+
+        self.assertEqual(
+            list(self.appointment.slot_reservations.values_list('doctor_id', 'slot_start')),
+            [(self.other.pk, self.slot)]
+        )
+        self.assertEqual(self.booked(self.doctor, self.day), 1 << 24)
+        self.assertEqual(self.booked(self.other, self.day), 1 << 20)
+
+    def test_move_onto_a_taken_slot_fails(self):
+        self.appointment.scheduled_datetime = self.taken.scheduled_datetime
+        with self.assertRaises(SlotUnavailable), transaction.atomic():
+            self.appointment.save()
+        self.assertEqual(
+            list(self.appointment.slot_reservations.values_list('slot_start', flat=True)),
+            [self.slot]
+        )
+
+
+class BookingFormTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        user = User.objects.create(username='doctor', role=User.Role.DOCTOR)
+        User.objects.filter(pk=user.pk).update(is_approved=True)
+        cls.doctor = user.doctor_profile
+        cls.day = timezone.localdate() + timedelta(days=1)
+        patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        Appointment.objects.create(
+            patient=patient, doctor=cls.doctor, department=cls.department,
+            scheduled_datetime=timezone.make_aware(datetime.combine(cls.day, datetime.min.time().replace(hour=10, minute=45)))
+        )
+
+    def form(self, time, **instance):
+        return AppointmentBookingForm({
+            'department': self.department.pk,
+            'doctor': self.doctor.pk,
+            'scheduled_date': self.day.isoformat(),
+            'scheduled_time': time,
+            'reason': 'Checkup',
+        }, instance=Appointment(**instance))
+
+    def test_checks_the_whole_visit(self):
+        self.assertTrue(self.form('10:00').is_valid())
+        # An hour from 10:00 runs into the 10:45 visit
+        form = self.form('10:00', duration_minutes=60)
+        self.assertFalse(form.is_valid())
+        self.assertIn('This time slot is not available.', form.non_field_errors())
+
+
+class KeysetPaginationTests(TestCase):
+    """Deep pages seek into the index rather than scanning up to the cursor."""
+
+    ORDERING = ('-scheduled_datetime', '-id')
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = User.objects.create(username='doctor', role=User.Role.DOCTOR).doctor_profile
+        patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, doctor=doctor,
+                # Pairs share a time, so the id breaks ties
+                scheduled_datetime=start - timedelta(hours=i // 2),
+                scheduled_end=start - timedelta(hours=i // 2) + timedelta(minutes=30)
+            )
+            for i in range(200)
+        ])
+
+    def walk(self, query=''):
+        request = RequestFactory().get(f'/?{query}')
+        with CaptureQueriesContext(connection) as queries:
+            page = paginate(request, Appointment.objects.all(), self.ORDERING)
+        return page, queries.captured_queries[-1]['sql']
+
+    def test_pages_cover_every_row_once_in_order(self):
+        seen = []
+        page, _ = self.walk()
+        seen.extend(page)
+        while page.has_next:
+            page, _ = self.walk(page.next_query)
+            seen.extend(page)
+        self.assertEqual(
+            [appointment.pk for appointment in seen],
+            list(Appointment.objects.order_by(*self.ORDERING).values_list('pk', flat=True))
+        )
+        # And back again
+        while page.has_previous:
+            page, _ = self.walk(page.previous_query)
+        self.assertEqual(page.object_list, seen[:len(page)])
+
+    def test_deep_page_seeks_the_index(self):
+        page, _ = self.walk()
+        for _ in range(6):
+            page, sql = self.walk(page.next_query)
+        # Without the plain bound, large tables (and ANALYZE stats) scan the
+        # index from its start; this small one may seek either way
+        self.assertIn('"scheduled_datetime" <=', sql)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn('SEARCH', plan)
+            self.assertNotIn('SCAN', plan)
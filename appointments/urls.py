@@ -6,4 +6,5 @@ app_name = 'appointments'
 urlpatterns = [
     # Appointments will primarily be accessed via patients and doctors apps
     # This app provides the models and shared utilities
+    path('api/free-slots/', views.free_slots, name='free_slots'),
 ]
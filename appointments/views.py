@@ -1,4 +1,60 @@
-from django.shortcuts import render
+from datetime import date, timedelta
+
+from django.http import JsonResponse
+from django.utils import timezone
+
+from doctors.models import DoctorProfile
+from .slots import free_slots as find_free_slots
 
 # Appointments are managed through patients and doctors apps
-# This views.py is kept minimal
+# This views.py only exposes shared availability endpoints
+
+MAX_SLOT_DAYS = 31
+
+
+def free_slots(request):
+    """AJAX endpoint listing free slots for a doctor or a whole department."""
+    doctor_id = request.GET.get('doctor_id')
+    department_id = request.GET.get('department_id')
+    
+    if not doctor_id and not department_id:
+        return JsonResponse({'error': 'doctor_id or department_id is required.'}, status=400)
+    
+    try:
+        doctor_id = int(doctor_id) if doctor_id else None
+        department_id = int(department_id) if department_id else None
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else timezone.localdate()
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid doctor_id, department_id, start or days.'}, status=400)
+    days = max(1, min(days, MAX_SLOT_DAYS))
+    end = start + timedelta(days=days - 1)
+    
+    doctors = DoctorProfile.objects.select_related('user').filter(
+        user__is_approved=True,
+        user__is_active=True
+    )
+    if doctor_id:
+        doctors = doctors.filter(pk=doctor_id)
+    else:
+        doctors = doctors.filter(department_id=department_id)
+    doctors = list(doctors)
+    
+    slots = find_free_slots(doctors, start, end)
+    
+    doctor_list = [
+        {
+            'id': doctor.pk,
+            'name': doctor.full_name,
+            'slots': {
+                day.isoformat(): [timezone.localtime(slot).strftime('%H:%M') for slot in day_slots]
+                for day, day_slots in slots[doctor.pk].items()
+            },
+        }
+        for doctor in doctors
+    ]
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'doctors': doctor_list,
+    })
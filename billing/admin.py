@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Invoice
+from .models import Invoice, LedgerBalance, LedgerEntry, WebhookEvent
+from .tasks import apply_webhook_events
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
@@ -8,3 +9,48 @@ class InvoiceAdmin(admin.ModelAdmin):
     search_fields = ('patient__user__username', 'razorpay_payment_id', 'razorpay_order_id')
     date_hierarchy = 'created_at'
     list_editable = ('status',)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event', 'razorpay_order_id', 'status', 'occurred_at', 'received_at', 'processed_at')
+    list_filter = ('status', 'event')
+    search_fields = ('event_id', 'razorpay_order_id', 'razorpay_payment_id')
+    date_hierarchy = 'received_at'
+    actions = ['apply_again']
+
+    @admin.action(description='Apply selected failed events again')
+    def apply_again(self, request, queryset):
+        count = queryset.filter(status=WebhookEvent.Status.FAILED).update(
+            status=WebhookEvent.Status.PENDING, processed_at=None, error=''
+        )
+        if count:
+            apply_webhook_events.enqueue_once()
+        self.message_user(request, f'{count} events queued again.')
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """The ledger is written by billing.ledger only."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(ReadOnlyAdmin):
+    list_display = ('id', 'date', 'kind', 'amount', 'invoice', 'invoice_type', 'department', 'doctor')
+    list_filter = ('kind', 'invoice_type', 'date')
+    date_hierarchy = 'date'
+
+
+@admin.register(LedgerBalance)
+class LedgerBalanceAdmin(ReadOnlyAdmin):
+    list_display = ('date', 'department', 'doctor', 'payments', 'refunds', 'balance')
+    list_filter = ('date',)
+    date_hierarchy = 'date'
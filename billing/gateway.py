@@ -0,0 +1,117 @@
+"""
+The Razorpay API client.
+
+One client per process, over a pooled keep-alive session whose requests all
+carry ``RAZORPAY_TIMEOUT`` (the SDK itself sets none, so a stalled gateway
+would hold a worker indefinitely). Calls go through a circuit breaker: after
+``FAILURE_THRESHOLD`` consecutive connection errors, timeouts or server
+errors it fails fast with GatewayUnavailable for ``RESET_SECONDS``, then lets
+one trial call through. A client error (bad request) means the gateway is
+up, so it never trips the breaker. ``RAZORPAY_BASE_URL`` points the client at
+``manage.py razorpay_standin`` for offline runs.
+"""
+import threading
+import time
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30
+# Concurrent keep-alive connections to the gateway per process
+POOL_SIZE = 20
+
+
+class GatewayUnavailable(Exception):
+    """Raised without calling Razorpay while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker shared by the threads of one process."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self._trial or time.monotonic() - self.opened_at < self.reset_seconds:
+                raise GatewayUnavailable('Razorpay is not responding; try again shortly.')
+            # Half-open: this call decides whether the breaker closes again
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class GatewayClient(razorpay.Client):
+    """razorpay.Client whose calls are guarded by a circuit breaker."""
+
+    def __init__(self, breaker=None, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker or CircuitBreaker()
+
+    def request(self, method, path, **options):
+        self.breaker.before_call()
+        try:
+            response = super().request(method, path, **options)
+        except razorpay.errors.BadRequestError:
+            self.breaker.record_success()
+            raise
+        except (requests.RequestException, razorpay.errors.ServerError, razorpay.errors.GatewayError, ValueError):
+            # ValueError: a body that is not JSON, e.g. a proxy's error page
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+
+def make_client(base_url=None, timeout=None, auth=None):
+    """A Razorpay client for the configured account, unless ``auth`` names another."""
+    options = {}
+    base_url = base_url or settings.RAZORPAY_BASE_URL
+    if base_url:
+        options['base_url'] = base_url
+    return GatewayClient(
+        session=TimeoutSession(timeout or settings.RAZORPAY_TIMEOUT),
+        auth=auth or (settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+        **options
+    )
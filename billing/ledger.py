@@ -0,0 +1,227 @@
+"""
+Append-only revenue ledger.
+
+Whatever changes an invoice's paid state also posts LedgerEntry rows, in
+the same transaction: a payment as a credit, a refund as a debit. Entries
+are never changed; a correction is another entry. Posting also moves the
+day's LedgerBalance of each account the entry belongs to (the hospital, the
+appointment's department and its doctor), whose ``balance`` runs from the
+first entry on. Revenue over any period is then the difference of two
+balances, two indexed reads, instead of a sum over every paid invoice.
+
+A payment counts towards the day the invoice was paid, like the DailyStats
+rollup, so one booked late (e.g. by reconcile_payments) moves that day and
+the balances of every day after it. A refund counts towards the day it is
+posted. Rows written in bulk (bulk_create, update()) post nothing;
+``post_missing`` and ``rebuild_balances``, run by ``manage.py
+rebuild_ledger``, catch the ledger up with them.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appointments.models import Appointment
+from .models import Invoice, LedgerBalance, LedgerEntry
+
+
+# The account of the hospital as a whole
+HOSPITAL = (None, None)
+BATCH_SIZE = 2000
+
+
+def accounts(department_id, doctor_id):
+    """The (department_id, doctor_id) accounts an entry of this bucket moves."""
+    keys = [HOSPITAL]
+    if department_id:
+        keys.append((department_id, None))
+    if doctor_id:
+        keys.append((None, doctor_id))
+    return keys
+
+
+def record_payments(invoices):
+    """Post the payment of each invoice, which must just have been marked paid."""
+    return post([
+        (invoice, LedgerEntry.Kind.PAYMENT, invoice.amount, invoice.paid_at)
+        for invoice in invoices
+    ])
+
+
+def record_refund(invoice, amount):
+    """Post a refund of ``amount`` (a positive Decimal) against the invoice."""
+    return post([(invoice, LedgerEntry.Kind.REFUND, -amount, None)])
+
+
+def post(movements):
+    """
+    Write ``(invoice, kind, signed amount, when)`` movements and move the
+    balances. Each entry counts towards the local day of ``when``, or of
+    now if it is None.
+    """
+    now = timezone.now()
+    buckets = {
+        pk: (department_id, doctor_id)
+        for pk, department_id, doctor_id in Appointment.objects.filter(
+            pk__in={invoice.appointment_id for invoice, kind, amount, when in movements if invoice.appointment_id}
+        ).values_list('pk', 'department_id', 'doctor_id')
+    }
+
+    entries = []
+    # (account, day) -> [payments, refunds]
+    moves = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+    for invoice, kind, amount, when in movements:
+        department_id, doctor_id = buckets.get(invoice.appointment_id, HOSPITAL)
+        day = timezone.localdate(when or now)
+        entries.append(LedgerEntry(
+            invoice=invoice,
+            kind=kind,
+            amount=amount,
+            invoice_type=invoice.invoice_type,
+            department_id=department_id,
+            doctor_id=doctor_id,
+            date=day,
+            created_at=now,
+        ))
+        for account in accounts(department_id, doctor_id):
+            moves[account, day][kind == LedgerEntry.Kind.REFUND] += abs(amount)
+    LedgerEntry.objects.bulk_create(entries)
+
+    for ((department_id, doctor_id), day), (payments, refunds) in moves.items():
+        move(day, department_id, doctor_id, payments, refunds)
+    return entries
+
+
+def move(day, department_id, doctor_id, payments, refunds):
+    """Add one day's payments and refunds to an account's balances."""
+    account = LedgerBalance.objects.filter(department_id=department_id, doctor_id=doctor_id)
+    change = {
+        'payments': F('payments') + payments,
+        'refunds': F('refunds') + refunds,
+        'balance': F('balance') + (payments - refunds),
+    }
+    if not account.filter(date=day).update(**change):
+        with transaction.atomic():
+            # Locking the day before holds off postings that would move it
+            # until the new day has copied its balance. A posting that opens
+            # an even earlier day meanwhile can still miss this one;
+            # rebuild_balances repairs that.
+            previous = account.filter(date__lt=day).select_for_update().order_by('-date').values_list('balance', flat=True).first()
+            # Another transaction may be opening the same day
+            LedgerBalance.objects.get_or_create(
+                date=day,
+                department_id=department_id,
+                doctor_id=doctor_id,
+                defaults={'balance': previous or 0}
+            )
+        account.filter(date=day).update(**change)
+    # Later days carry the running total forward
+    account.filter(date__gt=day).update(balance=F('balance') + (payments - refunds))
+
+
+def balance(day, department_id=None, doctor_id=None):
+    """An account's net revenue from its first entry through ``day``."""
+    return LedgerBalance.objects.filter(
+        department_id=department_id,
+        doctor_id=doctor_id,
+        date__lte=day
+    ).order_by('-date').values_list('balance', flat=True).first() or Decimal('0')
+
+
+def revenue(start, end, department_id=None, doctor_id=None):
+    """Net revenue (payments less refunds) posted from ``start`` to ``end``, inclusive."""
+    return (
+        balance(end, department_id, doctor_id)
+        - balance(start - timedelta(days=1), department_id, doctor_id)
+    )
+
+
+def daily(start, end, department_id=None, doctor_id=None):
+    """``{date: net revenue}`` for the days from ``start`` to ``end`` the account moved."""
+    return {
+        day: payments - refunds
+        for day, payments, refunds in LedgerBalance.objects.filter(
+            department_id=department_id,
+            doctor_id=doctor_id,
+            date__gte=start,
+            date__lte=end
+        ).values_list('date', 'payments', 'refunds')
+    }
+
+
+def post_missing(invoices=None):
+    """
+    Post what the ledger lacks for settled ``invoices`` (default: all of
+    them): the payment of a paid or refunded invoice with no payment entry,
+    dated when it was paid, and the unrefunded rest of a refunded invoice,
+    dated at its last change. Only adds entries and does not move the
+    balances; follow with ``rebuild_balances``. Returns how many it posted.
+    """
+    if invoices is None:
+        invoices = Invoice.objects.all()
+    rows = invoices.filter(
+        status__in=[Invoice.Status.PAID, Invoice.Status.REFUNDED],
+        paid_at__isnull=False
+    ).annotate(
+        paid=Coalesce(Sum('ledger_entries__amount', filter=Q(ledger_entries__kind=LedgerEntry.Kind.PAYMENT)), Decimal('0')),
+        refunded=Coalesce(-Sum('ledger_entries__amount', filter=Q(ledger_entries__kind=LedgerEntry.Kind.REFUND)), Decimal('0')),
+    ).values_list(
+        'pk', 'invoice_type', 'amount', 'status', 'paid_at', 'updated_at',
+        'appointment__department_id', 'appointment__doctor_id', 'paid', 'refunded'
+    ).order_by('pk')
+
+    now = timezone.now()
+    posted = 0
+    entries = []
+    for pk, invoice_type, amount, status, paid_at, updated_at, department_id, doctor_id, paid, refunded in rows.iterator(BATCH_SIZE):
+        movements = []
+        if not paid:
+            movements.append((LedgerEntry.Kind.PAYMENT, amount, paid_at))
+        if status == Invoice.Status.REFUNDED and refunded < amount:
+            movements.append((LedgerEntry.Kind.REFUND, refunded - amount, max(updated_at, paid_at)))
+        for kind, signed, when in movements:
+            entries.append(LedgerEntry(
+                invoice_id=pk, kind=kind, amount=signed, invoice_type=invoice_type,
+                department_id=department_id, doctor_id=doctor_id,
+                date=timezone.localdate(when), created_at=now
+            ))
+        if len(entries) >= BATCH_SIZE:
+            posted += len(LedgerEntry.objects.bulk_create(entries))
+            entries = []
+    posted += len(LedgerEntry.objects.bulk_create(entries))
+    return posted
+
+
+def rebuild_balances():
+    """
+    Replace every LedgerBalance with running totals summed from the entries.
+    Postings made while it runs can be lost, so run it when the site is quiet.
+    """
+    # (department_id, doctor_id) -> day -> [payments, refunds]
+    days = defaultdict(lambda: defaultdict(lambda: [Decimal('0'), Decimal('0')]))
+    for row in LedgerEntry.objects.values('date', 'department_id', 'doctor_id').annotate(
+        payments=Coalesce(Sum('amount', filter=Q(kind=LedgerEntry.Kind.PAYMENT)), Decimal('0')),
+        refunds=Coalesce(-Sum('amount', filter=Q(kind=LedgerEntry.Kind.REFUND)), Decimal('0')),
+    ).order_by():
+        for account in accounts(row['department_id'], row['doctor_id']):
+            day = days[account][row['date']]
+            day[0] += row['payments']
+            day[1] += row['refunds']
+
+    balances = []
+    for (department_id, doctor_id), moves in days.items():
+        total = Decimal('0')
+        for day, (payments, refunds) in sorted(moves.items()):
+            total += payments - refunds
+            balances.append(LedgerBalance(
+                date=day, department_id=department_id, doctor_id=doctor_id,
+                payments=payments, refunds=refunds, balance=total
+            ))
+    with transaction.atomic():
+        LedgerBalance.objects.all().delete()
+        LedgerBalance.objects.bulk_create(balances, batch_size=BATCH_SIZE)
+    return len(balances)
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from billing.razorpay_standin import RazorpayStandIn
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local stand-in for the Razorpay orders/payments API, so the "
+        "payment pages run offline. Start the site with RAZORPAY_BASE_URL "
+        "pointing at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each reply')
+        parser.add_argument('--fail-status', type=int, help='Answer every call with this HTTP status')
+
+    def handle(self, *args, **options):
+        standin = RazorpayStandIn(
+            settings.RAZORPAY_KEY_SECRET or 'standin-secret',
+            port=options['port'],
+            latency=options['latency']
+        )
+        standin.failing = options['fail_status']
+        with standin:
+            self.stdout.write(f"Razorpay stand-in on {standin.url}; run the site with RAZORPAY_BASE_URL={standin.url}")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f"Served {standin.calls} calls, created {len(standin.orders)} orders.")
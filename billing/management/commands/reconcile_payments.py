@@ -0,0 +1,68 @@
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+
+import razorpay
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from billing.gateway import GatewayUnavailable, make_client
+from billing.reconcile import reconcile
+
+
+def moment(value):
+    """An ISO date or datetime, in the current time zone unless it says otherwise."""
+    parsed = datetime.fromisoformat(value)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the payments Razorpay captured in a window with the invoices, "
+        "mark invoices paid whose capture was never recorded and report every "
+        "other discrepancy. Run it on a schedule, e.g. hourly over the last day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=moment, help='Start of the window (default: --hours ago)')
+        parser.add_argument('--until', type=moment, help='End of the window (default: now)')
+        parser.add_argument('--hours', type=int, default=24, help='Window length when --since is not given')
+        parser.add_argument('--dry-run', action='store_true', help='Report only; change nothing')
+        parser.add_argument('--output', help='Write the full JSON report here')
+
+    def handle(self, *args, **options):
+        until = options['until'] or timezone.now()
+        since = options['since'] or until - timedelta(hours=options['hours'])
+        if since >= until:
+            raise CommandError("--since must be before --until.")
+
+        try:
+            report = reconcile(make_client(), since, until, dry_run=options['dry_run'])
+        except (GatewayUnavailable, razorpay.errors.ServerError, razorpay.errors.GatewayError,
+                requests.RequestException) as e:
+            # Nothing is corrected until every payment in the window is read
+            raise CommandError(f"Razorpay is unavailable, nothing was changed: {e}")
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(json.dumps(report, indent=2) + '\n')
+
+        discrepancies = report['discrepancies']
+        self.stdout.write(f"{report['captured']} captured payments from {since} to {until}.")
+        for kind, count in sorted(Counter(issue['kind'] for issue in discrepancies).items()):
+            fixed = sum(1 for issue in discrepancies if issue['kind'] == kind and issue['fixed'])
+            self.stdout.write(f"  {kind}: {count} ({fixed} fixed)")
+        unresolved = [issue for issue in discrepancies if not issue['fixed']]
+        for issue in unresolved[:20]:
+            self.stdout.write(
+                f"  {issue['kind']}: invoice {issue['invoice_id']}, "
+                f"order {issue['razorpay_order_id']}, payment {issue['razorpay_payment_id']}"
+            )
+        if len(unresolved) > 20:
+            self.stdout.write(f"  ... and {len(unresolved) - 20} more")
+        style = self.style.WARNING if unresolved else self.style.SUCCESS
+        if options['dry_run']:
+            self.stdout.write(style(f"Would fix {report['correctable']} invoices; nothing was changed."))
+        else:
+            self.stdout.write(style(f"Fixed {report['fixed']} invoices; {len(unresolved)} discrepancies left."))
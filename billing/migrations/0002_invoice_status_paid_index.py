@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_scheduled_end'),
+        ('billing', '0001_initial'),
+        ('patients', '0001_initial'),
+        ('pharmacy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'paid_at'], name='invoice_status_paid_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_invoice_status_paid_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=100, unique=True)),
+                ('event', models.CharField(max_length=50)),
+                ('razorpay_order_id', models.CharField(blank=True, max_length=100)),
+                ('razorpay_payment_id', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored')], default='pending', max_length=20)),
+                ('occurred_at', models.DateTimeField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='webhook_status_idx'), models.Index(fields=['razorpay_order_id', 'status'], name='webhook_order_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_webhook_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='razorpay_order_amount',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='razorpay_order_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
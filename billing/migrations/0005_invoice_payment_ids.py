@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:58
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+SETTLED = ('paid', 'refunded')
+# Invoices that agree on these (and the shared id) are copies of one another
+COPY_FIELDS = ('patient_id', 'invoice_type', 'appointment_id', 'pharmacy_order_id', 'amount')
+
+
+def merge_duplicates(apps, schema_editor):
+    """Leave at most one invoice per Razorpay order id and payment id.
+
+    In each group the settled, then newest, invoice is kept. Copies of it are
+    deleted; other unpaid invoices lose the stale id and get a fresh order at
+    their next checkout. Two distinct settled invoices sharing an id cannot
+    be merged safely, so they stop the migration for a manual fix.
+    """
+    Invoice = apps.get_model('billing', 'Invoice')
+    conflicts = []
+    for field in ('razorpay_order_id', 'razorpay_payment_id'):
+        # The new constraints only skip NULL
+        Invoice.objects.filter(**{field: ''}).update(**{field: None})
+        duplicated = (
+            Invoice.objects.filter(**{f'{field}__isnull': False})
+            .values(field).annotate(copies=Count('id')).filter(copies__gt=1)
+            .values_list(field, flat=True)
+        )
+        for value in list(duplicated):
+            invoices = sorted(
+                Invoice.objects.filter(**{field: value}),
+                key=lambda invoice: (invoice.status in SETTLED, invoice.created_at, invoice.pk),
+                reverse=True
+            )
+            keeper = invoices[0]
+            for invoice in invoices[1:]:
+                if all(getattr(invoice, name) == getattr(keeper, name) for name in COPY_FIELDS):
+                    invoice.delete()
+                elif invoice.status not in SETTLED:
+                    Invoice.objects.filter(pk=invoice.pk).update(**{field: None})
+                else:
+                    conflicts.append(f'{field}={value}: invoices {keeper.pk} and {invoice.pk}')
+    if conflicts:
+        raise RuntimeError(
+            'Settled invoices share a Razorpay id; resolve these before migrating:\n  '
+            + '\n  '.join(conflicts)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_scheduled_end'),
+        ('billing', '0004_razorpay_order_reuse'),
+        ('patients', '0002_patient_created_index'),
+        ('pharmacy', '0006_medicine_sku'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['patient', 'created_at'], name='invoice_patient_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(condition=models.Q(('razorpay_order_id__isnull', False)), fields=('razorpay_order_id',), name='invoice_unique_razorpay_order'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(condition=models.Q(('razorpay_payment_id__isnull', False)), fields=('razorpay_payment_id',), name='invoice_unique_razorpay_payment'),
+        ),
+    ]
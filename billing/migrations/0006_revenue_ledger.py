@@ -0,0 +1,111 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:12
+
+from collections import defaultdict
+from decimal import Decimal
+from itertools import accumulate
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+BATCH_SIZE = 2000
+
+
+def open_ledger(apps, schema_editor):
+    """Post the payments and refunds already on record, on the days they happened."""
+    Invoice = apps.get_model('billing', 'Invoice')
+    LedgerEntry = apps.get_model('billing', 'LedgerEntry')
+    LedgerBalance = apps.get_model('billing', 'LedgerBalance')
+
+    # (department_id, doctor_id) account -> day -> [payments, refunds]
+    days = defaultdict(lambda: defaultdict(lambda: [Decimal('0'), Decimal('0')]))
+    entries = []
+    settled = Invoice.objects.filter(status__in=['paid', 'refunded'], paid_at__isnull=False).values_list(
+        'pk', 'invoice_type', 'amount', 'status', 'paid_at', 'updated_at',
+        'appointment__department_id', 'appointment__doctor_id'
+    ).order_by('pk')
+    for pk, invoice_type, amount, status, paid_at, updated_at, department_id, doctor_id in settled.iterator(BATCH_SIZE):
+        movements = [('payment', amount, paid_at)]
+        # Refunds were never dated; the last change to the invoice is the best guess
+        if status == 'refunded':
+            movements.append(('refund', -amount, max(updated_at, paid_at)))
+        for kind, signed, when in movements:
+            day = timezone.localtime(when).date()
+            entries.append(LedgerEntry(
+                invoice_id=pk, kind=kind, amount=signed, invoice_type=invoice_type,
+                department_id=department_id, doctor_id=doctor_id, date=day, created_at=when
+            ))
+            accounts = [(None, None)]
+            if department_id:
+                accounts.append((department_id, None))
+            if doctor_id:
+                accounts.append((None, doctor_id))
+            for account in accounts:
+                days[account][day][kind == 'refund'] += abs(signed)
+        if len(entries) >= BATCH_SIZE:
+            LedgerEntry.objects.bulk_create(entries)
+            entries = []
+    LedgerEntry.objects.bulk_create(entries)
+
+    balances = []
+    for (department_id, doctor_id), moves in days.items():
+        ordered = sorted(moves.items())
+        running = accumulate(payments - refunds for day, (payments, refunds) in ordered)
+        balances.extend(
+            LedgerBalance(
+                date=day, department_id=department_id, doctor_id=doctor_id,
+                payments=payments, refunds=refunds, balance=total
+            )
+            for (day, (payments, refunds)), total in zip(ordered, running)
+        )
+    LedgerBalance.objects.bulk_create(balances, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_invoice_payment_ids'),
+        ('departments', '0001_initial'),
+        ('doctors', '0002_doctor_prescription_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payments', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('refunds', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('department', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_balances', to='departments.department')),
+                ('doctor', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_balances', to='doctors.doctorprofile')),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('department__isnull', True), ('doctor__isnull', True), _connector='OR'), name='ledgerbalance_one_account'), models.UniqueConstraint(condition=models.Q(('department__isnull', True), ('doctor__isnull', True)), fields=('date',), name='ledgerbalance_unique_hospital'), models.UniqueConstraint(condition=models.Q(('department__isnull', False), ('doctor__isnull', True)), fields=('department', 'date'), name='ledgerbalance_unique_department'), models.UniqueConstraint(condition=models.Q(('doctor__isnull', False)), fields=('doctor', 'date'), name='ledgerbalance_unique_doctor')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('payment', 'Payment'), ('refund', 'Refund')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('invoice_type', models.CharField(choices=[('appointment', 'Appointment'), ('pharmacy', 'Pharmacy Order')], max_length=20)),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='departments.department')),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='doctors.doctorprofile')),
+                ('invoice', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='billing.invoice')),
+            ],
+            options={
+                'verbose_name_plural': 'Ledger entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['date', 'id'], name='ledger_entry_date_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_revenue_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class Invoice(models.Model):
@@ -52,6 +53,9 @@ class Invoice(models.Model):
     razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
     razorpay_payment_id = models.CharField(max_length=100, blank=True, null=True)
     razorpay_signature = models.CharField(max_length=200, blank=True, null=True)
+    # What razorpay_order_id was created for; see billing.payments.razorpay_order_for
+    razorpay_order_amount = models.PositiveIntegerField(null=True, blank=True)
+    razorpay_order_created_at = models.DateTimeField(null=True, blank=True)
     
     paid_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -59,6 +63,24 @@ class Invoice(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'paid_at'], name='invoice_status_paid_idx'),
+            models.Index(fields=['patient', 'created_at'], name='invoice_patient_created_idx'),
+        ]
+        constraints = [
+            # One invoice per Razorpay order and per payment; also the index
+            # that payment verification and webhooks look invoices up by
+            models.UniqueConstraint(
+                fields=['razorpay_order_id'],
+                condition=models.Q(razorpay_order_id__isnull=False),
+                name='invoice_unique_razorpay_order'
+            ),
+            models.UniqueConstraint(
+                fields=['razorpay_payment_id'],
+                condition=models.Q(razorpay_payment_id__isnull=False),
+                name='invoice_unique_razorpay_payment'
+            ),
+        ]
     
     def __str__(self):
         return f"Invoice #{self.pk} - {self.get_invoice_type_display()} - ₹{self.amount}"
@@ -67,3 +89,160 @@ class Invoice(models.Model):
     def amount_in_paise(self):
         """Convert amount to paise for Razorpay."""
         return int(self.amount * 100)
+
+
+class WebhookEvent(models.Model):
+    """A Razorpay webhook delivery, stored as received and applied by a worker."""
+    
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        PROCESSED = 'processed', 'Processed'
+        IGNORED = 'ignored', 'Ignored'
+        FAILED = 'failed', 'Failed'
+    
+    # X-Razorpay-Event-Id, so a redelivered event collides with the first copy
+    event_id = models.CharField(max_length=100, unique=True)
+    event = models.CharField(max_length=50)
+    razorpay_order_id = models.CharField(max_length=100, blank=True)
+    razorpay_payment_id = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    
+    # When Razorpay created the event; events of one order are applied in this order
+    occurred_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Traceback of the handler when the event FAILED
+    error = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_status_idx'),
+            models.Index(fields=['razorpay_order_id', 'status'], name='webhook_order_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event} {self.event_id} ({self.get_status_display()})"
+
+
+class LedgerEntry(models.Model):
+    """A payment or refund, posted once and never changed; see billing.ledger."""
+    
+    class Kind(models.TextChoices):
+        PAYMENT = 'payment', 'Payment'
+        REFUND = 'refund', 'Refund'
+    
+    # SET_NULL: revenue history outlives the rows it was posted for
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='ledger_entries'
+    )
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    # Positive for payments, negative for refunds
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    invoice_type = models.CharField(max_length=20, choices=Invoice.InvoiceType.choices)
+    department = models.ForeignKey(
+        'departments.Department',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries'
+    )
+    doctor = models.ForeignKey(
+        'doctors.DoctorProfile',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries'
+    )
+    
+    # The local day the entry counts towards
+    date = models.DateField()
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'Ledger entries'
+        indexes = [
+            models.Index(fields=['date', 'id'], name='ledger_entry_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} ₹{self.amount} on {self.date}"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries are append-only; post a correcting entry instead.")
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries are append-only; post a correcting entry instead.")
+
+
+class LedgerBalance(models.Model):
+    """Running revenue of one ledger account at the end of each day it moved.
+
+    The account is the whole hospital (no department, no doctor), one
+    department, or one doctor. ``balance`` is the account's net revenue
+    from its first entry through ``date``, so revenue over a period is the
+    difference of two rows. Maintained by ``billing.ledger``.
+    """
+    
+    date = models.DateField()
+    # Not indexed alone: the unique constraints below lead with them
+    department = models.ForeignKey(
+        'departments.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name='ledger_balances'
+    )
+    doctor = models.ForeignKey(
+        'doctors.DoctorProfile',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name='ledger_balances'
+    )
+    
+    # Movements of the day, and the running net total through it
+    payments = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunds = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(department__isnull=True) | models.Q(doctor__isnull=True),
+                name='ledgerbalance_one_account'
+            ),
+            # Also the indexes the balance lookups read, newest day first
+            models.UniqueConstraint(
+                fields=['date'],
+                condition=models.Q(department__isnull=True, doctor__isnull=True),
+                name='ledgerbalance_unique_hospital'
+            ),
+            models.UniqueConstraint(
+                fields=['department', 'date'],
+                condition=models.Q(department__isnull=False, doctor__isnull=True),
+                name='ledgerbalance_unique_department'
+            ),
+            models.UniqueConstraint(
+                fields=['doctor', 'date'],
+                condition=models.Q(doctor__isnull=False),
+                name='ledgerbalance_unique_doctor'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Ledger balance for {self.date}"
@@ -0,0 +1,103 @@
+"""
+Razorpay orders and captured payments.
+
+An invoice keeps the Razorpay order it was last offered with, and
+``razorpay_order_for`` hands the same order out again while it can still be
+paid: reloading the payment page does not call the gateway again.
+
+Both the checkout callback (``verify_payment``) and Razorpay's webhooks
+report a capture, in either order and sometimes more than once. Each caller
+locks the invoice row first, and ``mark_paid`` only acts on an unpaid
+invoice, so the second report of the same payment changes nothing. Both
+status changes here post to the revenue ledger in the caller's transaction.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from pharmacy.stock import commit_stock
+from .ledger import record_payments, record_refund
+from .models import Invoice, LedgerEntry
+
+
+def razorpay_order_for(invoice, client, notes=None):
+    """
+    The id of a Razorpay order for the invoice's amount, creating one only if
+    the invoice has none, its amount changed, or it is older than
+    ``RAZORPAY_ORDER_MAX_AGE``.
+    """
+    now = timezone.now()
+    if (
+        invoice.razorpay_order_id
+        and invoice.razorpay_order_amount == invoice.amount_in_paise
+        and invoice.razorpay_order_created_at
+        and now - invoice.razorpay_order_created_at < timedelta(seconds=settings.RAZORPAY_ORDER_MAX_AGE)
+    ):
+        return invoice.razorpay_order_id
+    
+    order = client.order.create({
+        'amount': invoice.amount_in_paise,
+        'currency': 'INR',
+        'payment_capture': 1,
+        'notes': {'invoice_id': invoice.pk, **(notes or {})}
+    })
+    invoice.razorpay_order_id = order['id']
+    invoice.razorpay_order_amount = order['amount']
+    invoice.razorpay_order_created_at = now
+    invoice.save(update_fields=[
+        'razorpay_order_id', 'razorpay_order_amount', 'razorpay_order_created_at', 'updated_at'
+    ])
+    return invoice.razorpay_order_id
+
+
+def mark_paid(invoice, razorpay_payment_id, razorpay_signature=None):
+    """
+    Record the payment on a locked invoice and mark its appointment or order
+    paid. Returns False, changing nothing, if the invoice was already paid.
+    """
+    if invoice.status == Invoice.Status.PAID:
+        return False
+    invoice.razorpay_payment_id = razorpay_payment_id
+    if razorpay_signature:
+        invoice.razorpay_signature = razorpay_signature
+    invoice.status = Invoice.Status.PAID
+    invoice.paid_at = timezone.now()
+    invoice.save()
+    record_payments([invoice])
+    
+    # Update related order status
+    if invoice.invoice_type == Invoice.InvoiceType.APPOINTMENT:
+        invoice.appointment.payment_status = 'paid'
+        invoice.appointment.save()
+    elif invoice.invoice_type == Invoice.InvoiceType.PHARMACY:
+        invoice.pharmacy_order.status = 'paid'
+        invoice.pharmacy_order.save()
+        commit_stock(invoice.pharmacy_order)
+    return True
+
+
+def mark_refunded(invoice, amount_in_paise=None):
+    """
+    Record a refund on a locked, paid invoice: whatever is left unrefunded
+    unless ``amount_in_paise`` says less. The invoice is marked refunded
+    once nothing is left. Returns False, changing nothing, if the invoice
+    was not paid.
+    """
+    if invoice.status != Invoice.Status.PAID:
+        return False
+    refunded = -(
+        invoice.ledger_entries.filter(kind=LedgerEntry.Kind.REFUND).aggregate(total=Sum('amount'))['total'] or 0
+    )
+    amount = invoice.amount - refunded
+    if amount_in_paise is not None:
+        amount = min(amount, Decimal(amount_in_paise) / 100)
+    if amount <= 0:
+        return False
+    if refunded + amount >= invoice.amount:
+        invoice.status = Invoice.Status.REFUNDED
+        invoice.save(update_fields=['status', 'updated_at'])
+    record_refund(invoice, amount)
+    return True
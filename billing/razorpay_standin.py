@@ -0,0 +1,180 @@
+"""
+Local stand-in for the Razorpay REST API.
+
+Serves just enough of ``/v1/orders`` and ``/v1/payments`` for the payment
+views and ``reconcile_payments`` to run offline, e.g. under the benchmarks. Point a Razorpay
+client at it with ``razorpay.Client(auth=..., base_url=standin.url)``.
+Payments are "captured" by ``pay()``, which also returns the checkout
+signature the real widget would post back to ``verify_payment``. Setting
+``failing`` to an HTTP status makes every call fail with it, to exercise the
+client's circuit breaker; ``calls`` counts the API requests served.
+"""
+import bisect
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def checkout_signature(order_id, payment_id, secret):
+    """The signature Razorpay Checkout returns for a successful payment."""
+    message = f'{order_id}|{payment_id}'.encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class RazorpayStandIn:
+    """In-process HTTP server that mimics the Razorpay order/payment API."""
+
+    def __init__(self, key_secret, host='127.0.0.1', port=0, latency=0.0):
+        self.key_secret = key_secret
+        self.latency = latency
+        self.failing = None
+        self.calls = 0
+        self.orders = {}
+        self.payments = {}
+        # (created_at, id) of every order and payment, sorted, for listing by time
+        self.order_log = []
+        self.payment_log = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def next_id(self, prefix):
+        # Same shape as real ids, and unique across runs against one database
+        return f'{prefix}_{uuid.uuid4().hex[:14]}'
+
+    def create_order(self, body):
+        order = {
+            'id': self.next_id('order'),
+            'entity': 'order',
+            'amount': body.get('amount'),
+            'amount_paid': 0,
+            'amount_due': body.get('amount'),
+            'currency': body.get('currency', 'INR'),
+            'receipt': body.get('receipt'),
+            'status': 'created',
+            'attempts': 0,
+            'notes': body.get('notes', {}),
+            'created_at': int(time.time()),
+        }
+        with self._lock:
+            self.orders[order['id']] = order
+            bisect.insort(self.order_log, (order['created_at'], order['id']))
+        return order
+
+    def pay(self, order_id, created_at=None):
+        """Capture a payment for ``order_id``; returns (payment_id, signature)."""
+        with self._lock:
+            order = self.orders[order_id]
+        payment = {
+            'id': self.next_id('pay'),
+            'entity': 'payment',
+            'order_id': order_id,
+            'amount': order['amount'],
+            'currency': order['currency'],
+            'status': 'captured',
+            'captured': True,
+            'method': 'upi',
+            'created_at': created_at or int(time.time()),
+        }
+        with self._lock:
+            self.payments[payment['id']] = payment
+            bisect.insort(self.payment_log, (payment['created_at'], payment['id']))
+            order.update(status='paid', amount_paid=order['amount'], amount_due=0, attempts=order['attempts'] + 1)
+        return payment['id'], checkout_signature(order_id, payment['id'], self.key_secret)
+
+    def list_payments(self, query):
+        """One page of payments created in ``from``..``to``, newest first."""
+        return self.list(self.payment_log, self.payments, query)
+
+    def list_orders(self, query):
+        """One page of orders created in ``from``..``to``, newest first."""
+        return self.list(self.order_log, self.orders, query)
+
+    def list(self, log, entities, query):
+        count = min(int(query.get('count', 10)), 100)
+        skip = int(query.get('skip', 0))
+        with self._lock:
+            low = bisect.bisect_left(log, (int(query.get('from', 0)),))
+            high = bisect.bisect_right(log, (int(query.get('to', time.time())), '~'))
+            window = log[max(low, high - skip - count):max(low, high - skip)]
+            items = [entities[entity_id] for _, entity_id in reversed(window)]
+        return {'entity': 'collection', 'count': len(items), 'items': items}
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if standin.failing:
+                    return self.fail()
+                url = urlsplit(self.path)
+                parts = url.path.strip('/').split('/')
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if parts == ['v1', 'payments']:
+                    return self.reply(200, standin.list_payments(query))
+                if parts == ['v1', 'orders']:
+                    return self.reply(200, standin.list_orders(query))
+                if parts[:2] == ['v1', 'orders'] and len(parts) == 4 and parts[3] == 'payments':
+                    items = [p for p in standin.payments.values() if p['order_id'] == parts[2]]
+                    return self.reply(200, {'entity': 'collection', 'count': len(items), 'items': items})
+                if parts[:2] == ['v1', 'orders'] and len(parts) == 3 and parts[2] in standin.orders:
+                    return self.reply(200, standin.orders[parts[2]])
+                if parts[:2] == ['v1', 'payments'] and len(parts) == 3 and parts[2] in standin.payments:
+                    return self.reply(200, standin.payments[parts[2]])
+                self.reply(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if standin.failing:
+                    return self.fail()
+                if self.path.rstrip('/') == '/v1/orders':
+                    return self.reply(200, standin.create_order(body))
+                self.reply(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Unknown endpoint'}})
+
+            def fail(self):
+                self.reply(standin.failing, {'error': {'code': 'SERVER_ERROR', 'description': 'Stand-in failure'}})
+
+            def reply(self, status, payload):
+                with standin._lock:
+                    standin.calls += 1
+                if standin.latency:
+                    time.sleep(standin.latency)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
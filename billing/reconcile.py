@@ -0,0 +1,254 @@
+"""
+Batch reconciliation of invoices against the payments Razorpay captured.
+
+An invoice stays unpaid when the browser never reaches ``verify_payment``
+and the webhook is lost. ``reconcile`` pages through the gateway's payments
+for a window, matches the captured ones to invoices in memory by order id,
+and marks the missed invoices paid with bulk updates. A payment on an order
+the invoice no longer holds (``razorpay_order_for`` replaced it) is matched
+through the ``invoice_id`` note of that order: fetched one by one when there
+are few such orders, otherwise picked out of the gateway's order listing,
+so the calls never outnumber the listing's pages. Whatever it cannot safely
+correct is reported as a discrepancy for someone to look at.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from adminpanel.rollups import HOSPITAL, local_date, schedule_refresh
+from appointments.models import Appointment
+from pharmacy.models import PharmacyOrder
+from pharmacy.stock import commit_stock
+from .ledger import record_payments
+from .models import Invoice
+
+
+# Razorpay's largest page
+PAGE_SIZE = 100
+CHUNK_SIZE = 500
+# A payment is created a little before its invoice is marked paid
+PAYMENT_SLACK = timedelta(hours=1)
+
+CORRECTABLE = (Invoice.Status.UNPAID, Invoice.Status.FAILED)
+
+
+def fetch_all(resource, since, until):
+    """
+    Yield what a gateway listing (``client.payment``, ``client.order``) holds
+    created in ``[since, until]``, newest first.
+    """
+    skip = 0
+    while True:
+        page = resource.all({
+            'from': int(since.timestamp()),
+            'to': int(until.timestamp()),
+            'count': PAGE_SIZE,
+            'skip': skip,
+        })
+        items = page.get('items', [])
+        yield from items
+        if len(items) < PAGE_SIZE:
+            return
+        skip += len(items)
+
+
+def reconcile(client, since, until, dry_run=False):
+    """
+    Correct invoices whose capture was missed in ``[since, until)``.
+
+    Returns a report: how many captured payments were read and invoices
+    fixed, and a list of discrepancies, each a dict with ``kind``, the ids
+    involved and whether the invoice now reflects the payment (``fixed``).
+    With ``dry_run`` nothing is written.
+    """
+    captured = defaultdict(list)
+    settled_ids = set()
+    for payment in fetch_all(client.payment, since - PAYMENT_SLACK, until):
+        if payment['status'] in ('captured', 'refunded'):
+            settled_ids.add(payment['id'])
+        if payment['status'] == 'captured' and payment.get('order_id'):
+            captured[payment['order_id']].append(payment)
+    # Pages can overlap when payments arrive mid-run
+    for order_id, payments in captured.items():
+        captured[order_id] = list({payment['id']: payment for payment in payments}.values())
+
+    discrepancies = []
+    corrections = []
+
+    def compare(order_id, invoice, kind):
+        for payment in captured[order_id]:
+            issue = check(invoice, payment, kind)
+            if issue:
+                discrepancies.append(issue)
+                if issue['kind'] == kind:
+                    corrections.append((invoice.pk, payment, issue))
+
+    order_ids = list(captured)
+    unknown = []
+    for start in range(0, len(order_ids), CHUNK_SIZE):
+        chunk = order_ids[start:start + CHUNK_SIZE]
+        invoices = {
+            invoice.razorpay_order_id: invoice
+            for invoice in Invoice.objects.filter(razorpay_order_id__in=chunk)
+        }
+        for order_id in chunk:
+            if order_id in invoices:
+                compare(order_id, invoices[order_id], 'missed_capture')
+            else:
+                unknown.append(order_id)
+
+    replaced = find_replaced(client, unknown, since - PAYMENT_SLACK, until, listed=len(order_ids))
+    for order_id in unknown:
+        compare(order_id, replaced.get(order_id), 'replaced_order')
+
+    fixed = []
+    if not dry_run:
+        for start in range(0, len(corrections), CHUNK_SIZE):
+            fixed.extend(apply(corrections[start:start + CHUNK_SIZE]))
+        # bulk_update sends no post_save, so refresh the rollups here, once per bucket
+        buckets = set()
+        for invoice in fixed:
+            bucket = HOSPITAL
+            if invoice.appointment:
+                bucket = (invoice.appointment.department_id, invoice.appointment.doctor_id)
+            buckets.add((local_date(invoice.paid_at), bucket))
+        for day, bucket in buckets:
+            schedule_refresh(day, bucket)
+    discrepancies.extend(not_captured(since, until, settled_ids))
+    return {
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'captured': sum(len(payments) for payments in captured.values()),
+        'correctable': len(corrections),
+        'fixed': len(fixed),
+        'dry_run': dry_run,
+        'discrepancies': discrepancies,
+    }
+
+
+def find_replaced(client, order_ids, since, until, listed=0):
+    """
+    Invoices, by order id, that were offered these orders before a newer one.
+
+    The orders paid in ``[since, until]`` number at least ``listed``, so
+    listing them takes at least ``listed / PAGE_SIZE`` calls; fetching is
+    cheaper below that. The listing reaches back RAZORPAY_ORDER_MAX_AGE,
+    as far as an order is offered; a payment on an older one is reported
+    as an unknown order.
+    """
+    wanted = set(order_ids)
+    if len(wanted) * PAGE_SIZE <= listed:
+        orders = (client.order.fetch(order_id) for order_id in wanted)
+    else:
+        orders = listed_orders(client, wanted, since - timedelta(seconds=settings.RAZORPAY_ORDER_MAX_AGE), until)
+
+    invoice_ids = {}
+    for order in orders:
+        notes = order.get('notes') or {}
+        if str(notes.get('invoice_id', '')).isdigit():
+            invoice_ids[order['id']] = int(notes['invoice_id'])
+    invoices = Invoice.objects.in_bulk(invoice_ids.values())
+    return {
+        order_id: invoices[invoice_id]
+        for order_id, invoice_id in invoice_ids.items() if invoice_id in invoices
+    }
+
+
+def listed_orders(client, order_ids, since, until):
+    """Yield these orders from the order listing, stopping once all are found."""
+    remaining = set(order_ids)
+    for order in fetch_all(client.order, since, until):
+        if order['id'] in remaining:
+            yield order
+            remaining.discard(order['id'])
+            if not remaining:
+                return
+
+
+def check(invoice, payment, kind):
+    """The discrepancy between one captured payment and its invoice, if any."""
+    issue = {
+        'kind': kind,
+        'fixed': False,
+        'invoice_id': invoice.pk if invoice else None,
+        'razorpay_order_id': payment['order_id'],
+        'razorpay_payment_id': payment['id'],
+    }
+    if invoice is None:
+        return {**issue, 'kind': 'unknown_order'}
+    if invoice.status == Invoice.Status.PAID and invoice.razorpay_payment_id == payment['id']:
+        return None
+    if invoice.status not in CORRECTABLE:
+        # e.g. a second payment for an invoice that was already paid
+        return {**issue, 'kind': 'already_settled', 'status': invoice.status,
+                'invoice_payment_id': invoice.razorpay_payment_id}
+    if payment['amount'] != invoice.amount_in_paise:
+        return {**issue, 'kind': 'amount_mismatch', 'paid': payment['amount'],
+                'invoiced': invoice.amount_in_paise}
+    return issue
+
+
+def apply(corrections):
+    """Mark one chunk of invoices paid; returns those that were still unpaid."""
+    now = timezone.now()
+    with transaction.atomic():
+        invoices = Invoice.objects.select_for_update().select_related('appointment').in_bulk(
+            [invoice_id for invoice_id, payment, issue in corrections]
+        )
+        fixed = []
+        for invoice_id, payment, issue in corrections:
+            invoice = invoices[invoice_id]
+            # verify_payment, a webhook or another payment got there first
+            if invoice.status not in CORRECTABLE:
+                if invoice.razorpay_payment_id == payment['id']:
+                    issue['fixed'] = True
+                else:
+                    issue.update(kind='already_settled', status=invoice.status,
+                                 invoice_payment_id=invoice.razorpay_payment_id)
+                continue
+            invoice.status = Invoice.Status.PAID
+            invoice.razorpay_order_id = payment['order_id']
+            invoice.razorpay_payment_id = payment['id']
+            invoice.paid_at = datetime.fromtimestamp(payment['created_at'], dt_timezone.utc)
+            invoice.updated_at = now
+            issue['fixed'] = True
+            fixed.append(invoice)
+        Invoice.objects.bulk_update(
+            fixed, ['status', 'razorpay_order_id', 'razorpay_payment_id', 'paid_at', 'updated_at']
+        )
+        record_payments(fixed)
+
+        Appointment.objects.filter(
+            pk__in=[invoice.appointment_id for invoice in fixed if invoice.invoice_type == Invoice.InvoiceType.APPOINTMENT]
+        ).update(payment_status=Appointment.PaymentStatus.PAID, updated_at=now)
+        orders = PharmacyOrder.objects.filter(
+            pk__in=[invoice.pharmacy_order_id for invoice in fixed if invoice.invoice_type == Invoice.InvoiceType.PHARMACY]
+        )
+        orders.update(status=PharmacyOrder.Status.PAID, updated_at=now)
+        for order in orders:
+            commit_stock(order)
+    return fixed
+
+
+def not_captured(since, until, settled_ids):
+    """Invoices paid online in the window whose payment the gateway does not list."""
+    paid = Invoice.objects.filter(
+        status=Invoice.Status.PAID,
+        paid_at__gte=since,
+        paid_at__lt=until,
+        razorpay_payment_id__isnull=False
+    ).values_list('pk', 'razorpay_order_id', 'razorpay_payment_id')
+    return [
+        {
+            'kind': 'not_captured',
+            'fixed': False,
+            'invoice_id': pk,
+            'razorpay_order_id': order_id,
+            'razorpay_payment_id': payment_id,
+        }
+        for pk, order_id, payment_id in paid.iterator(chunk_size=2000)
+        if payment_id not in settled_ids
+    ]
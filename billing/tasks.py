@@ -0,0 +1,8 @@
+from taskqueue.queue import task
+from .webhooks import apply_pending_events
+
+
+@task
+def apply_webhook_events():
+    """Drain the webhook inbox; see billing.webhooks."""
+    apply_pending_events()
@@ -1,3 +1,338 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.models import Appointment
+from billing import ledger, reconcile, webhooks
+from billing.gateway import make_client
+from billing.models import Invoice, LedgerBalance, LedgerEntry, WebhookEvent
+from billing.payments import mark_refunded
+from billing.razorpay_standin import RazorpayStandIn
+from departments.models import Department
+from hospital_project.testing import QueryBudgetMixin
+from taskqueue.models import Task
+from taskqueue.queue import claim
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='')
+class WebhookTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = User.objects.create(username='doctor', role=User.Role.DOCTOR).doctor_profile
+        patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        start = timezone.make_aware(datetime.combine(
+            timezone.localdate() + timedelta(days=1),
+            datetime.min.time().replace(hour=10)
+        ))
+        cls.invoices = {}
+        for i, order_id in enumerate(['order_A', 'order_B']):
+            appointment = Appointment.objects.create(
+                patient=patient, doctor=doctor, scheduled_datetime=start + timedelta(hours=i)
+            )
+            cls.invoices[order_id] = Invoice.objects.create(
+                patient=patient,
+                invoice_type=Invoice.InvoiceType.APPOINTMENT,
+                appointment=appointment,
+                amount=500,
+                razorpay_order_id=order_id
+            )
+
+    def deliver(self, event_id, order_id, payment_id):
+        body = {
+            'event': 'payment.captured',
+            'created_at': int(timezone.now().timestamp()),
+            'payload': {'payment': {'entity': {'id': payment_id, 'order_id': order_id}}},
+        }
+        response = self.assertWithinQueryBudget(
+            reverse('billing:razorpay_webhook'), method='post', data=json.dumps(body),
+            content_type='application/json', HTTP_X_RAZORPAY_EVENT_ID=event_id
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_failing_event_does_not_block_others(self):
+        def capture_or_fail(invoice, event):
+            webhooks.capture(invoice, event)
+            if invoice.razorpay_order_id == 'order_A':
+                raise ValueError('boom')
+
+        self.deliver('evt_A', 'order_A', 'pay_A')
+        self.deliver('evt_B', 'order_B', 'pay_B')
+        with mock.patch.dict(webhooks.HANDLERS, {'payment.captured': capture_or_fail}), \
+                self.assertLogs('billing.webhooks', 'WARNING'):
+            self.assertEqual(webhooks.apply_pending_events(), 2)
+
+        failed = WebhookEvent.objects.get(event_id='evt_A')
+        self.assertEqual(failed.status, WebhookEvent.Status.FAILED)
+        self.assertIn('ValueError: boom', failed.error)
+        # The failed capture was rolled back
+        self.assertEqual(Invoice.objects.get(razorpay_order_id='order_A').status, Invoice.Status.UNPAID)
+        self.assertFalse(LedgerEntry.objects.filter(invoice__razorpay_order_id='order_A').exists())
+
+        self.assertEqual(WebhookEvent.objects.get(event_id='evt_B').status, WebhookEvent.Status.PROCESSED)
+        self.assertEqual(Invoice.objects.get(razorpay_order_id='order_B').status, Invoice.Status.PAID)
+
+    def test_deliveries_share_one_waiting_drain(self):
+        drains = Task.objects.filter(name='billing.tasks.apply_webhook_events')
+        self.deliver('evt_A', 'order_A', 'pay_A')
+        self.deliver('evt_B', 'order_B', 'pay_B')
+        self.deliver('evt_A', 'order_A', 'pay_A')
+        self.assertEqual(drains.count(), 1)
+
+        # Once a worker has started it, the next delivery needs a drain of its own
+        claim('worker', 1)
+        self.deliver('evt_C', 'order_B', 'pay_C')
+        self.assertEqual(drains.count(), 2)
+
+
+class LedgerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        cls.doctors = []
+        for name in ['Cardiology', 'Neurology']:
+            doctor = User.objects.create(username=name.lower(), role=User.Role.DOCTOR).doctor_profile
+            doctor.department = Department.objects.create(name=name)
+            doctor.save()
+            cls.doctors.append(doctor)
+
+        start = timezone.now() + timedelta(days=1)
+        cls.invoices = []
+        for i in range(6):
+            doctor = cls.doctors[i % 2]
+            appointment = Appointment.objects.create(
+                patient=patient, doctor=doctor, department=doctor.department,
+                scheduled_datetime=start + timedelta(hours=i)
+            )
+            cls.invoices.append(Invoice.objects.create(
+                patient=patient, invoice_type=Invoice.InvoiceType.APPOINTMENT,
+                appointment=appointment, amount=100 * (i + 1)
+            ))
+        # Counts towards the hospital account only
+        cls.invoices.append(Invoice.objects.create(
+            patient=patient, invoice_type=Invoice.InvoiceType.PHARMACY, amount=70
+        ))
+        cls.today = timezone.localdate()
+        cls.first = cls.today - timedelta(days=10)
+
+    def accounts(self):
+        """Each account as ledger arguments and the matching invoice filter."""
+        yield {}, {}
+        for doctor in self.doctors:
+            yield {'department_id': doctor.department_id}, {'appointment__department': doctor.department_id}
+            yield {'doctor_id': doctor.pk}, {'appointment__doctor': doctor.pk}
+
+    def paid_between(self, start, end, **filters):
+        """Revenue summed straight from the invoices paid from ``start`` to ``end``."""
+        return Invoice.objects.filter(
+            status__in=[Invoice.Status.PAID, Invoice.Status.REFUNDED],
+            paid_at__date__gte=start,
+            paid_at__date__lte=end,
+            **filters
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+
+    def pay(self, invoice, days):
+        invoice.status = Invoice.Status.PAID
+        invoice.paid_at = timezone.now() - timedelta(days=days)
+        invoice.save()
+        ledger.record_payments([invoice])
+
+    def assertRevenueMatchesInvoices(self, ranges):
+        for args, filters in self.accounts():
+            for start, end in ranges:
+                with self.subTest(account=args, start=start, end=end):
+                    self.assertEqual(
+                        ledger.revenue(start, end, **args),
+                        self.paid_between(start, end, **filters)
+                    )
+
+    def test_back_dated_payments_move_later_balances(self):
+        days = [5, 2, 8, 5, 1, 3, 7]
+        for invoice, days_ago in zip(self.invoices, days):
+            # Out of order, so postings open days before and between existing ones
+            self.pay(invoice, days_ago)
+
+        today, first = self.today, self.first
+        self.assertRevenueMatchesInvoices([
+            (first, today),
+            (today - timedelta(days=8), today - timedelta(days=8)),
+            (today - timedelta(days=6), today - timedelta(days=2)),
+            (today - timedelta(days=4), today),
+        ])
+        self.assertEqual(
+            sum(ledger.daily(first, today).values()), self.paid_between(first, today)
+        )
+
+        # The incrementally kept balances are what a rebuild computes
+        kept = set(LedgerBalance.objects.values_list('date', 'department', 'doctor', 'payments', 'refunds', 'balance'))
+        ledger.rebuild_balances()
+        rebuilt = set(LedgerBalance.objects.values_list('date', 'department', 'doctor', 'payments', 'refunds', 'balance'))
+        self.assertEqual(kept, rebuilt)
+
+    def test_refunds_count_on_the_day_they_are_posted(self):
+        invoice = self.invoices[1]
+        self.pay(invoice, 3)
+        start, today = self.first, self.today
+        self.assertTrue(mark_refunded(invoice, amount_in_paise=5000))
+        self.assertEqual(invoice.status, Invoice.Status.PAID)
+
+        for args, filters in self.accounts():
+            with self.subTest(account=args):
+                paid = self.paid_between(start, today, **filters)
+                refunded = Decimal('50') if paid else Decimal('0')
+                self.assertEqual(ledger.revenue(start, today, **args), paid - refunded)
+                self.assertEqual(ledger.revenue(today, today, **args), -refunded)
+                self.assertEqual(ledger.revenue(start, today - timedelta(days=1), **args), paid)
+
+        # The rest of it, which settles the invoice
+        self.assertTrue(mark_refunded(invoice))
+        self.assertEqual(invoice.status, Invoice.Status.REFUNDED)
+        self.assertFalse(mark_refunded(invoice))
+        self.assertEqual(ledger.revenue(start, today), 0)
+        self.assertEqual(ledger.revenue(today, today), -invoice.amount)
+
+    def test_post_missing_catches_up_with_bulk_updates(self):
+        now = timezone.now()
+        for days_ago, invoice in enumerate(self.invoices, start=1):
+            Invoice.objects.filter(pk=invoice.pk).update(
+                status=Invoice.Status.PAID, paid_at=now - timedelta(days=days_ago)
+            )
+        refunded = self.invoices[2]
+        Invoice.objects.filter(pk=refunded.pk).update(status=Invoice.Status.REFUNDED)
+        self.assertEqual(ledger.revenue(self.first, self.today), 0)
+
+        self.assertEqual(ledger.post_missing(), len(self.invoices) + 1)
+        self.assertEqual(ledger.post_missing(), 0)
+        ledger.rebuild_balances()
+
+        # The refund of the rest is dated at the invoice's last change, today
+        yesterday = self.today - timedelta(days=1)
+        self.assertRevenueMatchesInvoices([
+            (self.first, yesterday),
+            (self.today - timedelta(days=5), self.today - timedelta(days=2)),
+        ])
+        for args, filters in self.accounts():
+            with self.subTest(account=args):
+                self.assertEqual(
+                    ledger.revenue(self.first, self.today, **args),
+                    Invoice.objects.filter(status=Invoice.Status.PAID, **filters).aggregate(total=Sum('amount'))['total']
+                )
+
+
+class ReconcileTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = User.objects.create(username='doctor', role=User.Role.DOCTOR).doctor_profile
+        cls.patient = User.objects.create(username='patient', role=User.Role.PATIENT).patient_profile
+        cls.appointment = Appointment.objects.create(
+            patient=cls.patient, doctor=doctor, scheduled_datetime=timezone.now() + timedelta(days=1)
+        )
+
+    def setUp(self):
+        self.standin = RazorpayStandIn('secret').start()
+        self.addCleanup(self.standin.stop)
+        self.gateway = make_client(base_url=self.standin.url, auth=('rzp_test', 'secret'))
+        self.since = timezone.now() - timedelta(days=1)
+
+    def invoice(self, amount=500, **fields):
+        """An invoice holding a new gateway order; returns it and the order id."""
+        invoice = Invoice.objects.create(
+            patient=self.patient, amount=amount, **{'invoice_type': Invoice.InvoiceType.PHARMACY, **fields}
+        )
+        order = self.standin.create_order({'amount': amount * 100, 'notes': {'invoice_id': invoice.pk}})
+        Invoice.objects.filter(pk=invoice.pk).update(
+            razorpay_order_id=order['id'], razorpay_order_amount=order['amount']
+        )
+        return invoice, order['id']
+
+    def reconcile(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return reconcile.reconcile(self.gateway, self.since, timezone.now(), **kwargs)
+
+    def kinds(self, report):
+        return {issue['razorpay_payment_id']: issue['kind'] for issue in report['discrepancies']}
+
+    def test_matched_and_refunded_payments_are_left_alone(self):
+        matched, order_id = self.invoice()
+        payment_id, _ = self.standin.pay(order_id)
+        Invoice.objects.filter(pk=matched.pk).update(
+            status=Invoice.Status.PAID, razorpay_payment_id=payment_id, paid_at=timezone.now()
+        )
+        refunded, order_id = self.invoice()
+        refund_id, _ = self.standin.pay(order_id)
+        self.standin.payments[refund_id]['status'] = 'refunded'
+        Invoice.objects.filter(pk=refunded.pk).update(
+            status=Invoice.Status.REFUNDED, razorpay_payment_id=refund_id, paid_at=timezone.now()
+        )
+        # Paid here, but the gateway never captured it
+        lost, order_id = self.invoice()
+        Invoice.objects.filter(pk=lost.pk).update(
+            status=Invoice.Status.PAID, razorpay_payment_id='pay_lost', paid_at=timezone.now()
+        )
+
+        report = self.reconcile()
+        self.assertEqual(report['captured'], 1)
+        self.assertEqual(report['fixed'], 0)
+        self.assertEqual(self.kinds(report), {'pay_lost': 'not_captured'})
+
+    def test_late_payments_are_marked_paid(self):
+        invoice, order_id = self.invoice(
+            invoice_type=Invoice.InvoiceType.APPOINTMENT, appointment=self.appointment
+        )
+        paid_at = timezone.now().replace(microsecond=0) - timedelta(hours=2)
+        payment_id, _ = self.standin.pay(order_id, created_at=int(paid_at.timestamp()))
+
+        report = self.reconcile(dry_run=True)
+        self.assertEqual(self.kinds(report), {payment_id: 'missed_capture'})
+        self.assertEqual(Invoice.objects.get(pk=invoice.pk).status, Invoice.Status.UNPAID)
+
+        report = self.reconcile()
+        self.assertEqual(report['fixed'], 1)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, Invoice.Status.PAID)
+        self.assertEqual(invoice.razorpay_payment_id, payment_id)
+        self.assertEqual(invoice.paid_at, paid_at)
+        self.assertEqual(invoice.appointment.payment_status, Appointment.PaymentStatus.PAID)
+        self.assertEqual(ledger.revenue(timezone.localdate(paid_at), timezone.localdate()), invoice.amount)
+
+        # A second run finds nothing left to fix
+        self.assertEqual(self.reconcile()['discrepancies'], [])
+
+    def test_payments_on_replaced_orders_find_their_invoice(self):
+        invoice, old_order_id = self.invoice()
+        new_order = self.standin.create_order({'amount': 50000, 'notes': {'invoice_id': invoice.pk}})
+        Invoice.objects.filter(pk=invoice.pk).update(razorpay_order_id=new_order['id'])
+        payment_id, _ = self.standin.pay(old_order_id)
+        stranger = self.standin.create_order({'amount': 10000})
+        unknown_id, _ = self.standin.pay(stranger['id'])
+
+        report = self.reconcile()
+        self.assertEqual(self.kinds(report), {payment_id: 'replaced_order', unknown_id: 'unknown_order'})
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, Invoice.Status.PAID)
+        self.assertEqual(invoice.razorpay_order_id, old_order_id)
+
+    def test_replaced_orders_take_the_fewest_calls(self):
+        invoices, order_ids = zip(*(self.invoice() for _ in range(3)))
+        until = timezone.now()
+        expected = dict(zip(order_ids, invoices))
+
+        calls = self.standin.calls
+        found = reconcile.find_replaced(self.gateway, order_ids, self.since, until, listed=3 * reconcile.PAGE_SIZE)
+        self.assertEqual(found, expected)
+        self.assertEqual(self.standin.calls - calls, 3)
+
+        # Fewer orders were paid than need fetching: one page of the listing
+        calls = self.standin.calls
+        found = reconcile.find_replaced(self.gateway, order_ids, self.since, until, listed=3)
+        self.assertEqual(found, expected)
+        self.assertEqual(self.standin.calls - calls, 1)
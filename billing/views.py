@@ -5,18 +5,22 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.utils import timezone
+from django.db import IntegrityError, transaction
 
 from accounts.decorators import patient_required
+from hospital_project.instrumentation import query_budget
+from hospital_project.pagination import paginate
+from .gateway import GatewayUnavailable, make_client
 from .models import Invoice
+from .payments import mark_paid, razorpay_order_for
+from .tasks import apply_webhook_events
+from .webhooks import InvalidWebhook, parse_event
 from appointments.models import Appointment
 from pharmacy.models import PharmacyOrder
 
 
 # Initialize Razorpay client
-razorpay_client = razorpay.Client(
-    auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-)
+razorpay_client = make_client()
 
 
 @patient_required
@@ -41,6 +45,9 @@ def payment(request, order_type, order_id):
     
     elif order_type == 'pharmacy':
         order = get_object_or_404(PharmacyOrder, pk=order_id, patient=patient)
+        if order.status == PharmacyOrder.Status.CANCELLED:
+            messages.error(request, 'This order has been cancelled and can no longer be paid.')
+            return redirect('pharmacy:order_history')
         amount = order.total_amount
         
         # Check for existing invoice
@@ -56,21 +63,12 @@ def payment(request, order_type, order_id):
         messages.error(request, 'Invalid order type.')
         return redirect('patients:dashboard')
     
-    # Create Razorpay order
+    # Create Razorpay order, or reuse the one this invoice already has
     try:
-        razorpay_order = razorpay_client.order.create({
-            'amount': invoice.amount_in_paise,
-            'currency': 'INR',
-            'payment_capture': 1,
-            'notes': {
-                'invoice_id': invoice.pk,
-                'order_type': order_type
-            }
-        })
-        
-        invoice.razorpay_order_id = razorpay_order['id']
-        invoice.save()
-        
+        razorpay_order_id = razorpay_order_for(invoice, razorpay_client, {'order_type': order_type})
+    except GatewayUnavailable as e:
+        messages.error(request, str(e))
+        return redirect('patients:dashboard')
     except Exception as e:
         messages.error(request, f'Error creating payment order: {str(e)}')
         return redirect('patients:dashboard')
@@ -79,7 +77,7 @@ def payment(request, order_type, order_id):
         'invoice': invoice,
         'order': order,
         'order_type': order_type,
-        'razorpay_order_id': razorpay_order['id'],
+        'razorpay_order_id': razorpay_order_id,
         'razorpay_key_id': settings.RAZORPAY_KEY_ID,
         'amount': invoice.amount,
         'amount_in_paise': invoice.amount_in_paise,
@@ -108,21 +106,12 @@ def verify_payment(request):
             
             razorpay_client.utility.verify_payment_signature(params_dict)
             
-            # Payment verified, update invoice
-            invoice = get_object_or_404(Invoice, razorpay_order_id=razorpay_order_id)
-            invoice.razorpay_payment_id = razorpay_payment_id
-            invoice.razorpay_signature = razorpay_signature
-            invoice.status = Invoice.Status.PAID
-            invoice.paid_at = timezone.now()
-            invoice.save()
-            
-            # Update related order status
-            if invoice.invoice_type == Invoice.InvoiceType.APPOINTMENT:
-                invoice.appointment.payment_status = 'paid'
-                invoice.appointment.save()
-            elif invoice.invoice_type == Invoice.InvoiceType.PHARMACY:
-                invoice.pharmacy_order.status = 'paid'
-                invoice.pharmacy_order.save()
+            # Payment verified, update invoice (the webhook may have got there first)
+            with transaction.atomic():
+                invoice = get_object_or_404(
+                    Invoice.objects.select_for_update(), razorpay_order_id=razorpay_order_id
+                )
+                mark_paid(invoice, razorpay_payment_id, razorpay_signature)
             
             messages.success(request, 'Payment successful!')
             return redirect('billing:payment_success', invoice_id=invoice.pk)
@@ -155,14 +144,16 @@ def payment_failure(request):
     return render(request, 'billing/payment_failure.html')
 
 
+@query_budget(6)
 @patient_required
 def invoice_list(request):
     """List all invoices for patient."""
     patient = request.user.patient_profile
-    invoices = Invoice.objects.filter(patient=patient).order_by('-created_at')
+    page = paginate(request, Invoice.objects.filter(patient=patient), ('-created_at', '-id'))
     
     context = {
-        'invoices': invoices,
+        'invoices': page.object_list,
+        'page': page,
     }
     return render(request, 'billing/invoice_list.html', context)
 
@@ -179,42 +170,25 @@ def invoice_detail(request, pk):
     return render(request, 'billing/invoice_detail.html', context)
 
 
+# BEGIN, the event, the waiting-drain lookup, a new drain and COMMIT; a
+# redelivery stops after the event insert fails
+@query_budget(5)
 @csrf_exempt
 def razorpay_webhook(request):
-    """Handle Razorpay webhook notifications."""
+    """Store a Razorpay webhook delivery for a worker to apply."""
     if request.method == 'POST':
         try:
-            import json
-            payload = json.loads(request.body)
-            
-            event = payload.get('event')
-            
-            if event == 'payment.captured':
-                payment_entity = payload['payload']['payment']['entity']
-                razorpay_order_id = payment_entity.get('order_id')
-                razorpay_payment_id = payment_entity.get('id')
-                
-                # Update invoice
-                try:
-                    invoice = Invoice.objects.get(razorpay_order_id=razorpay_order_id)
-                    if invoice.status != Invoice.Status.PAID:
-                        invoice.razorpay_payment_id = razorpay_payment_id
-                        invoice.status = Invoice.Status.PAID
-                        invoice.paid_at = timezone.now()
-                        invoice.save()
-                        
-                        # Update related order status
-                        if invoice.invoice_type == Invoice.InvoiceType.APPOINTMENT:
-                            invoice.appointment.payment_status = 'paid'
-                            invoice.appointment.save()
-                        elif invoice.invoice_type == Invoice.InvoiceType.PHARMACY:
-                            invoice.pharmacy_order.status = 'paid'
-                            invoice.pharmacy_order.save()
-                except Invoice.DoesNotExist:
-                    pass
-            
-            return HttpResponse(status=200)
-        except Exception as e:
+            event = parse_event(request.body, request.headers)
+        except InvalidWebhook:
             return HttpResponse(status=400)
+        
+        try:
+            with transaction.atomic():
+                event.save(force_insert=True)
+                apply_webhook_events.enqueue_once()
+        except IntegrityError:
+            # Already received: Razorpay redelivers until it sees a 2xx
+            pass
+        return HttpResponse(status=200)
     
     return HttpResponse(status=405)
@@ -0,0 +1,141 @@
+"""
+Razorpay webhook inbox.
+
+``razorpay_webhook`` only checks and stores each delivery as a WebhookEvent
+keyed by its event id, then acknowledges: a redelivered event fails the
+unique insert, so a duplicate costs one index lookup and nothing else. The
+``apply_webhook_events`` task drains the inbox in batches; deliveries queue
+it only when no drain is waiting already. All pending events of one Razorpay
+order are applied together, oldest first, with the invoice row locked, so
+events for an invoice are applied in order even when several workers drain
+at once. Each event is applied in its own savepoint: one whose handler
+raises is rolled back and marked FAILED with the error, and the rest carry
+on.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import traceback
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from .models import Invoice, WebhookEvent
+from .payments import mark_paid, mark_refunded
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+
+
+class InvalidWebhook(Exception):
+    """Raised when a delivery is malformed or its signature does not match."""
+
+
+def parse_event(body, headers):
+    """An unsaved WebhookEvent for one delivery."""
+    secret = settings.RAZORPAY_WEBHOOK_SECRET
+    if secret:
+        expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, headers.get('X-Razorpay-Signature', '')):
+            raise InvalidWebhook('Signature mismatch.')
+    try:
+        payload = json.loads(body)
+        event = payload['event']
+        entities = payload.get('payload', {})
+        payment = entities.get('payment', {}).get('entity', {})
+        order = entities.get('order', {}).get('entity', {})
+    except (ValueError, KeyError, AttributeError, TypeError) as e:
+        raise InvalidWebhook(f'Malformed payload: {e}')
+
+    order_id = payment.get('order_id') or order.get('id') or ''
+    payment_id = payment.get('id') or ''
+    created_at = payload.get('created_at')
+    return WebhookEvent(
+        # Deliveries without the header are keyed by what they are about
+        event_id=headers.get('X-Razorpay-Event-Id') or f'{event}:{payment_id or order_id}',
+        event=event,
+        razorpay_order_id=order_id,
+        razorpay_payment_id=payment_id,
+        payload=payload,
+        occurred_at=datetime.fromtimestamp(created_at, dt_timezone.utc) if isinstance(created_at, int) else None
+    )
+
+
+def apply_pending_events(batch_size=BATCH_SIZE):
+    """Apply every pending event; returns how many were looked at."""
+    applied = 0
+    while True:
+        order_ids = list(
+            WebhookEvent.objects.filter(status=WebhookEvent.Status.PENDING)
+            .order_by('id').values_list('razorpay_order_id', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return applied
+        for order_id in dict.fromkeys(order_ids):
+            applied += apply_order_events(order_id)
+
+
+def apply_order_events(razorpay_order_id):
+    """Apply the pending events of one Razorpay order, oldest first."""
+    with transaction.atomic():
+        # Taken first: a second worker waits here, then finds nothing pending
+        invoice = None
+        if razorpay_order_id:
+            invoice = Invoice.objects.select_for_update().filter(
+                razorpay_order_id=razorpay_order_id
+            ).first()
+        events = list(
+            WebhookEvent.objects.select_for_update().filter(
+                status=WebhookEvent.Status.PENDING,
+                razorpay_order_id=razorpay_order_id
+            ).order_by('occurred_at', 'id')
+        )
+        now = timezone.now()
+        for event in events:
+            handler = HANDLERS.get(event.event)
+            if handler and invoice:
+                event.status = apply_event(handler, invoice, event)
+            else:
+                event.status = WebhookEvent.Status.IGNORED
+            event.processed_at = now
+        WebhookEvent.objects.bulk_update(events, ['status', 'processed_at', 'error'])
+    return len(events)
+
+
+def apply_event(handler, invoice, event):
+    """Run one event's handler in a savepoint; returns the event's new status."""
+    try:
+        with transaction.atomic():
+            handler(invoice, event)
+    except OperationalError:
+        # Lock timeouts and the like: the task retries the whole order
+        raise
+    except Exception:
+        logger.warning("Webhook event %s failed", event.event_id, exc_info=True)
+        # The savepoint rolled the handler's writes back, not its changes to the invoice
+        invoice.refresh_from_db()
+        event.error = traceback.format_exc()
+        return WebhookEvent.Status.FAILED
+    return WebhookEvent.Status.PROCESSED
+
+
+def capture(invoice, event):
+    mark_paid(invoice, event.razorpay_payment_id or invoice.razorpay_payment_id)
+
+
+def refund(invoice, event):
+    entity = event.payload.get('payload', {}).get('refund', {}).get('entity', {})
+    mark_refunded(invoice, entity.get('amount'))
+
+
+# Event name -> handler(locked invoice, event); other events are stored and ignored
+HANDLERS = {
+    'payment.captured': capture,
+    'order.paid': capture,
+    'refund.processed': refund,
+}
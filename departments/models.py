@@ -2,6 +2,15 @@ from django.db import models
 from django.utils.text import slugify
 
 
+class DepartmentQuerySet(models.QuerySet):
+    
+    def with_doctor_count(self):
+        """Annotate ``approved_doctor_count`` so ``doctor_count`` needs no query per row."""
+        return self.annotate(
+            approved_doctor_count=models.Count('doctors', filter=models.Q(doctors__user__is_approved=True))
+        )
+
+
 class Department(models.Model):
     """Hospital department model."""
     
@@ -13,6 +22,8 @@ class Department(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = DepartmentQuerySet.as_manager()
+    
     class Meta:
         ordering = ['name']
     
@@ -26,6 +37,8 @@ class Department(models.Model):
     
     @property
     def doctor_count(self):
+        if hasattr(self, 'approved_doctor_count'):
+            return self.approved_doctor_count
         return self.doctors.filter(user__is_approved=True).count()
     
     @property
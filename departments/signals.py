@@ -0,0 +1,7 @@
+from django.db.models.signals import post_save
+
+from hospital_project.images import build_image_variants
+from .models import Department
+
+
+post_save.connect(build_image_variants, sender=Department)
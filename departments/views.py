@@ -1,10 +1,13 @@
 from django.shortcuts import render, get_object_or_404
+
+from hospital_project.instrumentation import query_budget
 from .models import Department
 
 
+@query_budget(4)
 def department_list(request):
     """List all active departments."""
-    departments = Department.objects.filter(is_active=True)
+    departments = Department.objects.filter(is_active=True).with_doctor_count()
     return render(request, 'departments/list.html', {'departments': departments})
 
 
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_scheduled_end'),
+        ('departments', '0001_initial'),
+        ('doctors', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['created_at', 'id'], name='doctor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['created_at', 'id'], name='prescription_created_idx'),
+        ),
+    ]
@@ -31,6 +31,11 @@ class DoctorProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='doctor_created_idx'),
+        ]
+    
     def __str__(self):
         return f"Dr. {self.user.get_full_name() or self.user.username}"
     
@@ -56,6 +61,11 @@ class Prescription(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='prescription_created_idx'),
+        ]
+    
     def __str__(self):
         return f"Prescription for {self.appointment.patient.user.username} - {self.created_at.date()}"
 
@@ -1,3 +1,29 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from doctors.models import DoctorProfile
+from hospital_project.testing import QueryBudgetMixin, seed
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        cls.doctor = DoctorProfile.objects.filter(user__is_approved=True).select_related('user').first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.doctor.user)
+
+    def test_dashboard(self):
+        response = self.assertWithinQueryBudget(reverse('doctors:dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_appointment_list(self):
+        self.assertTrue(self.doctor.appointments.exists())
+        for query in ('', '?status=confirmed', '?page=2'):
+            with self.subTest(query=query):
+                response = self.assertWithinQueryBudget(reverse('doctors:appointment_list') + query)
+                self.assertEqual(response.status_code, 200)
@@ -1,30 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 
 from accounts.decorators import doctor_required
+from hospital_project.instrumentation import query_budget
+from hospital_project.pagination import paginate
 from .models import DoctorProfile, Prescription, PrescriptionItem
 from .forms import DoctorProfileForm, PrescriptionForm, PrescriptionItemFormSet
 from appointments.models import Appointment
 
 
+@query_budget(10)
 @doctor_required
 def dashboard(request):
     """Doctor dashboard with overview."""
     doctor = request.user.doctor_profile
-    today = timezone.now().date()
     
     # Get appointments
-    upcoming_appointments = Appointment.objects.filter(
+    upcoming_appointments = Appointment.objects.upcoming().select_related('patient__user').filter(
         doctor=doctor,
-        scheduled_datetime__date__gte=today,
         status__in=['pending', 'confirmed']
     ).order_by('scheduled_datetime')[:5]
     
-    today_appointments = Appointment.objects.filter(
-        doctor=doctor,
-        scheduled_datetime__date=today
+    today_appointments = Appointment.objects.today().select_related('patient__user').filter(
+        doctor=doctor
     ).order_by('scheduled_datetime')
     
     total_appointments = Appointment.objects.filter(doctor=doctor).count()
@@ -43,21 +44,23 @@ def dashboard(request):
     return render(request, 'doctors/dashboard.html', context)
 
 
+@query_budget(6)
 @doctor_required
 def appointment_list(request):
     """List all appointments for the doctor."""
     doctor = request.user.doctor_profile
     status_filter = request.GET.get('status', '')
     
-    appointments = Appointment.objects.filter(doctor=doctor)
+    appointments = Appointment.objects.select_related('patient__user').filter(doctor=doctor).with_payment_summary()
     
     if status_filter:
         appointments = appointments.filter(status=status_filter)
     
-    appointments = appointments.order_by('-scheduled_datetime')
+    page = paginate(request, appointments, ('-scheduled_datetime', '-id'))
     
     context = {
-        'appointments': appointments,
+        'appointments': page.object_list,
+        'page': page,
         'status_filter': status_filter,
     }
     return render(request, 'doctors/appointment_list.html', context)
@@ -132,19 +135,22 @@ def mark_appointment_paid(request, pk):
     
     # Allow marking as paid if unpaid, regardless of status (as long as not cancelled)
     if appointment.status != 'cancelled' and appointment.payment_status == 'unpaid':
-        appointment.payment_status = 'paid'
-        appointment.save()
-        
-        # Create or update invoice
+        from billing.ledger import record_payments
         from billing.models import Invoice
-        Invoice.objects.create(
-            appointment=appointment,
-            patient=appointment.patient,
-            invoice_type='appointment',
-            amount=doctor.consultation_fee,
-            status='paid',
-            paid_at=timezone.now()
-        )
+        with transaction.atomic():
+            appointment.payment_status = 'paid'
+            appointment.save()
+            
+            # Create or update invoice
+            invoice = Invoice.objects.create(
+                appointment=appointment,
+                patient=appointment.patient,
+                invoice_type='appointment',
+                amount=doctor.consultation_fee,
+                status='paid',
+                paid_at=timezone.now()
+            )
+            record_payments([invoice])
         messages.success(request, 'Payment marked as received.')
     else:
         messages.error(request, 'Cannot mark payment. Ensure appointment is valid and currently unpaid.')
@@ -0,0 +1,175 @@
+"""
+Resized variants of uploaded images.
+
+Every image saved to ``Medicine.image``, ``Department.image`` or
+``User.profile_picture`` gets a thumbnail and a medium variant, each as WebP
+and JPEG, stored under ``derived/`` next to the original's path in the
+``derived`` storage (which, unlike the default one, keeps the names it is
+given). Resizing is CPU-bound, so it runs in a small process pool once the
+upload has been committed (``IMAGE_WORKERS``; 0 resizes inline). The workers
+only see bytes: reading the original and storing the results happen in this
+process. The apps owning those fields connect ``build_image_variants`` to
+their post_save; ``manage.py build_image_derivatives`` backfills existing
+files, and templates render them with ``{% responsive_image %}``.
+"""
+import logging
+import multiprocessing
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.db import transaction
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# The image fields that get variants, by model label
+IMAGE_FIELDS = {
+    'pharmacy.Medicine': 'image',
+    'departments.Department': 'image',
+    'accounts.User': 'profile_picture',
+}
+
+# Variant name -> width in pixels; images are never enlarged
+VARIANTS = {'thumb': 160, 'medium': 640}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def image_fields():
+    """``(model, field name)`` for every entry of IMAGE_FIELDS."""
+    return [(apps.get_model(label), field) for label, field in IMAGE_FIELDS.items()]
+
+
+def derivative_name(name, variant, extension):
+    """Storage name of one variant of the original ``name``."""
+    return f'derived/{posixpath.splitext(name)[0]}/{variant}.{extension}'
+
+
+def derivative_names(name):
+    return [
+        derivative_name(name, variant, extension)
+        for variant in VARIANTS
+        for extension in FORMATS
+    ]
+
+
+def render_derivatives(data):
+    """Encode every variant of the image in ``data``; runs in a pool worker."""
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    rendered = {}
+    for variant, width in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((width, width * 10), Image.Resampling.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            frame = resized
+            if image_format == 'JPEG' and frame.mode == 'RGBA':
+                # JPEG has no alpha: flatten onto white
+                background = Image.new('RGB', frame.size, 'white')
+                background.paste(frame, mask=frame.getchannel('A'))
+                frame = background
+            buffer = BytesIO()
+            frame.save(buffer, image_format, **options)
+            rendered[(variant, extension)] = buffer.getvalue()
+    return rendered
+
+
+def read_original(name, storage=default_storage):
+    with storage.open(name, 'rb') as original:
+        return original.read()
+
+
+def derived_storage():
+    return storages['derived']
+
+
+def store_derivatives(name, rendered, storage=None):
+    storage = storage or derived_storage()
+    for (variant, extension), data in rendered.items():
+        target = derivative_name(name, variant, extension)
+        # save() would pick a new name rather than overwrite
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(data))
+    _known.add(name)
+
+
+def has_derivatives(name, storage=None):
+    """Whether the variants of ``name`` exist; positive answers are remembered."""
+    if name in _known:
+        return True
+    storage = storage or derived_storage()
+    if all(storage.exists(target) for target in derivative_names(name)):
+        _known.add(name)
+        return True
+    return False
+
+
+# Storage names are never reused for different content while a file exists
+_known = set()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The shared resize pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: forking a threaded server can deadlock the child
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def schedule_derivatives(name):
+    """Build the variants of ``name`` once the current transaction commits."""
+    transaction.on_commit(lambda: build_derivatives(name), robust=True)
+
+
+def build_image_variants(sender, instance, update_fields=None, **kwargs):
+    """post_save receiver: resize a newly saved image in the background."""
+    field = IMAGE_FIELDS[sender._meta.label]
+    if update_fields is not None and field not in update_fields:
+        return
+    image = getattr(instance, field)
+    if image:
+        schedule_derivatives(image.name)
+
+
+def build_derivatives(name, force=False, wait=False):
+    """Render and store the variants of ``name`` unless they already exist."""
+    if not force and has_derivatives(name):
+        return
+    data = read_original(name)
+    if not settings.IMAGE_WORKERS:
+        store_derivatives(name, render_derivatives(data))
+        return
+
+    future = get_pool().submit(render_derivatives, data)
+    if wait:
+        store_derivatives(name, future.result())
+        return
+
+    def store(done):
+        try:
+            store_derivatives(name, done.result())
+        except Exception:
+            logger.exception("Could not build image variants for %s", name)
+    future.add_done_callback(store)
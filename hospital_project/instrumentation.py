@@ -0,0 +1,145 @@
+"""
+Per-request performance metrics.
+
+RequestMetricsMiddleware counts queries and SQL time through a database
+execute wrapper, times template rendering through the TimedDjangoTemplates
+backend, and reports both with the wall time of the request as a
+``Server-Timing`` header and one ``hospital_project.metrics`` log line.
+Template time includes queries that querysets run lazily while rendering.
+
+Views declare how many queries they are expected to run with
+``@query_budget``; requests over budget are logged as warnings, and
+``hospital_project.testing.QueryBudgetMixin`` fails tests that exceed it.
+"""
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger('hospital_project.metrics')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters for one request; also the execute wrapper that fills them."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self._rendering = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'total_ms': round(self.total_time * 1000, 1),
+        }
+
+    def server_timing(self):
+        values = self.as_dict()
+        return ', '.join([
+            f'db;dur={values["sql_ms"]};desc="{self.queries} queries"',
+            f'tpl;dur={values["template_ms"]}',
+            f'total;dur={values["total_ms"]}',
+        ])
+
+
+def query_budget(limit):
+    """Declare the most queries a view should run for one request."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+class RequestMetricsMiddleware:
+    """Measure every request and report it as a header and a log line."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.total_time = time.perf_counter() - start
+
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = metrics.server_timing()
+
+        match = request.resolver_match
+        view_name = match.view_name if match else '-'
+        budget = getattr(match.func, 'query_budget', None) if match else None
+        values = metrics.as_dict()
+        log_line = ' '.join([
+            f'view={view_name}',
+            f'method={request.method}',
+            f'status={response.status_code}',
+            *(f'{key}={value}' for key, value in values.items()),
+        ])
+        extra = {'view': view_name, 'status': response.status_code, **values}
+
+        if budget is not None and metrics.queries > budget:
+            logger.warning('%s budget=%d over_budget', log_line, budget, extra=extra)
+        else:
+            logger.info(log_line, extra=extra)
+        return response
+
+
+class _TimedTemplate:
+    """Wraps a backend template so top-level renders add to the request's template time."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+
+        # Templates rendered from inside another template are already timed
+        metrics._rendering += 1
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics._rendering -= 1
+            if not metrics._rendering:
+                metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render times fed to RequestMetrics."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,143 @@
+"""
+Keyset (cursor) pagination for list views.
+
+Pages are addressed by the ordering values of the row at the page boundary
+rather than by OFFSET, so fetching page 1000 costs the same index range scan
+as page 1. The ordering must end in a unique field (normally ``-id``), and
+every ordering field must be a non-null column on the model itself or a
+non-null annotation on the queryset (e.g. a search rank).
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PER_PAGE = 25
+
+
+class KeysetPage:
+    """One page of results plus the query strings for its neighbours."""
+
+    def __init__(self, object_list, next_query, previous_query):
+        self.object_list = object_list
+        self.next_query = next_query
+        self.previous_query = previous_query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_query is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_query is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def paginate(request, queryset, ordering, per_page=DEFAULT_PER_PAGE):
+    """
+    Return a KeysetPage of ``queryset`` ordered by ``ordering``.
+
+    The ``after`` / ``before`` GET parameters carry the cursor; every other
+    GET parameter (filters) is preserved in the next/previous links.
+    """
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    model_fields = [_model_field(queryset, name) for name, _ in fields]
+
+    after = _decode(request.GET.get('after'), model_fields)
+    before = _decode(request.GET.get('before'), model_fields) if after is None else None
+
+    if before is not None:
+        # Walk backwards from the cursor, then restore display order
+        reversed_fields = [(name, not descending) for name, descending in fields]
+        rows = list(
+            queryset.filter(_after(reversed_fields, before))
+            .order_by(*_order_by(reversed_fields))[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            queryset = queryset.filter(_after(fields, after))
+        rows = list(queryset.order_by(*_order_by(fields))[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after is not None
+
+    next_query = previous_query = None
+    if rows and has_next:
+        next_query = _query(request, 'after', _encode(rows[-1], fields, model_fields))
+    if rows and has_previous:
+        previous_query = _query(request, 'before', _encode(rows[0], fields, model_fields))
+    return KeysetPage(rows, next_query, previous_query)
+
+
+def _model_field(queryset, name):
+    model = queryset.model
+    if name == 'pk':
+        return model._meta.pk
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise ValueError(f"Keyset ordering field '{name}' must be a column or annotation on {model.__name__}.")
+
+
+def _order_by(fields):
+    return [f"-{name}" if descending else name for name, descending in fields]
+
+
+def _after(fields, values):
+    """Rows strictly past ``values`` in the given ordering."""
+    condition = Q()
+    for i, (name, descending) in enumerate(fields):
+        step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[i]})
+        for j in range(i):
+            step &= Q(**{fields[j][0]: values[j]})
+        condition |= step
+    # Redundant, but a plain bound on the leading column is what lets the
+    # planner seek into the index instead of scanning it from the start
+    name, descending = fields[0]
+    return Q(**{f"{name}__{'lte' if descending else 'gte'}": values[0]}) & condition
+
+
+def _encode(obj, fields, model_fields):
+    values = [
+        # Annotation output fields are not bound to a model attribute
+        model_field.value_to_string(obj) if getattr(model_field, 'model', None) else str(getattr(obj, name))
+        for (name, _), model_field in zip(fields, model_fields)
+    ]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _decode(cursor, model_fields):
+    """Turn a cursor back into typed values; bad cursors restart at page 1."""
+    if not cursor:
+        return None
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(raw) != len(model_fields):
+            return None
+        return [field.to_python(value) for field, value in zip(model_fields, raw)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _query(request, key, cursor):
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[key] = cursor
+    return params.urlencode()
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'pharmacy',
     'billing',
     'adminpanel',
+    'taskqueue',
 ]
 
 MIDDLEWARE = [
@@ -51,6 +52,9 @@ MIDDLEWARE = [
     # Whitenoise for Render static hosting
     'whitenoise.middleware.WhiteNoiseMiddleware',
 
+    # Query count / SQL / template timing per view
+    'hospital_project.instrumentation.RequestMetricsMiddleware',
+
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,7 +68,7 @@ ROOT_URLCONF = 'hospital_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'hospital_project.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,6 +77,9 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'libraries': {
+                'images': 'hospital_project.templatetags.images',
+            },
         },
     },
 ]
@@ -89,6 +96,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock when a transaction starts so concurrent writers
+        # wait for each other instead of failing with "database is locked"
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
     }
 }
 
@@ -144,6 +154,66 @@ WHITENOISE_KEEP_ONLY_HASHED_FILES = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored once per distinct content (see hospital_project/storage.py);
+# resized variants are written under derived/ with plain names
+STORAGES = {
+    "default": {"BACKEND": "hospital_project.storage.ContentAddressedStorage"},
+    "derived": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Processes that resize uploaded images (see hospital_project/images.py);
+# 0 resizes inline in the request that saved the image
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+
+
+# ============================================================
+# CACHE
+# ============================================================
+
+# Per-process memory cache; switch to a shared backend (e.g. Redis) to share
+# cached snapshots between gunicorn workers
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "carepoint",
+    }
+}
+
+
+# ============================================================
+# BACKGROUND TASKS
+# ============================================================
+
+# A running task not finished within the lease is assumed lost with its
+# worker and claimed again (see taskqueue/queue.py)
+TASK_LEASE_SECONDS = int(os.environ.get("TASK_LEASE_SECONDS", 600))
+# Successful tasks are deleted after this many days; failed ones are kept
+TASK_RETENTION_DAYS = int(os.environ.get("TASK_RETENTION_DAYS", 7))
+
+
+# ============================================================
+# REQUEST METRICS
+# ============================================================
+
+# Send query / template timings to the browser as a Server-Timing header
+SERVER_TIMING = os.environ.get("SERVER_TIMING", str(DEBUG)) == "True"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "hospital_project.metrics": {
+            "handlers": ["console"],
+            "level": os.environ.get("METRICS_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
 
 # ============================================================
 # AUTH
@@ -164,6 +234,17 @@ LOGOUT_REDIRECT_URL = 'accounts:login'
 
 RAZORPAY_KEY_ID = os.environ.get("RAZORPAY_KEY_ID", "")
 RAZORPAY_KEY_SECRET = os.environ.get("RAZORPAY_KEY_SECRET", "")
+# Set to check the X-Razorpay-Signature of webhook deliveries
+RAZORPAY_WEBHOOK_SECRET = os.environ.get("RAZORPAY_WEBHOOK_SECRET", "")
+# e.g. http://127.0.0.1:8765 while `manage.py razorpay_standin` runs; empty for the real API
+RAZORPAY_BASE_URL = os.environ.get("RAZORPAY_BASE_URL", "")
+# (connect, read) seconds for every gateway call
+RAZORPAY_TIMEOUT = (
+    float(os.environ.get("RAZORPAY_CONNECT_TIMEOUT", 3.05)),
+    float(os.environ.get("RAZORPAY_READ_TIMEOUT", 10)),
+)
+# An invoice reuses its Razorpay order for this long
+RAZORPAY_ORDER_MAX_AGE = int(os.environ.get("RAZORPAY_ORDER_MAX_AGE", 60 * 60 * 24))
 
 
 # ============================================================
@@ -0,0 +1,99 @@
+"""
+Content-addressed media storage.
+
+Uploads are hashed (SHA-256) while they are written, and each distinct file is
+kept once as ``blobs/<aa>/<digest><ext>``. Saving a file whose content is
+already stored returns the existing name, so the same upload made five times
+takes the space of one and every model field pointing at it holds the same
+reference. ``upload_to`` still runs but only its extension survives.
+
+Blobs are shared, so ``delete()`` leaves them alone. ``manage.py collect_media``
+removes the blobs that no ``User``, ``Medicine`` or ``Department`` references
+any more. A blob's content never changes under its name, so it can be cached
+for good: ``serve`` (used in development) sends it with an immutable
+Cache-Control header. A front server should send the same header for
+``MEDIA_URL + 'blobs/'``.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.cache import patch_cache_control
+from django.views import static
+
+
+BLOB_DIR = 'blobs'
+# Derived images of a blob are a function of its content, so they never change either
+IMMUTABLE_PREFIXES = (f'{BLOB_DIR}/', f'derived/{BLOB_DIR}/')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_DIR}/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Filesystem storage that keeps each distinct file once, named by its digest."""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is replaced by the digest in _save, so it never collides
+        return name
+
+    def _save(self, name, content):
+        extension = posixpath.splitext(name)[1].lower()
+        blobs = self.path(BLOB_DIR)
+        os.makedirs(blobs, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(blobs, self.directory_permissions_mode)
+
+        # Written beside the blobs so the final move is a rename on the same disk
+        digest = hashlib.sha256()
+        handle, temporary = tempfile.mkstemp(dir=blobs, prefix='.upload-')
+        try:
+            with os.fdopen(handle, 'wb') as destination:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    destination.write(chunk)
+
+            name = blob_name(digest.hexdigest(), extension)
+            path = self.path(name)
+            if os.path.exists(path):
+                # Refresh its age so collect_media's grace period covers the new reference
+                os.utime(path)
+                return name
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.directory_permissions_mode is not None:
+                os.chmod(os.path.dirname(path), self.directory_permissions_mode)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, path)
+            return name
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def delete(self, name):
+        # Other rows may share the blob; collect_media removes it once unreferenced
+        if is_blob(name):
+            return
+        super().delete(name)
+
+    def purge(self, name):
+        """Remove a file even if it is a blob."""
+        super().delete(name)
+
+
+def serve(request, path, document_root=None, show_indexes=False):
+    """django.views.static.serve, with blobs marked as cacheable forever."""
+    response = static.serve(request, path, document_root, show_indexes)
+    if path.startswith(IMMUTABLE_PREFIXES):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
@@ -0,0 +1,45 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from hospital_project.images import FORMATS, VARIANTS, derivative_name, derived_storage, has_derivatives
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt='', variant='medium', sizes=None, **attrs):
+    """
+    ``<picture>`` for an ImageField value, offering its WebP and JPEG variants
+    in a ``srcset`` so the browser downloads the smallest one that fits.
+
+    ``variant`` picks the fallback ``src``; ``sizes`` defaults to its width.
+    Images without variants yet are served as the original.
+    """
+    if not image:
+        return ''
+    attrs = {'loading': 'lazy', 'decoding': 'async', **attrs}
+    if not has_derivatives(image.name):
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, flatatt(attrs))
+
+    storage = derived_storage()
+    sizes = sizes or f'{VARIANTS[variant]}px'
+    srcsets = {
+        extension: ', '.join(
+            f'{storage.url(derivative_name(image.name, name, extension))} {width}w'
+            for name, width in VARIANTS.items()
+        )
+        for extension in FORMATS
+    }
+    # display: contents keeps <picture> out of the layout, so the <img> still
+    # sizes itself against the surrounding box
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>'
+        '</picture>',
+        srcsets['webp'], sizes,
+        storage.url(derivative_name(image.name, variant, 'jpg')), srcsets['jpg'], sizes,
+        alt, flatatt(attrs)
+    )
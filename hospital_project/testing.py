@@ -0,0 +1,64 @@
+"""
+Test helpers.
+
+Mix QueryBudgetMixin into a TestCase to hold views to the query budget they
+declare with ``@query_budget``::
+
+    class DashboardTests(QueryBudgetMixin, TestCase):
+        def test_dashboard_budget(self):
+            self.client.force_login(self.doctor.user)
+            self.assertWithinQueryBudget(reverse('doctors:dashboard'))
+
+``seed`` fills the test database with a small seed_scale data set, so budgets
+are checked against pages that list rows rather than empty ones.
+"""
+from io import StringIO
+from urllib.parse import urlsplit
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+def seed(**options):
+    """Run seed_scale with small defaults; ``options`` override them."""
+    options = {
+        'appointments': 300,
+        'doctors': 4,
+        'patients': 10,
+        'medicines': 30,
+        'orders': 60,
+        'carts': 10,
+        'years': 1,
+        'prefix': 'test',
+        **options,
+    }
+    call_command('seed_scale', stdout=StringIO(), **options)
+
+
+class QueryBudgetMixin:
+
+    def assertWithinQueryBudget(self, url, budget=None, client=None, method='get', **extra):
+        """
+        Request ``url`` (a GET unless ``method`` says otherwise) and fail if it
+        runs more queries than the view's budget.
+        """
+        client = client or self.client
+        match = resolve(urlsplit(url).path)
+        if budget is None:
+            budget = getattr(match.func, 'query_budget', None)
+        if budget is None:
+            self.fail(f"{match.view_name} does not declare a @query_budget.")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, **extra)
+
+        if len(queries) > budget:
+            statements = '\n'.join(
+                f"{i}. {query['sql']}" for i, query in enumerate(queries.captured_queries, start=1)
+            )
+            self.fail(
+                f"{match.view_name} ran {len(queries)} queries, budget is {budget}:\n{statements}"
+            )
+        return response
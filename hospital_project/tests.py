@@ -0,0 +1,102 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from hospital_project import images
+from pharmacy.models import Medicine
+
+
+def image_file(size=(1200, 600), color=(200, 40, 40, 255), mode='RGBA', image_format='PNG'):
+    buffer = BytesIO()
+    Image.new(mode, size, color).save(buffer, image_format)
+    return ContentFile(buffer.getvalue(), name='upload.png')
+
+
+class RenderDerivativesTests(TestCase):
+
+    def test_every_variant_in_every_format(self):
+        rendered = images.render_derivatives(image_file().read())
+        self.assertEqual(set(rendered), {
+            (variant, extension) for variant in images.VARIANTS for extension in images.FORMATS
+        })
+        for (variant, extension), data in rendered.items():
+            with self.subTest(variant=variant, extension=extension), Image.open(BytesIO(data)) as image:
+                self.assertEqual(image.format, images.FORMATS[extension][0])
+                self.assertEqual(image.size, (images.VARIANTS[variant], images.VARIANTS[variant] // 2))
+                if extension == 'jpg':
+                    # Flattened: JPEG has no alpha
+                    self.assertEqual(image.mode, 'RGB')
+
+    def test_small_images_are_not_enlarged(self):
+        rendered = images.render_derivatives(image_file(size=(100, 80), mode='L', color=128).read())
+        for data in rendered.values():
+            with Image.open(BytesIO(data)) as image:
+                self.assertEqual(image.size, (100, 80))
+
+
+@override_settings(IMAGE_WORKERS=0)
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        images._known.clear()
+        self.addCleanup(images._known.clear)
+
+    def save_medicine(self, medicine, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            medicine.save(**kwargs)
+
+    def render(self, medicine):
+        return Template(
+            '{% load images %}{% responsive_image medicine.image alt="Box" %}'
+        ).render(Context({'medicine': medicine}))
+
+    def test_variants_follow_the_saved_image(self):
+        medicine = Medicine(name='Paracetamol', price=10, stock=5)
+        medicine.image.save('box.png', image_file(), save=False)
+        self.save_medicine(medicine)
+        first = medicine.image.name
+        self.assertTrue(images.has_derivatives(first))
+
+        # Saves that leave the image alone schedule nothing
+        with mock.patch('hospital_project.images.schedule_derivatives') as schedule:
+            self.save_medicine(medicine, update_fields=['stock'])
+        schedule.assert_not_called()
+
+        medicine.image.save('box.png', image_file(color=(0, 0, 255, 255)), save=False)
+        self.save_medicine(medicine)
+        self.assertNotEqual(medicine.image.name, first)
+        storage = images.derived_storage()
+        for target in images.derivative_names(medicine.image.name):
+            self.assertTrue(storage.exists(target), target)
+
+    def test_tag_serves_the_original_until_variants_exist(self):
+        medicine = Medicine(name='Paracetamol', price=10, stock=5)
+        medicine.image.save('box.png', image_file(), save=False)
+        # Saved without signals, as a bulk import would
+        Medicine.objects.bulk_create([medicine])
+        medicine = Medicine.objects.get()
+
+        html = self.render(medicine)
+        self.assertNotIn('<picture', html)
+        self.assertIn(f'<img src="{medicine.image.url}" alt="Box"', html)
+
+        images.build_derivatives(medicine.image.name)
+        html = self.render(medicine)
+        self.assertIn('<source type="image/webp"', html)
+        storage = images.derived_storage()
+        self.assertIn(storage.url(images.derivative_name(medicine.image.name, 'medium', 'jpg')), html)
+        self.assertIn(storage.url(images.derivative_name(medicine.image.name, 'thumb', 'webp')) + ' 160w', html)
+
+    def test_empty_image_renders_nothing(self):
+        self.assertEqual(self.render(Medicine(name='Plain', price=1)), '')
@@ -7,6 +7,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 from accounts.views_create_admin import create_admin_view
+from hospital_project import storage
 
 
 urlpatterns = [
@@ -24,5 +25,5 @@ urlpatterns = [
 
 # Serve media files in development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(settings.MEDIA_URL, view=storage.serve, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0] if settings.STATICFILES_DIRS else None)
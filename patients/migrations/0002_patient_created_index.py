@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientprofile',
+            index=models.Index(fields=['created_at', 'id'], name='patient_created_idx'),
+        ),
+    ]
@@ -44,6 +44,11 @@ class PatientProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='patient_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username}"
     
@@ -1,3 +1,35 @@
+from django.db.models import Count
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from hospital_project.testing import QueryBudgetMixin, seed
+from patients.models import PatientProfile
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        cls.patient = PatientProfile.objects.annotate(
+            prescriptions=Count('appointments__prescription')
+        ).order_by('-prescriptions').select_related('user').first()
+
+    def setUp(self):
+        self.client.force_login(self.patient.user)
+
+    def test_dashboard(self):
+        response = self.assertWithinQueryBudget(reverse('patients:dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_appointment_history(self):
+        self.assertTrue(self.patient.appointments.exists())
+        for query in ('', '?status=completed', '?page=2'):
+            with self.subTest(query=query):
+                response = self.assertWithinQueryBudget(reverse('patients:appointment_history') + query)
+                self.assertEqual(response.status_code, 200)
+
+    def test_prescription_list(self):
+        self.assertTrue(self.patient.prescriptions)
+        response = self.assertWithinQueryBudget(reverse('patients:prescription_list'))
+        self.assertEqual(response.status_code, 200)
@@ -5,29 +5,33 @@ from django.utils import timezone
 from django.http import JsonResponse
 
 from accounts.decorators import patient_required
+from hospital_project.instrumentation import query_budget
+from hospital_project.pagination import paginate
 from .models import PatientProfile
 from .forms import PatientProfileForm
 from appointments.models import Appointment
 from appointments.forms import AppointmentBookingForm
+from appointments.booking import book, SlotUnavailable
 from doctors.models import Prescription, DoctorProfile
 from departments.models import Department
 
 
+@query_budget(10)
 @patient_required
 def dashboard(request):
     """Patient dashboard with overview."""
     patient = request.user.patient_profile
-    today = timezone.now().date()
     
     # Get upcoming appointments
-    upcoming_appointments = Appointment.objects.filter(
+    upcoming_appointments = Appointment.objects.upcoming().select_related(
+        'doctor__user', 'department'
+    ).filter(
         patient=patient,
-        scheduled_datetime__date__gte=today,
         status__in=['pending', 'confirmed']
     ).order_by('scheduled_datetime')[:5]
     
     # Get recent prescriptions
-    recent_prescriptions = Prescription.objects.filter(
+    recent_prescriptions = Prescription.objects.select_related('appointment__doctor__user').filter(
         appointment__patient=patient
     ).order_by('-created_at')[:5]
     
@@ -64,9 +68,13 @@ def book_appointment(request):
             appointment = form.save(commit=False)
             appointment.patient = patient
             appointment.scheduled_datetime = form.cleaned_data['scheduled_datetime']
-            appointment.save()
-            messages.success(request, 'Appointment booked successfully! Waiting for doctor confirmation.')
-            return redirect('patients:appointment_detail', pk=appointment.pk)
+            try:
+                book(appointment)
+            except SlotUnavailable as e:
+                form.add_error(None, str(e))
+            else:
+                messages.success(request, 'Appointment booked successfully! Waiting for doctor confirmation.')
+                return redirect('patients:appointment_detail', pk=appointment.pk)
     else:
         form = AppointmentBookingForm()
     
@@ -79,21 +87,23 @@ def book_appointment(request):
     return render(request, 'patients/book_appointment.html', context)
 
 
+@query_budget(6)
 @patient_required
 def appointment_history(request):
     """View appointment history."""
     patient = request.user.patient_profile
     status_filter = request.GET.get('status', '')
     
-    appointments = Appointment.objects.filter(patient=patient)
+    appointments = Appointment.objects.select_related('doctor__user', 'department').filter(patient=patient).with_payment_summary()
     
     if status_filter:
         appointments = appointments.filter(status=status_filter)
     
-    appointments = appointments.order_by('-scheduled_datetime')
+    page = paginate(request, appointments, ('-scheduled_datetime', '-id'))
     
     context = {
-        'appointments': appointments,
+        'appointments': page.object_list,
+        'page': page,
         'status_filter': status_filter,
     }
     return render(request, 'patients/appointment_history.html', context)
@@ -127,17 +137,20 @@ def cancel_appointment(request, pk):
     return redirect('patients:appointment_detail', pk=pk)
 
 
+@query_budget(6)
 @patient_required
 def prescription_list(request):
     """View all prescriptions."""
     patient = request.user.patient_profile
     
-    prescriptions = Prescription.objects.filter(
+    prescriptions = Prescription.objects.select_related('appointment__doctor__user').filter(
         appointment__patient=patient
-    ).order_by('-created_at')
+    )
+    page = paginate(request, prescriptions, ('-created_at', '-id'))
     
     context = {
-        'prescriptions': prescriptions,
+        'prescriptions': page.object_list,
+        'page': page,
     }
     return render(request, 'patients/prescription_list.html', context)
 
@@ -3,9 +3,9 @@ from .models import Medicine, PharmacyOrder, OrderItem, Cart, CartItem
 
 @admin.register(Medicine)
 class MedicineAdmin(admin.ModelAdmin):
-    list_display = ('name', 'generic_name', 'price', 'stock', 'unit', 'is_active')
+    list_display = ('name', 'sku', 'generic_name', 'price', 'stock', 'unit', 'is_active')
     list_filter = ('is_active', 'prescription_required')
-    search_fields = ('name', 'generic_name', 'manufacturer')
+    search_fields = ('name', 'sku', 'generic_name', 'manufacturer')
     list_editable = ('price', 'stock', 'is_active')
 
 class OrderItemInline(admin.TabularInline):
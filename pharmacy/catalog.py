@@ -0,0 +1,208 @@
+"""
+Faceted medicine catalog.
+
+The public catalog is narrowed by search text and four facets: manufacturer,
+unit, prescription requirement and price band. All of that state lives in
+the query string, so a URL fully describes a page and the response can be
+cached by the browser or a shared cache.
+
+Facet counts are disjunctive: each facet is counted under every *other*
+active filter, so picking one manufacturer still shows how many medicines
+the others have. They are summed in Python from a single query over the
+searched catalog grouped by all four facets. Those grouped rows are cached
+per search text, under a generation that saving or deleting a Medicine
+bumps (see ``pharmacy.signals``).
+"""
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.http import QueryDict
+
+from .models import Medicine
+from .search import search_medicines
+
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('under-100', 'Under ₹100', None, Decimal('100')),
+    ('100-500', '₹100 – ₹500', Decimal('100'), Decimal('500')),
+    ('500-1000', '₹500 – ₹1,000', Decimal('500'), Decimal('1000')),
+    ('over-1000', 'Over ₹1,000', Decimal('1000'), None),
+]
+PRESCRIPTION_CHOICES = [('yes', 'Rx required', True), ('no', 'No Rx needed', False)]
+
+FACETS = ('manufacturer', 'unit', 'rx', 'price')
+# Long facets show their biggest options; selected ones are always shown
+FACET_OPTION_LIMIT = 12
+
+FACET_ROWS_TTL = 300
+GENERATION_KEY = 'pharmacy:catalog:generation'
+FACET_ROWS_KEY = 'pharmacy:catalog:{generation}:{search}'
+
+# Max-age for anonymous catalog pages
+CATALOG_MAX_AGE = 60
+
+
+def price_band_case():
+    return Case(
+        *[
+            When(_band_q(lower, upper), then=Value(key))
+            for key, _, lower, upper in PRICE_BANDS
+        ],
+        output_field=CharField()
+    )
+
+
+def _band_q(lower, upper):
+    condition = Q()
+    if lower is not None:
+        condition &= Q(price__gte=lower)
+    if upper is not None:
+        condition &= Q(price__lt=upper)
+    return condition
+
+
+class Catalog:
+    """The catalog as described by one request's query string."""
+
+    def __init__(self, params):
+        self.search = params.get('search', '').strip()
+        bands = {key for key, *_ in PRICE_BANDS}
+        rx = {key for key, *_ in PRESCRIPTION_CHOICES}
+        self.selected = {
+            'manufacturer': set(params.getlist('manufacturer')) - {''},
+            'unit': set(params.getlist('unit')) - {''},
+            'rx': set(params.getlist('rx')) & rx,
+            'price': set(params.getlist('price')) & bands,
+        }
+
+    @property
+    def base(self):
+        """Everything on sale that matches the search text, before facets."""
+        medicines = Medicine.objects.filter(is_active=True, stock__gt=0)
+        if self.search:
+            medicines = search_medicines(self.search, medicines)
+        return medicines
+
+    @property
+    def ordering(self):
+        if self.search:
+            return ('-search_rank', 'name', 'id')
+        return ('name', 'id')
+
+    @property
+    def is_filtered(self):
+        return any(self.selected.values())
+
+    def results(self):
+        return self.base.filter(self.facet_filter())
+
+    def facet_filter(self):
+        """Q for every selected facet value."""
+        condition = Q()
+        selected = {facet: values for facet, values in self.selected.items() if values}
+        if 'manufacturer' in selected:
+            condition &= Q(manufacturer__in=selected['manufacturer'])
+        if 'unit' in selected:
+            condition &= Q(unit__in=selected['unit'])
+        if 'rx' in selected:
+            condition &= Q(prescription_required__in=[
+                required for key, _, required in PRESCRIPTION_CHOICES if key in selected['rx']
+            ])
+        if 'price' in selected:
+            bands = Q()
+            for key, _, lower, upper in PRICE_BANDS:
+                if key in selected['price']:
+                    bands |= _band_q(lower, upper)
+            condition &= bands
+        return condition
+
+    def facet_rows(self):
+        """(manufacturer, unit, rx, price band, count) for the searched catalog."""
+        search = ' '.join(self.search.lower().split())
+        key = FACET_ROWS_KEY.format(
+            generation=_generation(),
+            search=hashlib.md5(search.encode()).hexdigest()
+        )
+        rows = cache.get(key)
+        if rows is None:
+            rows = [
+                (row['manufacturer'], row['unit'], 'yes' if row['prescription_required'] else 'no',
+                 row['price_band'], row['count'])
+                for row in self.base.order_by().annotate(price_band=price_band_case()).values(
+                    'manufacturer', 'unit', 'prescription_required', 'price_band'
+                ).annotate(count=Count('id'))
+            ]
+            cache.set(key, rows, FACET_ROWS_TTL)
+        return rows
+
+    def facets(self):
+        """Options with counts and toggle links for each facet, plus the total."""
+        counts = {facet: {} for facet in FACETS}
+        total = 0
+        for *values, count in self.facet_rows():
+            misses = [
+                facet for facet, value in zip(FACETS, values)
+                if self.selected[facet] and value not in self.selected[facet]
+            ]
+            if not misses:
+                total += count
+            for facet, value in zip(FACETS, values):
+                # A row counts for a facet when only that facet (if any) rejects it
+                if value and (not misses or misses == [facet]):
+                    counts[facet][value] = counts[facet].get(value, 0) + count
+
+        labels = {
+            'rx': {key: label for key, label, _ in PRESCRIPTION_CHOICES},
+            'price': {key: label for key, label, *_ in PRICE_BANDS},
+        }
+        facets = {}
+        for facet in FACETS:
+            if facet in labels:
+                values = [value for value in labels[facet] if counts[facet].get(value) or value in self.selected[facet]]
+            else:
+                values = sorted(counts[facet], key=lambda value: (-counts[facet][value], value))
+                shown = values[:FACET_OPTION_LIMIT]
+                values = sorted(set(shown) | self.selected[facet], key=str.lower)
+            facets[facet] = [
+                {
+                    'value': value,
+                    'label': labels.get(facet, {}).get(value, value),
+                    'count': counts[facet].get(value, 0),
+                    'selected': value in self.selected[facet],
+                    'query': self.query(toggle=(facet, value)),
+                }
+                for value in values
+            ]
+        return {'total': total, **facets, 'clear_query': self.query(clear=True)}
+
+    def query(self, toggle=None, clear=False):
+        """Canonical query string for this catalog, optionally with one value toggled."""
+        params = QueryDict(mutable=True)
+        if self.search:
+            params['search'] = self.search
+        if not clear:
+            for facet in FACETS:
+                values = set(self.selected[facet])
+                if toggle and toggle[0] == facet:
+                    values ^= {toggle[1]}
+                params.setlist(facet, sorted(values))
+        return params.urlencode()
+
+
+def invalidate_catalog():
+    """Retire the cached facet counts."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
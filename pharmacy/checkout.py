@@ -0,0 +1,58 @@
+"""
+Turning a cart into a pharmacy order.
+
+``place_order`` does the whole checkout in one transaction with a fixed
+number of queries, however many lines the cart has: one read of the cart
+and its medicines, one insert each for the order, its items and its stock
+holds, one conditional stock update (see ``pharmacy.stock``) and one delete
+to empty the cart. Prices are snapshotted from that single read, so the
+order total always matches its items.
+"""
+from django.db import transaction
+
+from appointments.booking import run_with_retries
+
+from .models import OrderItem, PharmacyOrder
+from .stock import reserve_stock
+
+
+class EmptyCart(Exception):
+    """Raised when there is nothing in the cart to order."""
+
+
+def place_order(cart, shipping_address='', notes=''):
+    """
+    Create a pending order from ``cart``, hold its stock and empty the cart.
+
+    Raises EmptyCart, or OutOfStock if any line cannot be covered, in which
+    case nothing is written. Transient lock errors are retried.
+    """
+    def attempt():
+        with transaction.atomic():
+            cart_items = list(cart.items.select_related('medicine'))
+            if not cart_items:
+                raise EmptyCart()
+
+            order = PharmacyOrder.objects.create(
+                patient_id=cart.patient_id,
+                shipping_address=shipping_address,
+                notes=notes,
+                total_amount=sum(item.subtotal for item in cart_items)
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    medicine=item.medicine,
+                    quantity=item.quantity,
+                    price=item.medicine.price
+                )
+                for item in cart_items
+            ])
+
+            # Hold the stock until the order is paid or the hold expires
+            reserve_stock(order, [(item.medicine, item.quantity) for item in cart_items])
+
+            cart.items.all().delete()
+        return order
+
+    return run_with_retries(attempt)
@@ -8,10 +8,11 @@ class MedicineForm(forms.ModelForm):
     class Meta:
         model = Medicine
         fields = [
-            'name', 'generic_name', 'manufacturer', 'description',
+            'sku', 'name', 'generic_name', 'manufacturer', 'description',
             'price', 'stock', 'unit', 'prescription_required', 'image', 'is_active'
         ]
         widgets = {
+            'sku': forms.TextInput(attrs={'class': 'form-control'}),
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'generic_name': forms.TextInput(attrs={'class': 'form-control'}),
             'manufacturer': forms.TextInput(attrs={'class': 'form-control'}),
@@ -24,6 +25,15 @@ class MedicineForm(forms.ModelForm):
         }
 
 
+class MedicineImportForm(forms.Form):
+    """Upload form for a CSV or JSON Lines medicine catalog."""
+    
+    file = forms.FileField(
+        help_text='CSV with a header row, or JSON Lines (.jsonl). Rows are matched on sku.',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.ndjson'})
+    )
+
+
 class AddToCartForm(forms.Form):
     """Form for adding items to cart."""
     
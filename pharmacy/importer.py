@@ -0,0 +1,188 @@
+"""
+Bulk medicine catalog import.
+
+Reads a CSV (with a header row) or JSON Lines catalog as a stream, validates
+each row with the MedicineForm rules and upserts valid rows by ``sku`` in
+chunks with ``bulk_create(update_conflicts=True)``. A bad row is reported
+with its line number and skipped; it never aborts the rest of the file. Only
+one chunk is held in memory at a time.
+
+The columns of the first row decide what is written: a column the file does
+not have is left untouched on existing medicines and takes the model default
+on new ones. ``bulk_create`` sends no signals, so the search and catalog
+caches are retired once the import finishes.
+"""
+import csv
+import json
+
+from django.db import transaction
+
+from .catalog import invalidate_catalog
+from .forms import MedicineForm
+from .models import Medicine
+from .search import invalidate_autocomplete
+
+
+IMPORT_FIELDS = [
+    'sku', 'name', 'generic_name', 'manufacturer', 'description',
+    'price', 'stock', 'unit', 'prescription_required', 'is_active'
+]
+BOOLEAN_FIELDS = {'prescription_required', 'is_active'}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class CatalogFormatError(Exception):
+    """Raised when the file as a whole cannot be imported."""
+
+
+class MedicineRowForm(MedicineForm):
+    """MedicineForm rules for one imported row."""
+
+    class Meta(MedicineForm.Meta):
+        fields = IMPORT_FIELDS
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['sku'].required = True
+
+    def validate_unique(self):
+        # The SKU is the upsert key: an existing SKU is an update, not an error
+        pass
+
+
+class ImportResult:
+    """Counts and per-row errors of one import run."""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def read_rows(stream, file_format):
+    """Yield ``(line number, row dict or error message)`` from a text stream."""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        if reader.fieldnames is None:
+            return
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                yield line, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line, 'Expected a JSON object.'
+                continue
+            yield line, {str(key).strip().lower(): value for key, value in row.items()}
+    else:
+        raise CatalogFormatError(f"Unknown format '{file_format}'; use csv or jsonl.")
+
+
+def format_for(filename):
+    """Guess the file format from its extension."""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise CatalogFormatError('Upload a .csv or .jsonl file.')
+
+
+def import_medicines(stream, file_format, chunk_size=CHUNK_SIZE, dry_run=False):
+    """Validate and upsert every row of ``stream``; returns an ImportResult."""
+    result = ImportResult()
+    columns = None
+    chunk = {}
+
+    for line, row in read_rows(stream, file_format):
+        result.rows += 1
+        if isinstance(row, str):
+            result.add_error(line, row)
+            continue
+        if columns is None:
+            columns = [field for field in IMPORT_FIELDS if field in row]
+            if 'sku' not in columns:
+                raise CatalogFormatError('The catalog needs a sku column.')
+
+        try:
+            form = MedicineRowForm(data=_form_data(row, columns))
+        except ValueError as e:
+            result.add_error(line, str(e))
+            continue
+        if not form.is_valid():
+            result.add_error(line, '; '.join(
+                f'{field}: {" ".join(messages)}' for field, messages in form.errors.items()
+            ))
+            continue
+        medicine = form.save(commit=False)
+        if medicine.sku in chunk:
+            # The later row wins, as it would in a row-by-row load
+            result.duplicates += 1
+        chunk[medicine.sku] = medicine
+        if len(chunk) >= chunk_size:
+            _upsert(chunk, columns, result, dry_run)
+            chunk = {}
+
+    if chunk:
+        _upsert(chunk, columns, result, dry_run)
+    if result.imported and not dry_run:
+        invalidate_autocomplete()
+        invalidate_catalog()
+    return result
+
+
+def _form_data(row, columns):
+    data = {}
+    for field in IMPORT_FIELDS:
+        if field in columns:
+            value = row.get(field)
+            value = '' if value is None else str(value).strip()
+        elif Medicine._meta.get_field(field).has_default():
+            value = str(Medicine._meta.get_field(field).default)
+        else:
+            continue
+        if field in BOOLEAN_FIELDS:
+            # CheckboxInput would read any non-empty string, even "0", as True
+            lowered = value.lower()
+            if lowered not in TRUE_VALUES | FALSE_VALUES:
+                raise ValueError(f'{field}: Enter yes or no, not "{value}".')
+            value = 'true' if lowered in TRUE_VALUES else 'false'
+        data[field] = value
+    return data
+
+
+def _upsert(chunk, columns, result, dry_run):
+    existing = set(Medicine.objects.filter(sku__in=chunk).values_list('sku', flat=True))
+    if not dry_run:
+        with transaction.atomic():
+            Medicine.objects.bulk_create(
+                chunk.values(),
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=[field for field in columns if field != 'sku'] + ['updated_at']
+            )
+    result.updated += len(existing)
+    result.created += len(chunk) - len(existing)
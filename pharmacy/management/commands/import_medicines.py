@@ -0,0 +1,57 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.importer import CHUNK_SIZE, CatalogFormatError, format_for, import_medicines
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert medicines by sku from a CSV (with a header row) or JSON Lines "
+        "catalog. Rows that fail validation are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Catalog file, or '-' to read standard input")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--errors', help='Write rejected rows (line, error) to this CSV file')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            file_format = options['format'] or format_for(path)
+        except CatalogFormatError as e:
+            raise CommandError(f"{e} Pass --format for standard input or other names.")
+
+        started = time.perf_counter()
+        try:
+            if path == '-':
+                result = import_medicines(sys.stdin, file_format, options['chunk_size'], options['dry_run'])
+            else:
+                with open(path, encoding='utf-8-sig', newline='') as stream:
+                    result = import_medicines(stream, file_format, options['chunk_size'], options['dry_run'])
+        except (OSError, CatalogFormatError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        if options['errors'] and result.errors:
+            with open(options['errors'], 'w', newline='') as errors_file:
+                writer = csv.writer(errors_file)
+                writer.writerow(['line', 'error'])
+                writer.writerows(result.errors)
+        else:
+            for line, message in result.errors[:20]:
+                self.stderr.write(f"line {line}: {message}")
+        if result.error_count > 20 and not options['errors']:
+            self.stderr.write(f"... {result.error_count - 20} more; use --errors to save them all.")
+
+        rate = result.rows / elapsed * 60 if elapsed else 0
+        verb = "Would import" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.imported} of {result.rows} rows ({result.created} new, {result.updated} updated, "
+            f"{result.error_count} rejected) in {elapsed:.1f}s, {rate:,.0f} rows/min."
+        ))
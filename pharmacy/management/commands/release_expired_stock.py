@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pharmacy.stock import RESERVATION_TTL, release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Give back stock held by unpaid pharmacy orders whose reservation is "
+        f"older than {RESERVATION_TTL}, and cancel those orders. Run it from "
+        "cron every few minutes."
+    )
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired stock reservations."))
@@ -0,0 +1,82 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.booking import run_with_retries
+from pharmacy.models import Medicine, OrderItem, PharmacyOrder, StockReservation
+from pharmacy.stock import OutOfStock, release_expired, reserve_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire parallel checkouts at one hot medicine and fail unless exactly "
+        "its stock is sold, nothing is oversold, and expiring the holds puts "
+        "every unit back. Creates and removes its own data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=50, help='Units of the hot medicine')
+        parser.add_argument('--shoppers', type=int, default=200, help='Parallel checkouts')
+        parser.add_argument('--quantity', type=int, default=1, help='Units per checkout')
+        parser.add_argument('--threads', type=int, default=50)
+
+    def handle(self, *args, **options):
+        prefix = f"stress-{uuid.uuid4().hex[:8]}"
+        stock, quantity = options['stock'], options['quantity']
+        patient_user = User.objects.create(username=f"{prefix}-patient", role=User.Role.PATIENT)
+        medicine = Medicine.objects.create(name=f"{prefix} hot medicine", price=10, stock=stock)
+        try:
+            patient = patient_user.patient_profile
+
+            def attempt(_):
+                def place_order():
+                    with transaction.atomic():
+                        order = PharmacyOrder.objects.create(patient=patient, total_amount=medicine.price * quantity)
+                        OrderItem.objects.create(order=order, medicine=medicine, quantity=quantity, price=medicine.price)
+                        reserve_stock(order, [(medicine, quantity)])
+                try:
+                    run_with_retries(place_order)
+                    return True
+                except OutOfStock:
+                    return False
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                started = time.perf_counter()
+                results = list(pool.map(attempt, range(options['shoppers'])))
+                elapsed = time.perf_counter() - started
+
+            sold = sum(results)
+            medicine.refresh_from_db()
+            held = StockReservation.objects.filter(
+                medicine=medicine,
+                status=StockReservation.Status.HELD
+            ).aggregate(total=Sum('quantity'))['total'] or 0
+            self.stdout.write(
+                f"{sold}/{len(results)} checkouts won in {elapsed:.2f}s; "
+                f"stock left {medicine.stock}, held {held}"
+            )
+
+            expected = min(options['shoppers'], stock // quantity)
+            if sold != expected:
+                raise CommandError(f"Expected {expected} successful checkouts, got {sold}.")
+            if medicine.stock != stock - sold * quantity or held != sold * quantity:
+                raise CommandError("Stock and reservations disagree: units were oversold or lost.")
+
+            StockReservation.objects.filter(medicine=medicine).update(expires_at=timezone.now() - timedelta(seconds=1))
+            release_expired()
+            medicine.refresh_from_db()
+            if medicine.stock != stock:
+                raise CommandError(f"Expired holds should return all {stock} units, stock is {medicine.stock}.")
+            self.stdout.write(self.style.SUCCESS("Checkout never oversells and expired holds are returned."))
+        finally:
+            medicine.delete()
+            patient_user.delete()
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0002_doctor_prescription_created_index'),
+        ('patients', '0002_patient_created_index'),
+        ('pharmacy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['name', 'id'], name='medicine_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pharmacyorder',
+            index=models.Index(fields=['created_at', 'id'], name='pharmacy_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pharmacyorder',
+            index=models.Index(fields=['patient', 'created_at'], name='pharmacy_order_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pharmacyorder',
+            index=models.Index(fields=['status', 'created_at'], name='pharmacy_order_status_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+from django.db import migrations
+
+
+# Kept in step with pharmacy.search.PG_SEARCH_VECTOR
+PG_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(generic_name, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(manufacturer, '')), 'C')"
+)
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX medicine_search_vector_idx ON pharmacy_medicine USING gin (({PG_SEARCH_VECTOR}))",
+    "CREATE INDEX medicine_name_trgm_idx ON pharmacy_medicine USING gin (name gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS medicine_name_trgm_idx",
+    "DROP INDEX IF EXISTS medicine_search_vector_idx",
+]
+
+# External-content FTS5 table: it stores only the index, the text stays in
+# pharmacy_medicine. Stock updates do not touch the indexed columns, so they
+# never fire the update trigger. Django remakes a table on SQLite for most
+# column changes, which drops its triggers: a later migration that alters
+# pharmacy_medicine must run SQLITE_TRIGGERS and SQLITE_REBUILD again.
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER pharmacy_medicine_fts_insert AFTER INSERT ON pharmacy_medicine BEGIN
+        INSERT INTO pharmacy_medicine_fts (rowid, name, generic_name, manufacturer)
+        VALUES (new.id, new.name, new.generic_name, new.manufacturer);
+    END
+    """,
+    """
+    CREATE TRIGGER pharmacy_medicine_fts_delete AFTER DELETE ON pharmacy_medicine BEGIN
+        INSERT INTO pharmacy_medicine_fts (pharmacy_medicine_fts, rowid, name, generic_name, manufacturer)
+        VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer);
+    END
+    """,
+    """
+    CREATE TRIGGER pharmacy_medicine_fts_update
+    AFTER UPDATE OF name, generic_name, manufacturer ON pharmacy_medicine BEGIN
+        INSERT INTO pharmacy_medicine_fts (pharmacy_medicine_fts, rowid, name, generic_name, manufacturer)
+        VALUES ('delete', old.id, old.name, old.generic_name, old.manufacturer);
+        INSERT INTO pharmacy_medicine_fts (rowid, name, generic_name, manufacturer)
+        VALUES (new.id, new.name, new.generic_name, new.manufacturer);
+    END
+    """,
+]
+SQLITE_REBUILD = "INSERT INTO pharmacy_medicine_fts (pharmacy_medicine_fts) VALUES ('rebuild')"
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE pharmacy_medicine_fts USING fts5(
+        name, generic_name, manufacturer,
+        content='pharmacy_medicine', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    SQLITE_REBUILD,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS pharmacy_medicine_fts_update",
+    "DROP TRIGGER IF EXISTS pharmacy_medicine_fts_delete",
+    "DROP TRIGGER IF EXISTS pharmacy_medicine_fts_insert",
+    "DROP TABLE IF EXISTS pharmacy_medicine_fts",
+]
+
+
+def has_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'sqlite' and not has_fts5(schema_editor):
+            # search_medicines falls back to icontains without the table
+            return
+        for statement in statements_by_vendor.get(vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0003_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0004_medicine_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['manufacturer', 'name', 'id'], name='medicine_manufacturer_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+search = import_module('pharmacy.migrations.0004_medicine_search')
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # Adding a unique column remakes pharmacy_medicine on SQLite, which
+    # drops the triggers that keep the search table in step
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or 'pharmacy_medicine_fts' not in connection.introspection.table_names():
+        return
+    for statement in search.SQLITE_TRIGGERS:
+        schema_editor.execute(statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS', 1))
+    schema_editor.execute(search.SQLITE_REBUILD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0005_catalog_indexes'),
+    ]
+
+    operations = [
+        # Restores the triggers again after the column is removed on reverse
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='medicine',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,16 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from django.conf import settings
 
 
 class Medicine(models.Model):
     """Medicine/drug model for pharmacy."""
     
+    # Distributor stock-keeping unit; the natural key for catalog imports
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=200)
     generic_name = models.CharField(max_length=200, blank=True)
     manufacturer = models.CharField(max_length=200, blank=True)
@@ -20,6 +26,10 @@ class Medicine(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='medicine_name_idx'),
+            models.Index(fields=['manufacturer', 'name', 'id'], name='medicine_manufacturer_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -66,6 +76,11 @@ class PharmacyOrder(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='pharmacy_order_created_idx'),
+            models.Index(fields=['patient', 'created_at'], name='pharmacy_order_patient_idx'),
+            models.Index(fields=['status', 'created_at'], name='pharmacy_order_status_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.pk} by {self.patient}"
@@ -105,6 +120,70 @@ class OrderItem(models.Model):
         super().save(*args, **kwargs)
 
 
+class StockReservation(models.Model):
+    """Quantity of one medicine held for an order until it is paid or expires.
+
+    ``Medicine.stock`` is decremented when the hold is taken, so it always
+    shows what is still available to sell. See ``pharmacy.stock``.
+    """
+    
+    class Status(models.TextChoices):
+        HELD = 'held', 'Held'
+        COMMITTED = 'committed', 'Committed'
+        RELEASED = 'released', 'Released'
+    
+    order = models.ForeignKey(
+        PharmacyOrder,
+        on_delete=models.CASCADE,
+        related_name='stock_reservations'
+    )
+    medicine = models.ForeignKey(
+        Medicine,
+        on_delete=models.CASCADE,
+        related_name='stock_reservations'
+    )
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.HELD
+    )
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['order', 'medicine']
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='stock_resv_status_exp_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.medicine} for order #{self.order_id} ({self.status})"
+
+
+def cart_totals(prefix=''):
+    """Line count and total of the cart items reached through ``prefix``."""
+    return {
+        'cart_item_count': models.Count(f'{prefix}id'),
+        'cart_total': Coalesce(
+            models.Sum(
+                models.F(f'{prefix}quantity') * models.F(f'{prefix}medicine__price'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            ),
+            models.Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+    }
+
+
+class CartQuerySet(models.QuerySet):
+    
+    def with_totals(self):
+        """Annotate ``cart_item_count`` and ``cart_total`` so the summary needs no extra query."""
+        return self.annotate(**cart_totals('items__'))
+
+
 class Cart(models.Model):
     """Shopping cart for patient."""
     
@@ -116,16 +195,32 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CartQuerySet.as_manager()
+    
     def __str__(self):
         return f"Cart for {self.patient}"
     
+    @cached_property
+    def lines(self):
+        """The cart's items with their medicines, fetched once per instance."""
+        return list(self.items.select_related('medicine'))
+    
+    def _load_totals(self):
+        if not hasattr(self, 'cart_total'):
+            totals = self.items.aggregate(**cart_totals())
+            self.cart_item_count = totals['cart_item_count']
+            self.cart_total = totals['cart_total']
+    
     @property
     def total(self):
-        return sum(item.subtotal for item in self.items.all())
+        self._load_totals()
+        # SQLite returns computed decimals unscaled
+        return self.cart_total.quantize(Decimal('0.01'))
     
     @property
     def item_count(self):
-        return self.items.count()
+        self._load_totals()
+        return self.cart_item_count
 
 
 class CartItem(models.Model):
@@ -0,0 +1,207 @@
+"""
+Medicine search and autocomplete.
+
+``search_medicines`` matches name, generic name and manufacturer, weighted in
+that order, and orders the results by relevance. It uses the database's own
+index: on PostgreSQL a ``tsvector`` expression index plus ``pg_trgm`` for
+misspelt names, on SQLite the FTS5 shadow table ``pharmacy_medicine_fts``,
+which triggers keep in step with the medicine table. Migration
+0004_medicine_search creates whichever applies. Other backends, or an SQLite
+build without FTS5, fall back to ``icontains``.
+
+``autocomplete`` answers name prefixes from a sorted in-process index. Saving
+or deleting a Medicine bumps a generation number in the cache (see
+``pharmacy.signals``), and a process rebuilds its index when it notices. Only
+a cache shared between processes (Redis, Memcached) carries the bump to every
+worker; with the default per-process LocMemCache the others see the change
+when their index reaches INDEX_MAX_AGE.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Medicine
+
+
+FTS_TABLE = 'pharmacy_medicine_fts'
+
+# Must stay identical to the index expression in migration 0004; PostgreSQL
+# only uses an expression index when the query repeats it exactly
+PG_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({table}name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({table}generic_name, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce({table}manufacturer, '')), 'C')"
+)
+
+# bm25 column weights for name, generic_name, manufacturer
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+AUTOCOMPLETE_LIMIT = 10
+GENERATION_KEY = 'pharmacy:autocomplete:generation'
+# Rebuilt at least this often, whatever the generation says
+INDEX_MAX_AGE = 60
+
+
+def search_terms(query):
+    """Lower-cased word tokens of ``query``; safe to splice into a match expression."""
+    return re.findall(r'\w+', query.lower())
+
+
+def search_medicines(query, queryset=None):
+    """
+    Filter ``queryset`` (active medicines by default) to matches for ``query``.
+
+    Every word must match, as a prefix, one of the searched fields. The result
+    is annotated with ``search_rank``, higher is better, and ordered by it.
+    """
+    if queryset is None:
+        queryset = Medicine.objects.filter(is_active=True)
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        queryset = _postgres_search(queryset, terms)
+    elif connection.vendor == 'sqlite' and _has_fts_table(connection):
+        queryset = _sqlite_search(queryset, terms)
+    else:
+        queryset = _fallback_search(queryset, terms)
+    return queryset.order_by('-search_rank', 'name', 'id')
+
+
+def _postgres_search(queryset, terms):
+    table = f'{Medicine._meta.db_table}.'
+    vector = PG_SEARCH_VECTOR.format(table=table)
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    phrase = ' '.join(terms)
+    matches = RawSQL(
+        f"({vector}) @@ to_tsquery('simple', %s) OR {table}name %% %s",
+        (tsquery, phrase),
+        output_field=BooleanField()
+    )
+    rank = RawSQL(
+        f"ts_rank({vector}, to_tsquery('simple', %s)) + similarity({table}name, %s)",
+        (tsquery, phrase),
+        output_field=FloatField()
+    )
+    return queryset.filter(matches).annotate(search_rank=rank)
+
+
+def _sqlite_search(queryset, terms):
+    table = Medicine._meta.db_table
+    match = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    # Joined rather than queried per row, so bm25() runs once per match
+    queryset = queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = "{table}"."id"', f'{FTS_TABLE} MATCH %s'],
+        params=[match]
+    )
+    # bm25() is lower for better matches
+    rank = RawSQL(f'-bm25({FTS_TABLE}, {weights})', (), output_field=FloatField())
+    return queryset.annotate(search_rank=rank)
+
+
+def _fallback_search(queryset, terms):
+    for term in terms:
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(generic_name__icontains=term) | Q(manufacturer__icontains=term)
+        )
+    first = terms[0]
+    return queryset.annotate(search_rank=Case(
+        When(name__istartswith=first, then=Value(3)),
+        When(name__icontains=first, then=Value(2)),
+        When(generic_name__icontains=first, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField()
+    ))
+
+
+_fts_tables = {}
+
+
+def _has_fts_table(connection):
+    if connection.alias not in _fts_tables:
+        _fts_tables[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[connection.alias]
+
+
+class PrefixIndex:
+    """Sorted name keys of active medicines for prefix lookups by bisection."""
+
+    def __init__(self, rows):
+        self.medicines = {}
+        # Whole names and generic names come first, then matches on a later word
+        leading, inner = [], []
+        for pk, name, generic_name in rows:
+            self.medicines[pk] = {'id': pk, 'name': name, 'generic_name': generic_name}
+            for text in (name, generic_name):
+                words = text.lower().split()
+                for position in range(len(words)):
+                    key = ' '.join(words[position:])
+                    (inner if position else leading).append((key, pk))
+        leading.sort()
+        inner.sort()
+        self.sections = [(leading, [key for key, _ in leading]), (inner, [key for key, _ in inner])]
+
+    def lookup(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        found = {}
+        for entries, keys in self.sections:
+            for key, pk in entries[bisect_left(keys, prefix):]:
+                if len(found) >= limit or not key.startswith(prefix):
+                    break
+                found.setdefault(pk, self.medicines[pk])
+        return list(found.values())
+
+
+_index = None
+_index_generation = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def autocomplete(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """Active medicines whose name or generic name has a word starting with ``prefix``."""
+    return _current_index().lookup(prefix, limit)
+
+
+def invalidate_autocomplete():
+    """Make every process rebuild its autocomplete index on next use."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def _current_index():
+    global _index, _index_generation, _index_built_at
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+
+    def fresh():
+        return (
+            _index is not None and _index_generation == generation
+            and time.monotonic() - _index_built_at < INDEX_MAX_AGE
+        )
+
+    if fresh():
+        return _index
+    with _index_lock:
+        if not fresh():
+            rows = Medicine.objects.filter(is_active=True).values_list('pk', 'name', 'generic_name')
+            _index = PrefixIndex(rows.iterator())
+            _index_generation = generation
+            _index_built_at = time.monotonic()
+    return _index
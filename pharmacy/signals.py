@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from hospital_project.images import build_image_variants
+
+from .models import Medicine
+from .catalog import invalidate_catalog
+from .search import invalidate_autocomplete
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def refresh_medicine_indexes(sender, **kwargs):
+    """Retire the autocomplete index and facet counts once the change is visible to other connections."""
+    transaction.on_commit(invalidate_autocomplete, robust=True)
+    transaction.on_commit(invalidate_catalog, robust=True)
+
+
+post_save.connect(build_image_variants, sender=Medicine)
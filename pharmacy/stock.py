@@ -0,0 +1,162 @@
+"""
+Stock reservations for pharmacy orders.
+
+Checkout takes each medicine's quantity with a conditional
+``UPDATE ... SET stock = stock - n WHERE stock >= n``; a whole basket goes
+in a single such statement, with ``n`` picked per row by a CASE. The
+database serialises these per row, so two shoppers can never both take the
+last unit, and nothing else in the catalogue is locked. Each hold is recorded as
+a StockReservation that becomes COMMITTED when the order is paid, or is
+RELEASED (and the stock given back) when the order is cancelled or the hold
+outlives RESERVATION_TTL. ``manage.py release_expired_stock`` sweeps those.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Medicine, PharmacyOrder, StockReservation
+
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL = timedelta(minutes=15)
+
+
+class _Short(Exception):
+    pass
+
+
+class OutOfStock(Exception):
+    """Raised when a medicine cannot cover the requested quantity."""
+
+    def __init__(self, medicine):
+        self.medicine = medicine
+        super().__init__(f'Not enough stock for {medicine.name}.')
+
+
+def take(medicine_id, quantity):
+    """Decrement stock if at least ``quantity`` is left; returns whether it was."""
+    return bool(Medicine.objects.filter(
+        pk=medicine_id,
+        is_active=True,
+        stock__gte=quantity
+    ).update(stock=F('stock') - quantity))
+
+
+def take_all(lines):
+    """
+    Take every ``(medicine, quantity)`` line in one conditional UPDATE.
+
+    All or nothing: raises OutOfStock naming a short medicine, and leaves the
+    stock untouched, unless every line could be covered.
+    """
+    wanted = Case(
+        *[When(pk=medicine.pk, then=Value(quantity)) for medicine, quantity in lines],
+        output_field=IntegerField()
+    )
+    try:
+        with transaction.atomic():
+            taken = Medicine.objects.filter(
+                pk__in=[medicine.pk for medicine, _ in lines],
+                is_active=True,
+                stock__gte=wanted
+            ).update(stock=F('stock') - wanted)
+            if taken != len(lines):
+                raise _Short()
+    except _Short:
+        current = dict(Medicine.objects.filter(
+            pk__in=[medicine.pk for medicine, _ in lines],
+            is_active=True
+        ).values_list('pk', 'stock'))
+        short = next(
+            (medicine for medicine, quantity in lines if current.get(medicine.pk, 0) < quantity),
+            lines[0][0]
+        )
+        raise OutOfStock(short)
+
+
+def reserve_stock(order, lines):
+    """
+    Hold ``(medicine, quantity)`` lines for a saved order.
+
+    Must run inside the transaction that creates the order, so a shortfall
+    on any line (OutOfStock) rolls back the order with it.
+    """
+    if not lines:
+        return
+    # One statement per basket keeps lock waits short; a deadlock between two
+    # overlapping baskets surfaces as OperationalError and is retried
+    lines = sorted(lines, key=lambda line: line[0].pk)
+    take_all(lines)
+
+    expires_at = timezone.now() + RESERVATION_TTL
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, medicine=medicine, quantity=quantity, expires_at=expires_at)
+        for medicine, quantity in lines
+    ])
+
+
+def commit_stock(order):
+    """Turn the order's holds into a sale once it has been paid."""
+    with transaction.atomic():
+        StockReservation.objects.filter(
+            order=order,
+            status=StockReservation.Status.HELD
+        ).update(status=StockReservation.Status.COMMITTED, updated_at=timezone.now())
+
+        # Paid after the sweeper gave the stock back: take it again if we can
+        released = StockReservation.objects.select_related('medicine').filter(
+            order=order,
+            status=StockReservation.Status.RELEASED
+        )
+        for reservation in released:
+            if take(reservation.medicine_id, reservation.quantity):
+                reservation.status = StockReservation.Status.COMMITTED
+                reservation.save(update_fields=['status', 'updated_at'])
+            else:
+                logger.warning(
+                    "Order #%s was paid after its hold expired and %s is now short by %s.",
+                    order.pk, reservation.medicine, reservation.quantity
+                )
+
+
+def release(reservations):
+    """Give the stock of ``reservations`` back; returns how many were released."""
+    released = 0
+    for pk, medicine_id, quantity, status in reservations.values_list('pk', 'medicine_id', 'quantity', 'status'):
+        with transaction.atomic():
+            # Only the caller that flips the status it read returns the stock,
+            # so a hold committed in the meantime is left alone
+            won = StockReservation.objects.filter(pk=pk, status=status).update(
+                status=StockReservation.Status.RELEASED,
+                updated_at=timezone.now()
+            )
+            if won:
+                Medicine.objects.filter(pk=medicine_id).update(stock=F('stock') + quantity)
+                released += 1
+    return released
+
+
+def release_order_stock(order):
+    """Return everything an order holds or bought, e.g. when it is cancelled."""
+    return release(StockReservation.objects.filter(order=order).exclude(
+        status=StockReservation.Status.RELEASED
+    ))
+
+
+def release_expired(now=None):
+    """Release holds past their expiry and cancel the orders that were never paid."""
+    expired = StockReservation.objects.filter(
+        status=StockReservation.Status.HELD,
+        expires_at__lte=now or timezone.now()
+    )
+    order_ids = set(expired.values_list('order_id', flat=True))
+    released = release(expired)
+    PharmacyOrder.objects.filter(
+        pk__in=order_ids,
+        status=PharmacyOrder.Status.PENDING
+    ).update(status=PharmacyOrder.Status.CANCELLED, updated_at=timezone.now())
+    return released
@@ -1,3 +1,350 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from threading import Barrier
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Count
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from accounts.models import User
+from hospital_project.testing import QueryBudgetMixin, seed
+from patients.models import PatientProfile
+from pharmacy import search, views
+from pharmacy.catalog import FACETS, PRESCRIPTION_CHOICES, PRICE_BANDS, Catalog
+from pharmacy.checkout import place_order
+from pharmacy.importer import CatalogFormatError, import_medicines
+from pharmacy.models import Cart, CartItem, Medicine, PharmacyOrder, StockReservation
+from pharmacy.stock import OutOfStock
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        cls.patient = PatientProfile.objects.filter(cart__items__isnull=False).annotate(
+            orders=Count('pharmacy_orders', distinct=True)
+        ).order_by('-orders').select_related('user').first()
+
+    def setUp(self):
+        self.client.force_login(self.patient.user)
+
+    def test_medicine_list(self):
+        for query in ('', '?search=para', '?unit=strip&rx=no', '?page=2'):
+            with self.subTest(query=query):
+                response = self.assertWithinQueryBudget(reverse('pharmacy:medicine_list') + query)
+                self.assertEqual(response.status_code, 200)
+
+    def test_view_cart(self):
+        response = self.assertWithinQueryBudget(reverse('pharmacy:view_cart'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_checkout(self):
+        response = self.assertWithinQueryBudget(reverse('pharmacy:checkout'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_history(self):
+        self.assertTrue(self.patient.orders)
+        response = self.assertWithinQueryBudget(reverse('pharmacy:order_history'))
+        self.assertEqual(response.status_code, 200)
+
+
+class CheckoutQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='patient', role=User.Role.PATIENT)
+        cls.medicines = Medicine.objects.bulk_create(
+            Medicine(name=f'Medicine {i}', price=10 + i, stock=100) for i in range(20)
+        )
+
+    def fill_cart(self, lines):
+        cart, _ = Cart.objects.get_or_create(patient=self.user.patient_profile)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, medicine=medicine, quantity=2) for medicine in self.medicines[:lines]
+        )
+
+    def checkout(self):
+        # Placing the order refreshes DailyStats on commit, in the same request
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('pharmacy:checkout'), {'shipping_address': '1 Main St'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_queries_do_not_grow_with_the_cart(self):
+        self.client.force_login(self.user)
+        # The day's first order also creates its DailyStats row, two queries
+        # more; that is the request the budget is set by
+        self.fill_cart(1)
+        with self.assertNumQueries(views.checkout.query_budget):
+            self.checkout()
+
+        for lines in (1, 20):
+            self.fill_cart(lines)
+            with self.subTest(lines=lines), self.assertNumQueries(views.checkout.query_budget - 2):
+                self.checkout()
+            self.assertEqual(PharmacyOrder.objects.latest('pk').items.count(), lines)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Checkouts from parallel threads, each on its own connection."""
+
+    STOCK = 5
+    SHOPPERS = 12
+
+    def test_last_units_are_sold_once(self):
+        medicine = Medicine.objects.create(name='Hot medicine', price=10, stock=self.STOCK)
+        carts = []
+        for i in range(self.SHOPPERS):
+            patient = User.objects.create(username=f'patient-{i}', role=User.Role.PATIENT).patient_profile
+            cart = Cart.objects.create(patient=patient)
+            CartItem.objects.create(cart=cart, medicine=medicine, quantity=1)
+            carts.append(cart)
+        barrier = Barrier(self.SHOPPERS)
+
+        def attempt(cart):
+            try:
+                barrier.wait()
+                place_order(cart)
+                return True
+            except OutOfStock:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.SHOPPERS) as pool:
+            won = list(pool.map(attempt, carts))
+
+        medicine.refresh_from_db()
+        self.assertEqual(sum(won), self.STOCK)
+        self.assertEqual(medicine.stock, 0)
+        self.assertEqual(PharmacyOrder.objects.count(), self.STOCK)
+        self.assertEqual(StockReservation.objects.filter(medicine=medicine).count(), self.STOCK)
+        # Losing checkouts wrote nothing and kept their carts
+        self.assertEqual(CartItem.objects.count(), self.SHOPPERS - self.STOCK)
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, generic_name, manufacturer, is_active in [
+            ('Paracetamol 500', 'Acetaminophen', 'Cipla', True),
+            ('Crocin', 'Paracetamol', 'GSK', True),
+            ('Brufen', 'Ibuprofen', 'Paracare Labs', True),
+            ('Dolo 650', 'Paracetamol', 'Micro Labs', True),
+            ('Vicks Cold Relief', 'Paracetamol', 'P&G', True),
+            ('Paracetamol Old', 'Acetaminophen', 'Cipla', False),
+        ]:
+            Medicine.objects.create(
+                name=name, generic_name=generic_name, manufacturer=manufacturer,
+                price=10, is_active=is_active
+            )
+
+    def setUp(self):
+        cache.clear()
+        search._index = None
+
+    def names(self, query):
+        return [medicine.name for medicine in search.search_medicines(query)]
+
+    def test_uses_the_database_index(self):
+        if connection.vendor == 'sqlite':
+            self.assertTrue(search._has_fts_table(connection))
+        sql = str(search.search_medicines('para').query)
+        self.assertIn({'sqlite': 'MATCH', 'postgresql': 'to_tsquery'}.get(connection.vendor, 'LIKE'), sql)
+
+    def test_ranks_name_over_generic_name_over_manufacturer(self):
+        found = self.names('parac')
+        self.assertEqual(found[0], 'Paracetamol 500')
+        self.assertEqual(found[-1], 'Brufen')
+        self.assertCountEqual(found[1:-1], ['Crocin', 'Dolo 650', 'Vicks Cold Relief'])
+
+    def test_every_word_must_match_as_a_prefix(self):
+        self.assertEqual(self.names('dol 65'), ['Dolo 650'])
+        self.assertEqual(self.names('paracetamol cipla'), ['Paracetamol 500'])
+        self.assertEqual(self.names('zzz'), [])
+        self.assertEqual(self.names('  '), [])
+
+    def test_autocomplete_matches_word_prefixes(self):
+        # Names and generic names, not manufacturers; inactive ones are left out
+        self.assertCountEqual(
+            [m['name'] for m in search.autocomplete('Para')],
+            ['Paracetamol 500', 'Crocin', 'Dolo 650', 'Vicks Cold Relief']
+        )
+        self.assertEqual([m['name'] for m in search.autocomplete('cold')], ['Vicks Cold Relief'])
+        self.assertEqual(len(search.autocomplete('p', limit=2)), 2)
+
+    def test_saving_a_medicine_rebuilds_the_index(self):
+        self.assertEqual(search.autocomplete('calpol'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicine.objects.create(name='Calpol', generic_name='Paracetamol', price=10)
+        self.assertEqual([m['name'] for m in search.autocomplete('calpol')], ['Calpol'])
+        self.assertEqual(self.names('calpol'), ['Calpol'])
+
+    def test_index_is_rebuilt_once_it_is_too_old(self):
+        search.autocomplete('calpol')
+        # Saved by another process, whose cache bump this one never sees
+        Medicine.objects.filter(name='Crocin').update(name='Calpol')
+        self.assertEqual(search.autocomplete('calpol'), [])
+        later = search._index_built_at + search.INDEX_MAX_AGE
+        with mock.patch('pharmacy.search.time.monotonic', return_value=later):
+            self.assertEqual([m['name'] for m in search.autocomplete('calpol')], ['Calpol'])
+
+
+class CatalogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        manufacturers = ['Cipla', 'GSK', 'Sun Pharma', '']
+        units = ['strip', 'bottle', 'tube']
+        prices = [40, 99, 100, 250, 499, 500, 999, 1000, 1500]
+        Medicine.objects.bulk_create(
+            Medicine(
+                name=f'{"Paracetamol" if i % 3 else "Cetirizine"} {i}',
+                manufacturer=manufacturers[i % 4],
+                unit=units[i % 3],
+                prescription_required=i % 5 == 0,
+                price=prices[i % 9],
+                # Some are off sale and never counted
+                stock=0 if i % 11 == 0 else 10,
+                is_active=i % 13 != 0,
+            )
+            for i in range(60)
+        )
+
+    def setUp(self):
+        cache.clear()
+        search._index = None
+
+    def assertFacetsMatchCounts(self, query):
+        params = QueryDict(query)
+        catalog = Catalog(params)
+        facets = catalog.facets()
+        self.assertEqual(facets['total'], catalog.results().count())
+        values = {
+            'manufacturer': set(Medicine.objects.exclude(manufacturer='').values_list('manufacturer', flat=True)),
+            'unit': set(Medicine.objects.values_list('unit', flat=True)),
+            'rx': {key for key, *_ in PRESCRIPTION_CHOICES},
+            'price': {key for key, *_ in PRICE_BANDS},
+        }
+        for facet in FACETS:
+            # An option counts what picking only it, under the other facets, would list
+            expected = {}
+            for value in values[facet]:
+                narrowed = params.copy()
+                narrowed.setlist(facet, [value])
+                count = Catalog(narrowed).results().count()
+                if count or value in catalog.selected[facet]:
+                    expected[value] = count
+            with self.subTest(query=query, facet=facet):
+                self.assertEqual({option['value']: option['count'] for option in facets[facet]}, expected)
+
+    def test_facet_counts_match_filtered_counts(self):
+        for query in (
+            '',
+            'manufacturer=Cipla',
+            'manufacturer=Cipla&manufacturer=GSK&unit=bottle',
+            'rx=yes&price=100-500&price=over-1000',
+            'search=paracetamol&unit=strip&price=under-100',
+        ):
+            self.assertFacetsMatchCounts(query)
+
+    def test_counts_are_cached_until_a_medicine_changes(self):
+        catalog = Catalog(QueryDict('manufacturer=GSK'))
+        before = catalog.facets()
+        with self.assertNumQueries(0):
+            self.assertEqual(Catalog(QueryDict('manufacturer=GSK')).facets(), before)
+
+        medicine = Medicine.objects.filter(manufacturer='Cipla', is_active=True, stock__gt=0).first()
+        medicine.manufacturer = 'GSK'
+        with self.captureOnCommitCallbacks(execute=True):
+            medicine.save()
+        after = Catalog(QueryDict('manufacturer=GSK')).facets()
+        self.assertEqual(after['total'], before['total'] + 1)
+        self.assertFacetsMatchCounts('manufacturer=GSK')
+
+
+class ImporterTests(TestCase):
+
+    CATALOG = (
+        'SKU,Name,Manufacturer,Description,Price,Stock,Prescription_Required\n'
+        'PCM-500,Paracetamol 500,Cipla,Fever and pain,25.50,100,no\n'
+        'CTZ-10,Cetirizine 10,Sun Pharma,Allergy,18,40,no\n'
+        'AMX-250,Amoxicillin 250,GSK,Antibiotic,95,20,yes\n'
+    )
+
+    def import_csv(self, text, **kwargs):
+        return import_medicines(StringIO(text), 'csv', **kwargs)
+
+    def test_reimport_updates_rows_in_place(self):
+        result = self.import_csv(self.CATALOG, chunk_size=2)
+        self.assertEqual((result.created, result.updated, result.error_count), (3, 0, 0))
+        ids = dict(Medicine.objects.values_list('sku', 'pk'))
+
+        # No description column this time: existing descriptions are kept
+        result = self.import_csv(
+            'sku,name,price,stock\n'
+            'PCM-500,Paracetamol 500,27.00,90\n'
+            'CTZ-10,Cetirizine 10,18,40\n'
+            'AMX-250,Amoxicillin 250,95,0\n'
+            'ORS-1,ORS Sachet,12,300\n',
+            chunk_size=2
+        )
+        self.assertEqual((result.created, result.updated, result.error_count), (1, 3, 0))
+        self.assertEqual(Medicine.objects.count(), 4)
+        paracetamol = Medicine.objects.get(sku='PCM-500')
+        self.assertEqual(paracetamol.pk, ids['PCM-500'])
+        self.assertEqual((paracetamol.price, paracetamol.stock), (Decimal('27.00'), 90))
+        self.assertEqual(paracetamol.description, 'Fever and pain')
+        self.assertTrue(Medicine.objects.get(sku='AMX-250').prescription_required)
+        # New rows take the model defaults for the missing columns
+        self.assertEqual(Medicine.objects.get(sku='ORS-1').unit, 'strip')
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        result = self.import_csv(
+            'sku,name,price,stock,prescription_required\n'
+            'PCM-500,Paracetamol 500,25.50,100,no\n'
+            ',No SKU,10,5,no\n'
+            'BAD-1,,10,5,no\n'
+            'BAD-2,Bad price,cheap,5,no\n'
+            'BAD-3,Bad flag,10,5,maybe\n'
+            'CTZ-10,Cetirizine 10,18,40,no\n'
+            'CTZ-10,Cetirizine 10 mg,19,40,no\n'
+        )
+        self.assertEqual([line for line, message in result.errors], [3, 4, 5, 6])
+        self.assertIn('sku', result.errors[0][1])
+        self.assertIn('name', result.errors[1][1])
+        self.assertIn('price', result.errors[2][1])
+        self.assertIn('maybe', result.errors[3][1])
+        self.assertEqual((result.rows, result.created, result.duplicates), (7, 2, 1))
+        self.assertCountEqual(Medicine.objects.values_list('sku', flat=True), ['PCM-500', 'CTZ-10'])
+        # The later of two rows for one SKU wins
+        self.assertEqual(Medicine.objects.get(sku='CTZ-10').name, 'Cetirizine 10 mg')
+
+    def test_dry_run_writes_nothing(self):
+        result = self.import_csv(self.CATALOG, dry_run=True)
+        self.assertEqual(result.created, 3)
+        self.assertFalse(Medicine.objects.exists())
+
+    def test_jsonl_lines_are_checked_one_by_one(self):
+        result = import_medicines(StringIO(
+            '{"sku": "PCM-500", "name": "Paracetamol 500", "price": 25.5, "stock": 100}\n'
+            '{"sku": "CTZ-10", "name": \n'
+            '[1, 2]\n'
+            '\n'
+            '{"sku": "CTZ-10", "name": "Cetirizine 10", "price": 18, "stock": 40, "is_active": false}\n'
+        ), 'jsonl')
+        self.assertEqual([line for line, message in result.errors], [2, 3])
+        self.assertEqual(result.created, 2)
+        # The first row's keys decide the columns, and is_active is not one
+        self.assertTrue(Medicine.objects.get(sku='CTZ-10').is_active)
+
+    def test_catalog_needs_a_sku_column(self):
+        with self.assertRaises(CatalogFormatError):
+            self.import_csv('name,price\nParacetamol,10\n')
@@ -5,6 +5,7 @@ app_name = 'pharmacy'
 
 urlpatterns = [
     path('medicines/', views.medicine_list, name='medicine_list'),
+    path('medicines/autocomplete/', views.medicine_autocomplete, name='medicine_autocomplete'),
     path('medicines/<int:pk>/', views.medicine_detail, name='medicine_detail'),
     path('medicines/<int:pk>/add-to-cart/', views.add_to_cart, name='add_to_cart'),
     path('cart/', views.view_cart, name='view_cart'),
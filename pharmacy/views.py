@@ -1,26 +1,47 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.contrib.messages import get_messages
 from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
 
 from accounts.decorators import patient_required
-from .models import Medicine, Cart, CartItem, PharmacyOrder, OrderItem
+from hospital_project.instrumentation import query_budget
+from hospital_project.pagination import paginate
+from .models import Medicine, Cart, CartItem, PharmacyOrder
 from .forms import AddToCartForm, CheckoutForm
+from .catalog import CATALOG_MAX_AGE, Catalog
+from .checkout import EmptyCart, place_order
+from .search import autocomplete, search_medicines
+from .stock import OutOfStock
 
 
+@query_budget(5)
 def medicine_list(request):
-    """List all available medicines."""
-    medicines = Medicine.objects.filter(is_active=True, stock__gt=0)
-    
-    search = request.GET.get('search', '')
-    if search:
-        medicines = medicines.filter(name__icontains=search)
+    """Faceted, paginated catalog of medicines on sale."""
+    catalog = Catalog(request.GET)
+    page = paginate(request, catalog.results(), catalog.ordering)
     
     context = {
-        'medicines': medicines,
-        'search': search,
+        'medicines': page.object_list,
+        'page': page,
+        'search': catalog.search,
+        'catalog': catalog,
+        'facets': catalog.facets(),
     }
-    return render(request, 'pharmacy/medicine_list.html', context)
+    response = render(request, 'pharmacy/medicine_list.html', context)
+    # The URL carries all catalog state, so anonymous pages are shareable;
+    # signed-in pages show cart buttons and flash messages
+    if request.user.is_authenticated or get_messages(request).used:
+        patch_cache_control(response, private=True)
+    else:
+        patch_cache_control(response, public=True, max_age=CATALOG_MAX_AGE)
+    return response
+
+
+def medicine_autocomplete(request):
+    """AJAX endpoint suggesting medicines whose name starts with ``q``."""
+    return JsonResponse({'medicines': autocomplete(request.GET.get('q', ''))})
 
 
 def medicine_detail(request, pk):
@@ -70,11 +91,12 @@ def add_to_cart(request, pk):
     return redirect('pharmacy:medicine_detail', pk=pk)
 
 
+@query_budget(6)
 @patient_required
 def view_cart(request):
     """View shopping cart."""
     patient = request.user.patient_profile
-    cart, _ = Cart.objects.get_or_create(patient=patient)
+    cart, _ = Cart.objects.with_totals().get_or_create(patient=patient)
     
     context = {
         'cart': cart,
@@ -112,11 +134,14 @@ def remove_from_cart(request, pk):
     return redirect('pharmacy:view_cart')
 
 
+# Placing an order runs the same queries for any cart, and also refreshes
+# the day's DailyStats on commit; see CheckoutQueryTests
+@query_budget(22)
 @patient_required
 def checkout(request):
     """Checkout and create order."""
     patient = request.user.patient_profile
-    cart = get_object_or_404(Cart, patient=patient)
+    cart = get_object_or_404(Cart.objects.with_totals(), patient=patient)
     
     if cart.item_count == 0:
         messages.error(request, 'Your cart is empty.')
@@ -125,28 +150,18 @@ def checkout(request):
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            # Create order
-            order = PharmacyOrder.objects.create(
-                patient=patient,
-                shipping_address=form.cleaned_data['shipping_address'],
-                notes=form.cleaned_data['notes']
-            )
-            
-            # Move cart items to order
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    medicine=cart_item.medicine,
-                    quantity=cart_item.quantity,
-                    price=cart_item.medicine.price
+            try:
+                order = place_order(
+                    cart,
+                    shipping_address=form.cleaned_data['shipping_address'],
+                    notes=form.cleaned_data['notes']
                 )
-            
-            # Calculate total
-            order.calculate_total()
-            order.save()
-            
-            # Clear cart
-            cart.items.all().delete()
+            except EmptyCart:
+                messages.error(request, 'Your cart is empty.')
+                return redirect('pharmacy:view_cart')
+            except OutOfStock as e:
+                messages.error(request, f'{e} Please update your cart.')
+                return redirect('pharmacy:view_cart')
             
             messages.success(request, 'Order placed successfully!')
             return redirect('billing:payment', order_type='pharmacy', order_id=order.pk)
@@ -160,14 +175,17 @@ def checkout(request):
     return render(request, 'pharmacy/checkout.html', context)
 
 
+@query_budget(6)
 @patient_required
 def order_history(request):
     """View order history."""
     patient = request.user.patient_profile
-    orders = PharmacyOrder.objects.filter(patient=patient).order_by('-created_at')
+    orders = PharmacyOrder.objects.filter(patient=patient).prefetch_related('items')
+    page = paginate(request, orders, ('-created_at', '-id'))
     
     context = {
-        'orders': orders,
+        'orders': page.object_list,
+        'page': page,
     }
     return render(request, 'pharmacy/order_history.html', context)
 
@@ -0,0 +1,15 @@
+from django.contrib import admin
+from .models import Task
+from .queue import retry
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    date_hierarchy = 'created_at'
+    actions = ['retry_tasks']
+
+    @admin.action(description='Retry selected tasks')
+    def retry_tasks(self, request, queryset):
+        self.message_user(request, f'{retry(queryset)} tasks queued again.')
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TaskqueueConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'taskqueue'
+    verbose_name = 'Task queue'
+
+    def ready(self):
+        # Registers every app's @task functions, so a worker can run them by name
+        autodiscover_modules('tasks')
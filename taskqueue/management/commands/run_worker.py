@@ -0,0 +1,82 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from taskqueue.queue import claim, purge_finished, run
+
+
+# How often the worker deletes old successful tasks
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks in a pool of threads until stopped "
+        "(SIGTERM or Ctrl+C let running tasks finish first)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Tasks run at once (default 4)')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when no task is due (default 1)')
+        parser.add_argument('--once', action='store_true', help='Run the tasks that are due, then exit')
+
+    def handle(self, *args, **options):
+        threads = max(options['threads'], 1)
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+
+        self.stdout.write(f"Worker {worker} running up to {threads} tasks at once.")
+        self.succeeded = self.failed = 0
+        self.counts_lock = threading.Lock()
+        in_flight = set()
+        next_purge = 0
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='task') as pool:
+            try:
+                while not self.stopping.is_set():
+                    if time.monotonic() >= next_purge:
+                        purge_finished(timezone.now() - timedelta(days=settings.TASK_RETENTION_DAYS))
+                        next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+
+                    claimed = claim(worker, threads - len(in_flight)) if len(in_flight) < threads else []
+                    in_flight.update(pool.submit(self.run_one, task) for task in claimed)
+                    if options['once'] and not claimed and not in_flight:
+                        break
+                    if in_flight:
+                        done, in_flight = wait(in_flight, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                        in_flight = set(in_flight)
+                    elif not claimed:
+                        self.stopping.wait(options['poll'])
+            except KeyboardInterrupt:
+                self.stopping.set()
+            if in_flight:
+                self.stdout.write(f"Waiting for {len(in_flight)} running tasks...")
+            wait(in_flight)
+        connection.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker {worker} stopped: {self.succeeded} tasks done, {self.failed} attempts failed."
+        ))
+
+    def run_one(self, task):
+        # Each pool thread keeps its own connection; drop it if the server closed it
+        close_old_connections()
+        try:
+            succeeded = run(task)
+            with self.counts_lock:
+                if succeeded:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+        finally:
+            close_old_connections()
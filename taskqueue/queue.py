@@ -0,0 +1,166 @@
+"""
+Database-backed background tasks.
+
+A function decorated with ``@task`` in an app's ``tasks.py`` can be handed off
+from a view in one call::
+
+    capture_payment.enqueue(order_id, payment_id)
+    send_email.schedule(timedelta(hours=1), subject, message, [address])
+
+That writes a Task row (in the caller's transaction, so a rolled-back view
+never leaves work behind) and returns at once; ``enqueue_once`` skips the
+row when an identical call is already waiting. ``manage.py run_worker`` claims
+due rows and runs them in a thread pool. Claims take ``SELECT ... FOR UPDATE
+SKIP LOCKED`` where the database has it (Postgres), so workers never wait on
+each other's rows; on SQLite the settings' IMMEDIATE transactions serialize
+claims instead. A failed task is retried with exponential backoff until
+``max_attempts``, and a task whose worker died is claimed again once its lease
+runs out. Arguments must be JSON-serializable: pass ids, not model instances.
+"""
+import functools
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+
+MAX_ATTEMPTS = 5
+# Retry n waits RETRY_BACKOFF_SECONDS * 2**(n-1), give or take half, up to the cap
+RETRY_BACKOFF_SECONDS = 10
+MAX_BACKOFF_SECONDS = 60 * 60
+
+
+class UnknownTask(Exception):
+    """Raised when a queued task names a function that is not registered."""
+
+
+class TaskFunction:
+    """A registered task: call it to run inline, ``enqueue`` it to run in a worker."""
+
+    def __init__(self, func, max_attempts):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """Queue a call to run as soon as a worker is free."""
+        return self.schedule(None, *args, **kwargs)
+
+    def enqueue_once(self, *args, **kwargs):
+        """
+        Like ``enqueue``, unless the same call is already queued and not yet
+        tried; returns that Task instead. For calls that do all outstanding
+        work whenever they run, such as draining an inbox.
+        """
+        waiting = Task.objects.filter(
+            name=self.name, status=Task.Status.QUEUED, attempts=0, args=list(args), kwargs=kwargs
+        ).order_by('run_at', 'id').first()
+        return waiting or self.enqueue(*args, **kwargs)
+
+    def schedule(self, when, *args, **kwargs):
+        """Queue a call to run at a datetime, or after a timedelta."""
+        if isinstance(when, timedelta):
+            when = timezone.now() + when
+        return Task.objects.create(
+            name=self.name,
+            args=list(args),
+            kwargs=kwargs,
+            run_at=when or timezone.now(),
+            max_attempts=self.max_attempts
+        )
+
+
+def task(func=None, *, max_attempts=MAX_ATTEMPTS):
+    """Register ``func`` as a task; use bare or as ``@task(max_attempts=...)``."""
+    def register(func):
+        registered = TaskFunction(func, max_attempts)
+        REGISTRY[registered.name] = registered
+        return registered
+    return register(func) if func else register
+
+
+def claim(worker, limit):
+    """Mark up to ``limit`` due tasks as running for ``worker`` and return them."""
+    now = timezone.now()
+    lease = timedelta(seconds=settings.TASK_LEASE_SECONDS)
+    due = Q(status=Task.Status.QUEUED, run_at__lte=now) | Q(status=Task.Status.RUNNING, locked_at__lt=now - lease)
+    with transaction.atomic():
+        candidates = Task.objects.filter(due).order_by('run_at', 'id').only('id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = [candidate.pk for candidate in candidates[:limit]]
+        if not ids:
+            return []
+        Task.objects.filter(id__in=ids).update(
+            status=Task.Status.RUNNING,
+            locked_by=worker,
+            locked_at=now,
+            attempts=F('attempts') + 1
+        )
+    return list(Task.objects.filter(id__in=ids, locked_by=worker, locked_at=now).order_by('run_at', 'id'))
+
+
+def run(claimed):
+    """Run one claimed task and record the outcome."""
+    try:
+        func = REGISTRY.get(claimed.name)
+        if func is None:
+            raise UnknownTask(f"No task named '{claimed.name}' is registered.")
+        if claimed.attempts > claimed.max_attempts:
+            # Claimed again after its worker died on the last attempt
+            raise RuntimeError('The worker running the last attempt stopped before it finished.')
+        func(*claimed.args, **claimed.kwargs)
+    except Exception as e:
+        again = claimed.attempts < claimed.max_attempts and not isinstance(e, UnknownTask)
+        logger.warning("Task %s failed (attempt %s of %s)", claimed, claimed.attempts, claimed.max_attempts, exc_info=True)
+        _finish(claimed, failed=True, again=again, error=traceback.format_exc())
+        return False
+    _finish(claimed)
+    return True
+
+
+def _finish(claimed, failed=False, again=False, error=''):
+    now = timezone.now()
+    if again:
+        delay = min(RETRY_BACKOFF_SECONDS * 2 ** (claimed.attempts - 1), MAX_BACKOFF_SECONDS)
+        changes = {
+            'status': Task.Status.QUEUED,
+            'run_at': now + timedelta(seconds=delay * random.uniform(0.5, 1.5)),
+        }
+    else:
+        changes = {'status': Task.Status.FAILED if failed else Task.Status.DONE, 'finished_at': now}
+    if failed:
+        changes['last_error'] = error
+    # Matching the lock leaves the task alone if another worker has reclaimed it
+    Task.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by, locked_at=claimed.locked_at).update(
+        locked_by='', locked_at=None, **changes
+    )
+
+
+def retry(queryset):
+    """Queue failed or stuck tasks again with a fresh set of attempts."""
+    return queryset.exclude(status=Task.Status.DONE).update(
+        status=Task.Status.QUEUED, run_at=timezone.now(), attempts=0,
+        locked_by='', locked_at=None, finished_at=None
+    )
+
+
+def purge_finished(older_than):
+    """Delete tasks that finished successfully before ``older_than``."""
+    deleted, _ = Task.objects.filter(status=Task.Status.DONE, finished_at__lt=older_than).delete()
+    return deleted
@@ -0,0 +1,9 @@
+from django.core.mail import send_mail
+
+from .queue import task
+
+
+@task
+def send_email(subject, message, recipient_list, from_email=None, html_message=None):
+    """Send one email through EMAIL_BACKEND, off the request."""
+    send_mail(subject, message, from_email, recipient_list, html_message=html_message)
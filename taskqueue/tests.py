@@ -0,0 +1,146 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from taskqueue.models import Task
+from taskqueue.queue import MAX_BACKOFF_SECONDS, RETRY_BACKOFF_SECONDS, claim, retry, run, task
+
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task(max_attempts=3)
+def fail():
+    raise ValueError('boom')
+
+
+@override_settings(TASK_LEASE_SECONDS=600)
+class ClaimTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claims_due_tasks_oldest_first(self):
+        now = timezone.now()
+        later = record.schedule(timedelta(hours=1), 'later')
+        second = record.schedule(now - timedelta(minutes=1), 'second')
+        first = record.schedule(now - timedelta(minutes=2), 'first')
+        third = record.enqueue('third')
+
+        claimed = claim('worker-1', 2)
+        self.assertEqual([t.pk for t in claimed], [first.pk, second.pk])
+        for claimed_task in claimed:
+            self.assertEqual(claimed_task.status, Task.Status.RUNNING)
+            self.assertEqual(claimed_task.locked_by, 'worker-1')
+            self.assertEqual(claimed_task.attempts, 1)
+
+        # Running tasks are not claimed again while their lease lasts
+        self.assertEqual([t.pk for t in claim('worker-2', 10)], [third.pk])
+        self.assertEqual(claim('worker-3', 10), [])
+        later.refresh_from_db()
+        self.assertEqual(later.status, Task.Status.QUEUED)
+
+    def test_run_records_success(self):
+        record.enqueue('value')
+        claimed, = claim('worker', 1)
+        self.assertTrue(run(claimed))
+        self.assertEqual(calls, ['value'])
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, Task.Status.DONE)
+        self.assertEqual(claimed.locked_by, '')
+        self.assertIsNotNone(claimed.finished_at)
+
+    def test_expired_lease_is_claimed_again(self):
+        record.enqueue('value')
+        stale, = claim('dead-worker', 1)
+        Task.objects.filter(pk=stale.pk).update(locked_at=timezone.now() - timedelta(seconds=601))
+
+        reclaimed, = claim('worker', 1)
+        self.assertEqual(reclaimed.pk, stale.pk)
+        self.assertEqual(reclaimed.locked_by, 'worker')
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # The first worker finishing late leaves the new claim alone
+        run(stale)
+        reclaimed.refresh_from_db()
+        self.assertEqual(reclaimed.status, Task.Status.RUNNING)
+        self.assertEqual(reclaimed.locked_by, 'worker')
+
+    def test_expired_lease_after_last_attempt_fails(self):
+        fail.enqueue()
+        Task.objects.update(attempts=fail.max_attempts, status=Task.Status.RUNNING,
+                            locked_at=timezone.now() - timedelta(seconds=601))
+        claimed, = claim('worker', 1)
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            self.assertFalse(run(claimed))
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, Task.Status.FAILED)
+        self.assertIn('stopped before it finished', claimed.last_error)
+
+
+class RetryTests(TestCase):
+
+    @mock.patch('taskqueue.queue.random.uniform', return_value=1)
+    def test_failures_back_off_until_attempts_run_out(self, uniform):
+        queued = fail.enqueue()
+        for attempt in range(1, fail.max_attempts + 1):
+            Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+            claimed, = claim('worker', 1)
+            self.assertEqual(claimed.attempts, attempt)
+            started = timezone.now()
+            with self.assertLogs('taskqueue.queue', 'WARNING'):
+                self.assertFalse(run(claimed))
+
+            claimed.refresh_from_db()
+            self.assertIn('ValueError: boom', claimed.last_error)
+            self.assertEqual(claimed.locked_by, '')
+            if attempt < fail.max_attempts:
+                self.assertEqual(claimed.status, Task.Status.QUEUED)
+                delay = (claimed.run_at - started).total_seconds()
+                self.assertAlmostEqual(delay, RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1), delta=1)
+            else:
+                self.assertEqual(claimed.status, Task.Status.FAILED)
+                self.assertIsNotNone(claimed.finished_at)
+
+    @mock.patch('taskqueue.queue.random.uniform', return_value=1)
+    def test_backoff_is_capped(self, uniform):
+        queued = fail.enqueue()
+        Task.objects.filter(pk=queued.pk).update(attempts=20, max_attempts=30)
+        claimed, = claim('worker', 1)
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            run(claimed)
+        claimed.refresh_from_db()
+        self.assertAlmostEqual(
+            (claimed.run_at - timezone.now()).total_seconds(), MAX_BACKOFF_SECONDS, delta=1
+        )
+
+    def test_unknown_task_fails_at_once(self):
+        Task.objects.create(name='taskqueue.tests.missing')
+        claimed, = claim('worker', 1)
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            self.assertFalse(run(claimed))
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, Task.Status.FAILED)
+        self.assertEqual(claimed.attempts, 1)
+
+    def test_retry_starts_over(self):
+        queued = fail.enqueue()
+        Task.objects.filter(pk=queued.pk).update(status=Task.Status.FAILED, attempts=3)
+        self.assertEqual(retry(Task.objects.all()), 1)
+        claimed, = claim('worker', 1)
+        self.assertEqual(claimed.attempts, 1)
+
+    def test_enqueue_once_reuses_a_waiting_call(self):
+        first = record.enqueue_once('value')
+        self.assertEqual(record.enqueue_once('value'), first)
+        self.assertNotEqual(record.enqueue_once('other'), first)
+        claim('worker', 10)
+        self.assertNotEqual(record.enqueue_once('value'), first)
+        self.assertEqual(Task.objects.count(), 3)